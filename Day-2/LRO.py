@@ -8,7 +8,7 @@ from google.genai import types
 from google.adk.agents import LlmAgent
 from google.adk.models.google_llm import Gemini
 from google.adk.runners import Runner, InMemoryRunner
-from google.adk.sessions import InMemorySessionService
+from google.adk.sessions import DatabaseSessionService, InMemorySessionService
 
 from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
 from google.adk.tools.tool_context import ToolContext
@@ -18,6 +18,11 @@ from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams,
 from google.adk.apps.app import App, ResumabilityConfig
 from google.adk.tools.function_tool import FunctionTool
 
+from approvalQueue import ApprovalQueue
+from confirmationStream import ConfirmationWatcher
+from resumeCheckpoints import CheckpointRunner, ResumeCheckpointStore
+from idempotentTools import IdempotencyPlugin
+
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -151,10 +156,13 @@ shipping_agent = LlmAgent(
 
 # When you resume, the App loads this saved state so the agent continues exactly where it left off - as if no time passed.
 
+# place_shipping_order books a real shipment once approved. If a resume is retried after the tool ran
+# (e.g. the model call that follows it fails), the stored result is returned instead of booking twice.
 shipping_app = App(
     name="ShippingApp",
     root_agent=shipping_agent,
-    resumability_config=ResumabilityConfig(is_resumable=True)
+    resumability_config=ResumabilityConfig(is_resumable=True),
+    plugins=[IdempotencyPlugin(["place_shipping_order"], db_path="shipping_tool_results.db")],
 )
 
 print("✅ Resumable app created!")
@@ -180,13 +188,26 @@ print("✅ Helper functions defined")
 
 
 # Create runner with the resumable app
-sessionService = InMemorySessionService()
+# Sessions are stored in SQLite so a paused order can still be resumed after a restart
+sessionService = DatabaseSessionService(db_url="sqlite:///shipping_sessions.db")
 
-shipping_runner = Runner(
+# Each pause writes a resume checkpoint, so resuming an order loads the checkpoint plus the last
+# 20 events instead of rebuilding the invocation from the whole session history
+shipping_runner = CheckpointRunner(
     app=shipping_app,
-    session_service=sessionService
+    session_service=sessionService,
+    checkpoints=ResumeCheckpointStore("shipping_checkpoints.db"),
+    context_events=20,
 )
 
+# Paused orders are persisted in a durable approval queue: they can be listed, expire after a day
+# (auto-rejected), and are resumed by a pool of workers once a decision arrives
+approval_queue = ApprovalQueue(shipping_runner, db_path="shipping_approvals.db", workers=8, default_ttl=24 * 3600)
+
+# Streams run_async and stops at the first adk_request_confirmation: the pause is reported (and persisted
+# by run_shipping_workflow's hook) as soon as it is emitted, not after the whole invocation has finished
+confirmation_watcher = ConfirmationWatcher(shipping_runner)
+
 async def run_shipping_workflow(query: str, auto_approve: bool = True):
     """Runs a shipping workflow with approval handling.
 
@@ -210,19 +231,20 @@ async def run_shipping_workflow(query: str, auto_approve: bool = True):
     )
 
     query_content = types.Content(role="user", parts=[types.Part(text=query)])
-    events = []
+    approval_info = None
 
-    # -----------------------------------------------------------------------------------------------
-    # STEP 1: Send initial request to the Agent. If num_containers > 5, the Agent returns the special `adk_request_confirmation` event
-    async for event in shipping_runner.run_async(
-        user_id="test_user", session_id=session_id, new_message=query_content
-    ):
-        events.append(event)
-    
+    async def persist_pause(event, requests):
+        await approval_queue.add_from_event(event, app_name="ShippingApp", user_id="test_user", session_id=session_id)
 
     # -----------------------------------------------------------------------------------------------
-    # STEP 2: Loop through all the events generated and check if `adk_request_confirmation` is present.
-    approval_info = check_for_approval(events)
+    # STEP 1: Send initial request to the Agent. If num_containers > 5, the Agent emits the special `adk_request_confirmation` event.
+    # STEP 2: Check each event as it streams in - the watcher stops at the confirmation request and persists the pause right away
+    async for event in confirmation_watcher.run(
+        user_id="test_user", session_id=session_id, new_message=query_content, on_confirmation=persist_pause
+    ):
+        approval_info = check_for_approval([event])
+        if not approval_info:
+            print_agent_response([event])
 
     # -----------------------------------------------------------------------------------------------
     # STEP 3: If the event is present, it's a large order - HANDLE APPROVAL WORKFLOW
@@ -230,31 +252,61 @@ async def run_shipping_workflow(query: str, auto_approve: bool = True):
         print(f"⏸️ Pausing for approval...")
         print(f"🤔 Human Decision: {'APPROVE ✅' if auto_approve else 'REJECT ❌'}\n")
 
-        # PATH A: Resume the agent by calling run_async() again with the approval decision
-        async for event in shipping_runner.run_async(
-            user_id = "test_user",
-            session_id = session_id,
-            new_message = create_approval_response(approval_info, auto_approve),  # Send human decision here
-            invocation_id = approval_info["invocation_id"],  # Critical: same invocation_id tells ADK to RESUME
-        ):
-            if event.content and event.content.parts:
-                for part in event.content.parts:
-                    if part.text:
-                        print(f"Agent > {part.text}")
+        # PATH A: Record the human decision - a queue worker resumes the agent with
+        # run_async(invocation_id=...) and stores its final answer
+        await approval_queue.decide(approval_info["approval_id"], approved=auto_approve)
+        result = await approval_queue.wait(approval_info["approval_id"])
+        if result["result"] and result["result"].get("text"):
+            print(f"Agent > {result['result']['text']}")
 
     else:
         # PATH B: If the `adk_request_confirmation` is not present - no approval needed - order completed immediately.
-        print_agent_response(events)
         print(f"{'='*60}\n")
 
 
 print("✅ Workflow function ready")
 
 
+async def run_bulk_approval(queries: list, auto_approve: bool = True):
+    """Pauses several large orders, then approves (or rejects) them all with one batch decision.
+
+    Args:
+        queries: Shipping requests, one session each
+        auto_approve: Decision applied to every paused order (simulates an operator's bulk action)
+    """
+    decisions = []
+
+    for query in queries:
+        session = await sessionService.create_session(app_name="ShippingApp", user_id="test_user")
+        query_content = types.Content(role="user", parts=[types.Part(text=query)])
+        async for event in confirmation_watcher.run(user_id="test_user", session_id=session.id, new_message=query_content):
+            approval_ids = await approval_queue.add_from_event(
+                event, app_name="ShippingApp", user_id="test_user", session_id=session.id
+            )
+            decisions += [(approval_id, event.invocation_id, auto_approve) for approval_id in approval_ids]
+
+    print(f"\n⏸️ {len(decisions)} orders waiting - bulk decision: {'APPROVE ✅' if auto_approve else 'REJECT ❌'}")
+
+    # One validation pass against the stored pauses, then the invocations resume concurrently (at most 8 at once)
+    batch = await approval_queue.decide_batch(decisions, concurrency=8)
+    for item in batch["items"]:
+        text = (item["result"] or {}).get("text")
+        print(f"   {item['approval_id']}: {item['outcome']}" + (f" - Agent > {text}" if text else ""))
+    print(f"📊 Batch: {batch['stats']}")
+
+
 # Run the workflow
 async def main():
+    recovered = await approval_queue.start()  # picks up approvals left pending by an earlier run
+    print(f"📊 Approval queue started: {recovered}")
+
     await run_shipping_workflow("Ship 3 containers to Singapore") #Small Order
     await run_shipping_workflow("Ship 10 containers to Rotterdam", auto_approve=True) #Approved
     await run_shipping_workflow("Ship 8 containers to Los Angeles", auto_approve=False) #Rejected
+    await run_bulk_approval(["Ship 12 containers to Hamburg", "Ship 7 containers to Busan"]) #Approved in one batch
+
+    await confirmation_watcher.close()
+    print(f"📊 Approval queue: {approval_queue.metrics()}")
+    await approval_queue.stop()
 
 asyncio.run(main())
\ No newline at end of file
@@ -18,6 +18,10 @@ from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams,
 from google.adk.apps.app import App, ResumabilityConfig
 from google.adk.tools.function_tool import FunctionTool
 
+from mcpPool import McpServerPool
+from mcpMultiplex import MultiplexedMcpClient
+from mcpToolCache import CachedMcpToolset, ToolDiscoveryCache
+
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -32,16 +36,34 @@ retry_config = types.HttpRetryOptions(
     http_status_codes=[429, 500, 503, 504],  # Retry on these HTTP errors
 )
 
+# One pool of warm MCP server processes shared by every toolset, agent and runner in this process:
+# `npx` starts once per server (2 processes each), not once per toolset; crashed processes are
+# restarted and servers unused for 10 minutes are shut down
+mcp_pool = McpServerPool(size=2, idle_timeout=600)
+
+# list_tools results are cached on disk: tools are registered from the cache at startup, and a
+# background refresh swaps in new declarations when a server's schemas change
+mcp_tool_cache = ToolDiscoveryCache("mcp_tool_cache.db")
+
 # MCP integration with Everything Server
-mcp_image_server = McpToolset(
-    connection_params=StdioConnectionParams(
+# server-everything handles requests concurrently, so parallel tool calls are pipelined over its
+# pooled sessions with no per-session depth limit (a cap only throttles it below a plain session)
+# and time out after 30s instead of piling up
+everything_client = MultiplexedMcpClient(
+    mcp_pool,
+    StdioConnectionParams(
         server_params=StdioServerParameters(
             command="npx",
             args=["-y", "--", "@modelcontextprotocol/server-everything"],
-            tool_filter=["getTinyImage"]
         ),
         timeout=30
-    )
+    ),
+    timeout=30,
+)
+mcp_image_server = everything_client.toolset(
+    toolset_class=CachedMcpToolset,
+    cache=mcp_tool_cache,
+    tool_filter=["getTinyImage"]
 )
 
 print("✅ MCP Tool created")
@@ -62,7 +84,9 @@ print("✅ MCP Tool created")
 # The same pattern works for any MCP server - only the connection_params change. Here are some examples:
 
 #Kaggle MCP Server
-kaggle_mcp_server = McpToolset(
+kaggle_mcp_server = mcp_pool.toolset(
+    toolset_class=CachedMcpToolset,
+    cache=mcp_tool_cache,
     connection_params=StdioConnectionParams(
         server_params=StdioServerParameters(
             command='npx',
@@ -104,5 +128,8 @@ async def main():
         "Provide a sample tiny image", 
         verbose=True
     )
+    print(f"📊 MCP pool: {mcp_pool.metrics()}")
+    print(f"📊 Everything server calls: {everything_client.metrics()}")
+    await mcp_pool.close()
 
 asyncio.run(main()) 
\ No newline at end of file
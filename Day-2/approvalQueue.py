@@ -0,0 +1,694 @@
+import os
+import asyncio
+import json
+import logging
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.genai import types
+
+# Durable queue of pending tool confirmations (adk_request_confirmation)
+
+# Why: run_shipping_workflow in LRO.py keeps a paused order only in the coroutine that started it.
+# If the process restarts the pause is lost, and there is no way to list or expire thousands of them.
+# What this does:
+    # Every pause is a row in SQLite: approval_id, invocation_id, app/user/session, hint, payload, deadline
+    # list_pending() pages through pending approvals per app (and user)
+    # decide() records the human decision; a pool of N worker tasks resumes the invocation with
+    #   run_async(invocation_id=...) and stores the agent's final answer
+    # A hashed timer wheel holds every deadline in O(1); on each tick only one slot is inspected,
+    #   and stale approvals are auto-rejected (and resumed, so the agent can tell the user)
+    # start() reloads pending rows into the wheel and re-queues decided-but-not-resumed ones,
+    #   so nothing is lost across restarts - pair it with a persistent session service
+    # decide_batch() validates a list of (approval_id, invocation_id, approved) against the stored
+    #   rows in one query and one transaction, resumes the accepted ones concurrently under a cap,
+    #   and reports a per-item outcome plus latency statistics
+
+logger = logging.getLogger(__name__)
+
+PENDING, DECIDED, DONE, FAILED = "pending", "decided", "done", "failed"
+
+# decide_batch outcomes of items that were not accepted
+UNKNOWN, INVOCATION_MISMATCH, NOT_PENDING, DUPLICATE = "unknown", "invocation_mismatch", "not_pending", "duplicate"
+_SQLITE_MAX_VARIABLES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS approvals (
+    approval_id   TEXT PRIMARY KEY,
+    invocation_id TEXT NOT NULL,
+    app_name      TEXT NOT NULL,
+    user_id       TEXT NOT NULL,
+    session_id    TEXT NOT NULL,
+    hint          TEXT,
+    payload       TEXT,
+    created_at    REAL NOT NULL,
+    expires_at    REAL,
+    status        TEXT NOT NULL,
+    approved      INTEGER,
+    reason        TEXT,
+    decided_at    REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    result        TEXT
+);
+CREATE INDEX IF NOT EXISTS approvals_pending ON approvals (app_name, user_id, status, created_at);
+CREATE INDEX IF NOT EXISTS approvals_status ON approvals (status);
+"""
+
+_COLUMNS = ("approval_id", "invocation_id", "app_name", "user_id", "session_id", "hint", "payload",
+            "created_at", "expires_at", "status", "approved", "reason", "decided_at", "attempts", "result")
+
+
+def confirmation_requests(event: Event) -> List[Dict[str, Any]]:
+    """The adk_request_confirmation calls in an event: approval_id, hint, payload and the original call."""
+    requests = []
+    for call in event.get_function_calls() if event.content else ():
+        if call.name == "adk_request_confirmation":
+            confirmation = (call.args or {}).get("toolConfirmation") or {}
+            requests.append({
+                "approval_id": call.id,
+                "invocation_id": event.invocation_id,
+                "hint": confirmation.get("hint"),
+                "payload": confirmation.get("payload"),
+                "original_call": (call.args or {}).get("originalFunctionCall"),
+            })
+    return requests
+
+
+def approval_response(approval_id: str, approved: bool) -> types.Content:
+    """Same message as create_approval_response in LRO.py."""
+    return types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+        id=approval_id, name="adk_request_confirmation", response={"confirmed": approved},
+    ))])
+
+
+class TimerWheel:
+    """Hashed timing wheel: O(1) schedule/cancel, one slot inspected per tick."""
+
+    def __init__(self, tick: float = 1.0, slots: int = 512, now: Optional[float] = None):
+        """
+        Args:
+            tick: Resolution in seconds.
+            slots: Wheel size; deadlines further than tick * slots away just wait extra rounds.
+        """
+        self.tick = tick
+        self._slots: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self._where: Dict[Hashable, int] = {}
+        self._cursor = int((time.time() if now is None else now) // tick)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        self.cancel(key)
+        slot = max(int(deadline // self.tick), self._cursor) % len(self._slots)
+        self._slots[slot][key] = deadline
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            self._slots[slot].pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Moves the wheel to `now` and returns the keys whose deadline passed."""
+        target = int(now // self.tick)
+        expired = []
+        # A long pause visits each slot once at most.
+        for tick in range(max(self._cursor, target - len(self._slots) + 1), target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self._where[key]
+            expired.extend(due)
+        self._cursor = target
+        return expired
+
+
+class ApprovalQueue:
+    """Durable pending-approval queue with expiry and a bounded pool of resume workers."""
+
+    def __init__(
+        self,
+        runner: Runner,
+        db_path: str = "approvals.db",
+        workers: int = 8,
+        default_ttl: Optional[float] = 24 * 3600,
+        tick: float = 1.0,
+        max_attempts: int = 3,
+        on_resumed: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ):
+        """
+        Args:
+            runner: Runner of the resumable app that paused.
+            db_path: SQLite file holding the approvals.
+            workers: Invocations resumed concurrently.
+            default_ttl: Seconds before an undecided approval is auto-rejected (None = never).
+            tick: Timer wheel resolution in seconds.
+            max_attempts: Resume attempts before an approval is marked failed.
+            on_resumed: Called with the approval row once its invocation has finished.
+        """
+        self.runner = runner
+        self.db_path = db_path
+        self.workers = workers
+        self.default_ttl = default_ttl
+        self.max_attempts = max_attempts
+        self.on_resumed = on_resumed
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._wheel = TimerWheel(tick=tick)
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._metrics = {"added": 0, "decided": 0, "expired": 0, "resumed": 0, "failed": 0, "retries": 0}
+        self._resume_latencies: List[float] = []
+
+    def _row(self, approval_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM approvals WHERE approval_id = ?",
+                               (approval_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(_COLUMNS, row))
+        record["payload"] = json.loads(record["payload"]) if record["payload"] else None
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        record["approved"] = bool(record["approved"]) if record["approved"] is not None else None
+        return record
+
+    # ------------------------------------------------------------------ producers
+
+    async def add(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        approval_id: str,
+        invocation_id: str,
+        hint: Optional[str] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        ttl: Optional[float] = None,
+    ) -> None:
+        """Persists a paused invocation (idempotent per approval_id)."""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._db:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO approvals (approval_id, invocation_id, app_name, user_id, session_id,"
+                " hint, payload, created_at, expires_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (approval_id, invocation_id, app_name, user_id, session_id, hint,
+                 json.dumps(payload, default=str) if payload is not None else None, now, expires_at, PENDING),
+            ).rowcount
+        if inserted:
+            self._metrics["added"] += 1
+            if expires_at is not None:
+                self._wheel.schedule(approval_id, expires_at)
+
+    async def add_from_event(
+        self, event: Event, *, app_name: str, user_id: str, session_id: str, ttl: Optional[float] = None
+    ) -> List[str]:
+        """Persists every confirmation request of an event and returns their approval ids."""
+        requests = confirmation_requests(event)
+        for request in requests:
+            await self.add(app_name=app_name, user_id=user_id, session_id=session_id,
+                           approval_id=request["approval_id"], invocation_id=request["invocation_id"],
+                           hint=request["hint"], payload=request["payload"], ttl=ttl)
+        return [request["approval_id"] for request in requests]
+
+    async def list_pending(
+        self, app_name: str, user_id: Optional[str] = None, limit: int = 100, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Oldest pending approvals first."""
+        query = f"SELECT approval_id FROM approvals WHERE app_name = ? AND status = '{PENDING}'"
+        params: List[Any] = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY created_at LIMIT ? OFFSET ?"
+        ids = [row[0] for row in self._db.execute(query, (*params, limit, offset))]
+        return [self._row(approval_id) for approval_id in ids]
+
+    async def get(self, approval_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(approval_id)
+
+    # ------------------------------------------------------------------ decisions
+
+    async def decide(self, approval_id: str, approved: bool, reason: Optional[str] = None) -> bool:
+        """Records a decision and queues the resume. False if the approval is unknown or already decided.
+
+        Args:
+            approval_id: The confirmation request's function call id.
+            approved: Whether the tool call goes ahead.
+            reason: Free-text note stored with the decision; it does not change the outcome.
+        """
+        with self._db:
+            changed = self._db.execute(
+                f"UPDATE approvals SET status = '{DECIDED}', approved = ?, reason = ?, decided_at = ?"
+                f" WHERE approval_id = ? AND status = '{PENDING}'",
+                (int(approved), reason, time.time(), approval_id),
+            ).rowcount
+        if not changed:
+            return False
+        self._wheel.cancel(approval_id)
+        self._metrics["expired" if reason == "expired" else "decided"] += 1
+        self._queue.put_nowait(approval_id)
+        return True
+
+    async def decide_batch(
+        self,
+        decisions: Iterable[Tuple[str, Optional[str], bool]],
+        concurrency: int = 32,
+        reason: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Records many decisions at once and resumes the accepted invocations concurrently.
+
+        Args:
+            decisions: (approval_id, invocation_id, approved) per item. invocation_id may be None to skip
+                that check; otherwise it must match the stored pause.
+            concurrency: Invocations resumed at the same time by this batch (independent of `workers`).
+            reason: Note stored with every decision of the batch, as in decide().
+
+        Returns:
+            Dict[str, Any]: "items" - one dict per input item, in order, with its outcome ("done", "failed",
+            or why it was not accepted: unknown, invocation_mismatch, not_pending, or duplicate of an
+            item accepted earlier in the batch), status and
+            result; "stats" - counts, wall time, throughput and resume latency percentiles.
+        """
+        started = time.perf_counter()
+        decisions = list(decisions)
+        stored = self._pending_state([approval_id for approval_id, _, _ in decisions])
+
+        items: List[Dict[str, Any]] = []
+        accepted: List[Tuple[Dict[str, Any], bool]] = []
+        seen = set()
+        for approval_id, invocation_id, approved in decisions:
+            item = {"approval_id": approval_id, "approved": approved, "outcome": None, "status": None,
+                    "result": None, "latency_ms": None}
+            items.append(item)
+            row = stored.get(approval_id)
+            if approval_id in seen:
+                item["outcome"] = DUPLICATE
+            elif row is None:
+                item["outcome"] = UNKNOWN
+            elif invocation_id is not None and invocation_id != row[0]:
+                item["outcome"] = INVOCATION_MISMATCH
+            elif row[1] != PENDING:
+                item["outcome"], item["status"] = NOT_PENDING, row[1]
+            else:
+                accepted.append((item, approved))
+                seen.add(approval_id)
+
+        # One transaction for the whole batch; the status guard still loses cleanly to a concurrent
+        # decide() or an expiry that happened after the read above.
+        decided_at = time.time()
+        with self._db:
+            for item, approved in accepted:
+                changed = self._db.execute(
+                    f"UPDATE approvals SET status = '{DECIDED}', approved = ?, reason = ?, decided_at = ?"
+                    f" WHERE approval_id = ? AND status = '{PENDING}'",
+                    (int(approved), reason, decided_at, item["approval_id"]),
+                ).rowcount
+                item["status"] = DECIDED if changed else None
+        accepted = [(item, approved) for item, approved in accepted if item["status"] == DECIDED]
+        for item, _ in accepted:
+            self._wheel.cancel(item["approval_id"])
+        self._metrics["decided"] += len(accepted)
+        for item in items:
+            if item["outcome"] is None and item["status"] is None:
+                item["outcome"] = NOT_PENDING
+        validated = time.perf_counter()
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def resume(item: Dict[str, Any]) -> None:
+            async with semaphore:
+                resume_started = time.perf_counter()
+                while await self._resume(item["approval_id"], requeue=False):
+                    pass
+                item["latency_ms"] = (time.perf_counter() - resume_started) * 1000
+            row = self._row(item["approval_id"])
+            item["outcome"] = item["status"] = row["status"]
+            item["result"] = row["result"]
+
+        await asyncio.gather(*(resume(item) for item, _ in accepted))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(item["latency_ms"] for item, _ in accepted)
+        outcomes: Dict[str, int] = {}
+        for item in items:
+            outcomes[item["outcome"]] = outcomes.get(item["outcome"], 0) + 1
+
+        def percentile(q: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0.0
+
+        return {
+            "items": items,
+            "stats": {
+                "submitted": len(items),
+                "accepted": len(accepted),
+                "outcomes": outcomes,
+                "validate_ms": (validated - started) * 1000,
+                "wall_s": elapsed,
+                "resumed_per_s": len(accepted) / elapsed if accepted and elapsed else 0.0,
+                "resume_p50_ms": percentile(0.5),
+                "resume_p95_ms": percentile(0.95),
+                "resume_p99_ms": percentile(0.99),
+                "resume_max_ms": latencies[-1] if latencies else 0.0,
+            },
+        }
+
+    def _pending_state(self, approval_ids: Sequence[str]) -> Dict[str, Tuple[str, str]]:
+        """approval_id -> (invocation_id, status) for the ids that exist."""
+        state = {}
+        unique = list(dict.fromkeys(approval_ids))
+        for i in range(0, len(unique), _SQLITE_MAX_VARIABLES):
+            chunk = unique[i:i + _SQLITE_MAX_VARIABLES]
+            rows = self._db.execute(
+                f"SELECT approval_id, invocation_id, status FROM approvals"
+                f" WHERE approval_id IN ({', '.join('?' * len(chunk))})", chunk,
+            )
+            state.update((approval_id, (invocation_id, status)) for approval_id, invocation_id, status in rows)
+        return state
+
+    async def wait(self, approval_id: str) -> Dict[str, Any]:
+        """Waits until the approval's invocation has been resumed (or has failed)."""
+        row = self._row(approval_id)
+        if row is None:
+            raise KeyError(approval_id)
+        if row["status"] in (DONE, FAILED):
+            return row
+        waiter = self._waiters.setdefault(approval_id, asyncio.get_running_loop().create_future())
+        return await asyncio.shield(waiter)
+
+    # ------------------------------------------------------------------ workers
+
+    async def _resume(self, approval_id: str, requeue: bool = True) -> bool:
+        """Resumes one decided invocation. True if it should be retried and `requeue` is False."""
+        row = self._row(approval_id)
+        if row is None or row["status"] != DECIDED:
+            return False
+        approved = bool(row["approved"])
+        started = time.perf_counter()
+        texts = []
+        try:
+            async for event in self.runner.run_async(
+                user_id=row["user_id"],
+                session_id=row["session_id"],
+                invocation_id=row["invocation_id"],
+                new_message=approval_response(approval_id, approved),
+            ):
+                if event.content and event.content.parts:
+                    texts.extend(part.text for part in event.content.parts if part.text)
+        except Exception as error:
+            attempts = row["attempts"] + 1
+            failed = attempts >= self.max_attempts
+            with self._db:
+                self._db.execute(
+                    "UPDATE approvals SET attempts = ?, status = ?, result = ? WHERE approval_id = ?",
+                    (attempts, FAILED if failed else DECIDED, json.dumps({"error": repr(error)}), approval_id),
+                )
+            if failed:
+                self._metrics["failed"] += 1
+                logger.warning(f"[Approvals] Resume of {approval_id} failed: {error!r}")
+                self._finish(approval_id)
+                return False
+            self._metrics["retries"] += 1
+            await asyncio.sleep(0.5 * 2 ** attempts)
+            if requeue:
+                self._queue.put_nowait(approval_id)
+            return not requeue
+
+        with self._db:
+            self._db.execute(
+                f"UPDATE approvals SET status = '{DONE}', attempts = attempts + 1, result = ? WHERE approval_id = ?",
+                (json.dumps({"text": "\n".join(texts)}), approval_id),
+            )
+        self._metrics["resumed"] += 1
+        self._resume_latencies.append(time.perf_counter() - started)
+        self._finish(approval_id)
+        return False
+
+    def _finish(self, approval_id: str) -> None:
+        row = self._row(approval_id)
+        waiter = self._waiters.pop(approval_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(row)
+        if self.on_resumed is not None:
+            self.on_resumed(row)
+
+    async def _worker(self) -> None:
+        while True:
+            approval_id = await self._queue.get()
+            try:
+                await self._resume(approval_id)
+            except Exception:
+                logger.exception(f"[Approvals] Worker error on {approval_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _ticker(self) -> None:
+        while True:
+            await asyncio.sleep(self._wheel.tick)
+            for approval_id in self._wheel.advance(time.time()):
+                await self.decide(approval_id, False, reason="expired")
+
+    async def start(self) -> Dict[str, int]:
+        """Reloads durable state and starts the workers and the expiry timer.
+
+        Returns:
+            Dict[str, int]: pending approvals scheduled, decided approvals re-queued.
+        """
+        pending = self._db.execute(
+            f"SELECT approval_id, expires_at FROM approvals WHERE status = '{PENDING}' AND expires_at IS NOT NULL"
+        ).fetchall()
+        for approval_id, expires_at in pending:
+            self._wheel.schedule(approval_id, expires_at)
+        requeued = [row[0] for row in self._db.execute(f"SELECT approval_id FROM approvals WHERE status = '{DECIDED}'")]
+        for approval_id in requeued:
+            self._queue.put_nowait(approval_id)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._ticker()))
+        # Approvals that expired while the process was down are rejected right away.
+        for approval_id in self._wheel.advance(time.time()):
+            await self.decide(approval_id, False, reason="expired")
+        return {"scheduled": len(pending), "requeued": len(requeued)}
+
+    async def drain(self) -> None:
+        """Waits until every queued decision has been resumed."""
+        await self._queue.join()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._db.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        counts = dict(self._db.execute("SELECT status, count(*) FROM approvals GROUP BY status").fetchall())
+        latencies = sorted(self._resume_latencies)
+        return {
+            **self._metrics,
+            "by_status": counts,
+            "timers": len(self._wheel),
+            "queued": self._queue.qsize(),
+            "resume_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            "resume_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+def _benchmark_app():
+    """A resumable shipping app whose model is simulated (no API key needed)."""
+    from google.adk.agents import LlmAgent
+    from google.adk.apps.app import App, ResumabilityConfig
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_response import LlmResponse
+    from google.adk.tools.function_tool import FunctionTool
+    from google.adk.tools.tool_context import ToolContext
+
+    def place_shipping_order(num_containers: int, destination: str, tool_context: ToolContext) -> dict:
+        """Same confirmation flow as LRO.py."""
+        if not tool_context.tool_confirmation:
+            tool_context.request_confirmation(
+                hint=f"Large order: {num_containers} containers to {destination}",
+                payload={"num_containers": num_containers, "destination": destination},
+            )
+            return {"status": "pending"}
+        if tool_context.tool_confirmation.confirmed:
+            return {"status": "Approved", "order_id": f"ORD-{num_containers}-HUMAN"}
+        return {"status": "rejected"}
+
+    class ShippingLlm(BaseLlm):
+        """Calls place_shipping_order for a new request and summarizes the tool result."""
+
+        latency: float = 0.0
+
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            await asyncio.sleep(self.latency)
+            last = llm_request.contents[-1].parts[-1]
+            if last.function_response:
+                text = f"Order {last.function_response.response.get('status')}."
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+            else:
+                destination = last.text.rsplit(" ", 1)[-1]
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                    name="place_shipping_order", args={"num_containers": 10, "destination": destination}))]))
+
+    agent = LlmAgent(name="ShippingAgent", model=ShippingLlm(model="simulated"),
+                     tools=[FunctionTool(func=place_shipping_order)])
+    return App(name="ShippingApp", root_agent=agent, resumability_config=ResumabilityConfig(is_resumable=True))
+
+
+async def benchmark(orders: int = 10_000, model_latency: float = 0.02, worker_counts=(1, 8, 64), expiring: float = 0.1):
+    """Resume throughput for `orders` pending approvals, with a share of them expiring on the timer."""
+    from google.adk.sessions import DatabaseSessionService, InMemorySessionService
+
+    async def pause_orders(runner: Runner, queue: ApprovalQueue, count: int) -> List[str]:
+        ids = []
+        for i in range(count):
+            session = await runner.session_service.create_session(app_name="ShippingApp", user_id=f"user{i % 100}")
+            async for event in runner.run_async(user_id=session.user_id, session_id=session.id,
+                                                new_message=types.Content(role="user", parts=[types.Part(
+                                                    text=f"Ship 10 containers to Port{i}")])):
+                ids += await queue.add_from_event(event, app_name="ShippingApp", user_id=session.user_id,
+                                                  session_id=session.id,
+                                                  ttl=1.0 if i < count * expiring else None)
+        return ids
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"📊 Resuming {orders:,} paused orders (simulated model latency {model_latency * 1000:.0f} ms, "
+              f"{expiring:.0%} expire after 1 s)")
+        for workers in worker_counts:
+            runner = Runner(app=_benchmark_app(), session_service=InMemorySessionService())
+            queue = ApprovalQueue(runner, db_path=os.path.join(tmp, f"approvals-{workers}.db"), workers=workers,
+                                  default_ttl=None, tick=0.1)
+            started = time.perf_counter()
+            ids = await pause_orders(runner, queue, orders)  # pausing is not measured: no model latency
+            pause_time = time.perf_counter() - started
+            runner.agent.model.latency = model_latency
+            await queue.start()
+            pending = await queue.list_pending("ShippingApp", user_id="user7", limit=5)
+            await asyncio.sleep(1.2)  # let the short-ttl approvals expire on the wheel
+
+            started = time.perf_counter()
+            for approval_id in ids:
+                await queue.decide(approval_id, approved=True)
+            await queue.drain()
+            elapsed = time.perf_counter() - started
+            metrics = queue.metrics()
+            print(f"   {workers:3} workers: {metrics['resumed']:,} resumed in {elapsed:6.2f}s "
+                  f"({metrics['resumed'] / elapsed:7.1f}/s)  expired {metrics['expired']:,}  "
+                  f"p50 {metrics['resume_p50_ms']:.0f} ms  p99 {metrics['resume_p99_ms']:.0f} ms  "
+                  f"(pausing took {pause_time:.1f}s, user7 has {len(pending)}+ pending)")
+            await queue.stop()
+
+        # Restart: pending approvals survive in SQLite next to a DatabaseSessionService.
+        db_url = f"sqlite:///{os.path.join(tmp, 'sessions.db')}"
+        approvals_path = os.path.join(tmp, "approvals-restart.db")
+        runner = Runner(app=_benchmark_app(), session_service=DatabaseSessionService(db_url))
+        queue = ApprovalQueue(runner, db_path=approvals_path, default_ttl=None)
+        ids = await pause_orders(runner, queue, 20)
+        await queue.stop()  # the process "dies" with 20 paused orders
+
+        runner = Runner(app=_benchmark_app(), session_service=DatabaseSessionService(db_url))
+        queue = ApprovalQueue(runner, db_path=approvals_path)
+        await queue.start()
+        pending = await queue.list_pending("ShippingApp", limit=1000)
+        for row in pending:
+            await queue.decide(row["approval_id"], approved=True)
+        results = [await queue.wait(approval_id) for approval_id in ids]
+        await queue.stop()
+        print(f"✅ After a restart: {len(pending)} pending approvals found, "
+              f"{sum(row['result']['text'] == 'Order Approved.' for row in results)} resumed to 'Order Approved.'")
+
+
+async def benchmark_batch(orders: int = 500, model_latency: float = 0.02, concurrency: int = 64):
+    """Bulk approval: one decide() + wait() at a time (LRO.py) vs a single decide_batch()."""
+    from google.adk.sessions import InMemorySessionService
+
+    async def paused(count: int) -> Tuple[ApprovalQueue, List[Tuple[str, str, bool]]]:
+        runner = Runner(app=_benchmark_app(), session_service=InMemorySessionService())
+        queue = ApprovalQueue(runner, db_path=os.path.join(tmp, f"batch-{len(os.listdir(tmp))}.db"), default_ttl=None)
+        decisions = []
+        for i in range(count):
+            session = await runner.session_service.create_session(app_name="ShippingApp", user_id=f"user{i % 10}")
+            async for event in runner.run_async(user_id=session.user_id, session_id=session.id,
+                                                new_message=types.Content(role="user", parts=[types.Part(
+                                                    text=f"Ship 10 containers to Port{i}")])):
+                for request in confirmation_requests(event):
+                    await queue.add(app_name="ShippingApp", user_id=session.user_id, session_id=session.id,
+                                    approval_id=request["approval_id"], invocation_id=request["invocation_id"])
+                    decisions.append((request["approval_id"], request["invocation_id"], i % 5 != 0))
+        runner.agent.model.latency = model_latency
+        return queue, decisions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"📊 Deciding {orders:,} paused orders in bulk (simulated model latency {model_latency * 1000:.0f} ms)")
+        queue, decisions = await paused(orders)
+        await queue.start()
+        started = time.perf_counter()
+        for approval_id, _, approved in decisions:
+            await queue.decide(approval_id, approved)
+            await queue.wait(approval_id)
+        elapsed = time.perf_counter() - started
+        print(f"   one at a time:        {elapsed:6.2f}s ({orders / elapsed:7.1f}/s)")
+        await queue.stop()
+
+        queue, decisions = await paused(orders)
+        # Operators' input is never clean: a repeated row, a stale invocation id and an unknown id.
+        noisy = [(decisions[1][0], "e-stale", True)] + decisions + [decisions[0], ("adk-unknown", None, True)]
+        batch = await queue.decide_batch(noisy, concurrency=concurrency)
+        stats = batch["stats"]
+        print(f"   decide_batch (cap {concurrency}): {stats['wall_s']:6.2f}s ({stats['resumed_per_s']:7.1f}/s)  "
+              f"validated in {stats['validate_ms']:.1f} ms  p50 {stats['resume_p50_ms']:.0f} ms  "
+              f"p95 {stats['resume_p95_ms']:.0f} ms  max {stats['resume_max_ms']:.0f} ms")
+        texts = {}
+        for item in batch["items"][1:orders + 1]:
+            texts[item["result"]["text"]] = texts.get(item["result"]["text"], 0) + 1
+        print(f"   outcomes {stats['outcomes']}  results {texts}")
+        again = await queue.decide_batch(decisions[:3])
+        print(f"✅ Re-submitting decided items: {[item['outcome'] for item in again['items']]}")
+        await queue.stop()
+
+
+
+async def check_decision_reason():
+    """Regression check: a reason is a note on the decision and never turns an approval into a rejection."""
+    from google.adk.sessions import InMemorySessionService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runner = Runner(app=_benchmark_app(), session_service=InMemorySessionService())
+        queue = ApprovalQueue(runner, db_path=os.path.join(tmp, "reasons.db"), default_ttl=None)
+        ids = []
+        for i in range(4):
+            session = await runner.session_service.create_session(app_name="ShippingApp", user_id="ops")
+            async for event in runner.run_async(user_id="ops", session_id=session.id,
+                                                new_message=types.Content(role="user", parts=[types.Part(
+                                                    text=f"Ship 10 containers to Port{i}")])):
+                ids += await queue.add_from_event(event, app_name="ShippingApp", user_id="ops", session_id=session.id)
+        await queue.start()
+        await queue.decide(ids[0], True, reason="ok by ops")
+        await queue.decide(ids[1], False, reason="wrong port")
+        await queue.decide_batch([(ids[2], None, True), (ids[3], None, False)], reason="bulk ok")
+        rows = [await queue.wait(approval_id) for approval_id in ids]
+        await queue.stop()
+    expected = [(True, "ok by ops", "Order Approved."), (False, "wrong port", "Order rejected."),
+                (True, "bulk ok", "Order Approved."), (False, "bulk ok", "Order rejected.")]
+    got = [(row["approved"], row["reason"], row["result"]["text"]) for row in rows]
+    assert got == expected, got
+    print(f"✅ Decisions with a reason resume with the decided outcome: {[text for _, _, text in got]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(check_decision_reason())
+    asyncio.run(benchmark())
+    asyncio.run(benchmark_batch())
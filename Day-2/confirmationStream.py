@@ -0,0 +1,190 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+
+from approvalQueue import confirmation_requests
+
+# Early detection of confirmation requests while run_async is still streaming
+
+# Why: LRO.py collects the whole run_async stream into a list and only then scans every event and
+# part for adk_request_confirmation. The pause is reported after everything that runs once the
+# request is emitted (after_agent callbacks such as memory ingestion, after_run plugins).
+# What this does:
+    # ConfirmationPlugin: runner-side hook. on_event_callback sees each event right after the
+    #   session service stored it, so a pause can be persisted (e.g. ApprovalQueue.add_from_event)
+    #   before the client has even received the event
+    # ConfirmationWatcher.run(): client-side typed filter over run_async. Events are passed
+    #   through one by one (nothing is buffered); on the first confirmation request the callback
+    #   fires before the event is passed on, and the generator ends after it. The rest of the runner's stream is drained by a background
+    #   task, so callbacks after the pause still run - the caller just no longer waits for them
+
+logger = logging.getLogger(__name__)
+
+OnConfirmation = Callable[[Event, List[Dict[str, Any]]], Union[Awaitable[Any], Any]]
+
+
+async def _call(callback: OnConfirmation, event: Event, requests: List[Dict[str, Any]]) -> None:
+    result = callback(event, requests)
+    if inspect.isawaitable(result):
+        await result
+
+
+class ConfirmationPlugin(BasePlugin):
+    """Calls `on_confirmation(event, requests)` as soon as an event with adk_request_confirmation is stored."""
+
+    def __init__(self, on_confirmation: OnConfirmation, name: str = "confirmation_plugin"):
+        super().__init__(name=name)
+        self.on_confirmation = on_confirmation
+        self.detected = 0
+
+    async def on_event_callback(self, *, invocation_context: InvocationContext, event: Event) -> Optional[Event]:
+        if event.long_running_tool_ids and event.content:
+            requests = confirmation_requests(event)
+            if requests:
+                self.detected += 1
+                await _call(self.on_confirmation, event, requests)
+        return None
+
+
+class ConfirmationWatcher:
+    """Streams run_async events and stops at the first confirmation request."""
+
+    def __init__(self, runner: Runner, on_confirmation: Optional[OnConfirmation] = None):
+        """
+        Args:
+            runner: Runner of the app.
+            on_confirmation: Called with (event, requests) when a confirmation request is seen.
+        """
+        self.runner = runner
+        self.on_confirmation = on_confirmation
+        self._tails: Set[asyncio.Task] = set()
+
+    async def run(
+        self, *, on_confirmation: Optional[OnConfirmation] = None, **run_kwargs: Any
+    ) -> AsyncGenerator[Event, None]:
+        """Streams Runner.run_async(**run_kwargs). The last event yielded is the confirmation request, if any.
+
+        Args:
+            on_confirmation: Overrides the watcher's callback for this run.
+            **run_kwargs: Passed to Runner.run_async.
+        """
+        callback = on_confirmation or self.on_confirmation
+        stream = self.runner.run_async(**run_kwargs)
+        paused = False
+        try:
+            async for event in stream:
+                requests = confirmation_requests(event) if event.long_running_tool_ids and event.content else []
+                if requests:
+                    # Before the yield: a caller that stops at this event still gets the pause
+                    # persisted, and the rest of the stream drained.
+                    paused = True
+                    if callback is not None:
+                        await _call(callback, event, requests)
+                yield event
+                if paused:
+                    break
+        finally:
+            if paused:
+                task = asyncio.get_running_loop().create_task(self._drain(stream))
+                self._tails.add(task)
+                task.add_done_callback(self._tails.discard)
+            else:
+                await stream.aclose()
+
+    @staticmethod
+    async def _drain(stream: AsyncGenerator[Event, None]) -> None:
+        try:
+            async for _ in stream:
+                pass
+        except Exception:
+            logger.exception("[Confirmations] Error after a confirmation request")
+        finally:
+            await stream.aclose()
+
+    async def close(self) -> None:
+        """Waits for the streams still running after a pause."""
+        await asyncio.gather(*list(self._tails), return_exceptions=True)
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(orders: int = 50, tail_latency: float = 0.3):
+    """Time from run_async start to the pause notification: collect-then-scan vs streaming hooks."""
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+
+    from approvalQueue import _benchmark_app
+
+    async def remember_session(callback_context) -> None:
+        # Stand-in for the after_agent memory ingestion of agentMemoryCallback.py.
+        await asyncio.sleep(tail_latency)
+
+    def message(i: int) -> types.Content:
+        return types.Content(role="user", parts=[types.Part(text=f"Ship 10 containers to Port{i}")])
+
+    async def collect_then_scan(runner: Runner, session_id: str, i: int) -> float:
+        started = time.perf_counter()
+        events = [event async for event in runner.run_async(user_id="u1", session_id=session_id, new_message=message(i))]
+        assert any(confirmation_requests(event) for event in events)
+        return time.perf_counter() - started
+
+    async def watcher_filter(watcher: ConfirmationWatcher, session_id: str, i: int) -> float:
+        started = time.perf_counter()
+        notified = []
+        async for _ in watcher.run(user_id="u1", session_id=session_id, new_message=message(i),
+                                   on_confirmation=lambda event, requests: notified.append(time.perf_counter())):
+            pass
+        assert notified
+        return notified[0] - started
+
+    async def plugin_hook(runner: Runner, plugin: ConfirmationPlugin, session_id: str, i: int) -> float:
+        started = time.perf_counter()
+        notified = []
+        plugin.on_confirmation = lambda event, requests: notified.append(time.perf_counter())
+        async for _ in runner.run_async(user_id="u1", session_id=session_id, new_message=message(i)):
+            pass
+        assert notified
+        return notified[0] - started
+
+    def make_runner(plugins=()) -> Runner:
+        app = _benchmark_app()
+        app.root_agent.after_agent_callback = remember_session
+        app.plugins = list(plugins)
+        return Runner(app=app, session_service=InMemorySessionService())
+
+    async def sessions(runner: Runner) -> List[str]:
+        return [(await runner.session_service.create_session(app_name="ShippingApp", user_id="u1")).id
+                for _ in range(orders)]
+
+    results = {}
+    runner = make_runner()
+    ids = await sessions(runner)
+    results["collect, then check_for_approval"] = [await collect_then_scan(runner, ids[i], i) for i in range(orders)]
+
+    runner = make_runner()
+    watcher = ConfirmationWatcher(runner)
+    ids = await sessions(runner)
+    results["ConfirmationWatcher.run"] = [await watcher_filter(watcher, ids[i], i) for i in range(orders)]
+    await watcher.close()
+
+    plugin = ConfirmationPlugin(on_confirmation=lambda event, requests: None)
+    runner = make_runner([plugin])
+    ids = await sessions(runner)
+    results["ConfirmationPlugin (runner hook)"] = [await plugin_hook(runner, plugin, ids[i], i) for i in range(orders)]
+
+    print(f"📊 Time to pause notification over {orders} large orders "
+          f"({tail_latency * 1000:.0f} ms of after-agent work once the request is emitted)")
+    for name, times in results.items():
+        times.sort()
+        print(f"   {name:36} p50 {times[len(times) // 2] * 1000:7.1f} ms   max {times[-1] * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
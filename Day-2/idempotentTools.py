@@ -0,0 +1,346 @@
+import os
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+# Exactly-once execution for side-effecting tools
+
+# Why: place_shipping_order runs once to pause and again on resume, and when anything fails after
+# the tool has run (the model call that summarizes the result, a crash) the resume is retried and
+# the tool runs again - a second booking for the same order.
+# What this does:
+    # IdempotencyPlugin wraps the listed tools through before/after_tool_callback, so tool code does
+    #   not change. The key is a hash of tool name, invocation_id, function_call id, args and the
+    #   confirmation decision (the pausing call and the confirmed call are different executions)
+    # A completed result is stored in SQLite (bounded: oldest rows are evicted past max_entries,
+    #   optional ttl) behind an in-memory LRU; a replay returns the stored result without running the tool
+    # Calls that pause (request_confirmation, long-running tools) are not stored
+    # Concurrent identical calls wait for the first one. A key that was started but never finished
+    #   (crash mid-call) is run again and counted as "uncertain" - pass idempotency_key() to the
+    #   downstream API to close that gap
+
+logger = logging.getLogger(__name__)
+
+STARTED, COMPLETED = "started", "completed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    key           TEXT PRIMARY KEY,
+    tool          TEXT NOT NULL,
+    invocation_id TEXT,
+    call_id       TEXT,
+    status        TEXT NOT NULL,
+    result        TEXT,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tool_results_created ON tool_results (created_at);
+"""
+
+
+def idempotency_key(tool_name: str, args: Dict[str, Any], tool_context: ToolContext, per_call: bool = True) -> str:
+    """Key of one tool execution.
+
+    Args:
+        tool_name: Name of the tool.
+        args: Arguments the model passed.
+        tool_context: Gives invocation_id, function_call_id and the confirmation decision.
+        per_call: Include the function_call id. False also merges identical calls the model re-issues
+            (with a new id) within the same invocation.
+    """
+    confirmation = tool_context.tool_confirmation
+    material = {
+        "tool": tool_name,
+        "invocation_id": tool_context.invocation_id,
+        "call_id": tool_context.function_call_id if per_call else None,
+        "args": args,
+        "confirmed": confirmation.confirmed if confirmation is not None else None,
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class IdempotencyPlugin(BasePlugin):
+    """Returns the stored result when a side-effecting tool call is replayed."""
+
+    def __init__(
+        self,
+        tools: Iterable[str],
+        db_path: str = "tool_results.db",
+        max_entries: int = 100_000,
+        ttl: Optional[float] = None,
+        memory_entries: int = 10_000,
+        per_call: bool = True,
+        name: str = "idempotency",
+    ):
+        """
+        Args:
+            tools: Names of the tools to deduplicate.
+            db_path: SQLite file holding the results.
+            max_entries: Stored results kept; the oldest are evicted beyond it.
+            ttl: Seconds a result can be replayed (None = until evicted).
+            memory_entries: Size of the in-memory LRU in front of SQLite.
+            per_call: See idempotency_key.
+        """
+        super().__init__(name=name)
+        self.tools = set(tools)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_entries = min(memory_entries, max_entries)
+        self.per_call = per_call
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._calls: Dict[Tuple[str, str], Tuple[str, bool]] = {}  # (invocation, call id) -> (key, replayed)
+        self._since_trim = 0
+        self._metrics = {"executed": 0, "deduplicated": 0, "memory_hits": 0, "store_hits": 0, "joined": 0,
+                         "uncertain": 0, "not_stored": 0, "evicted": 0}
+
+    # ------------------------------------------------------------------ cache
+
+    def _lookup(self, key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(status, result) of a key; status None if unknown or expired."""
+        cutoff = time.time() - self.ttl if self.ttl is not None else None
+        cached = self._memory.get(key)
+        if cached is not None and (cutoff is None or cached[0] >= cutoff):
+            self._memory.move_to_end(key)
+            self._metrics["memory_hits"] += 1
+            return COMPLETED, cached[1]
+        row = self._db.execute("SELECT status, result, created_at FROM tool_results WHERE key = ?", (key,)).fetchone()
+        if row is None or (cutoff is not None and row[2] < cutoff):
+            return None, None
+        if row[0] != COMPLETED:
+            return row[0], None
+        result = json.loads(row[1])
+        self._remember(key, row[2], result)
+        self._metrics["store_hits"] += 1
+        return COMPLETED, result
+
+    def _remember(self, key: str, created_at: float, result: Dict[str, Any]) -> None:
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim(self) -> None:
+        # Evicting in batches keeps the per-call cost at one INSERT.
+        self._since_trim += 1
+        if self._since_trim < max(1, self.max_entries // 20):
+            return
+        self._since_trim = 0
+        with self._db:
+            excess = self._db.execute("SELECT count(*) FROM tool_results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM tool_results WHERE key IN"
+                                 " (SELECT key FROM tool_results ORDER BY created_at LIMIT ?)", (excess,))
+                self._metrics["evicted"] += excess
+
+    # ------------------------------------------------------------------ callbacks
+
+    async def before_tool_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext
+    ) -> Optional[Dict[str, Any]]:
+        if tool.name not in self.tools:
+            return None
+        key = idempotency_key(tool.name, tool_args, tool_context, self.per_call)
+        call = (tool_context.invocation_id, tool_context.function_call_id)
+
+        waiter = self._inflight.get(key)
+        if waiter is not None:
+            result = await asyncio.shield(waiter)
+            if result is not None:
+                self._metrics["joined"] += 1
+                self._metrics["deduplicated"] += 1
+                self._calls[call] = (key, True)
+                return result
+
+        status, result = self._lookup(key)
+        if status == COMPLETED:
+            self._metrics["deduplicated"] += 1
+            self._calls[call] = (key, True)
+            logger.info(f"[Idempotency] {tool.name} replayed from {key[:12]}")
+            return result
+        if status == STARTED:
+            self._metrics["uncertain"] += 1
+            logger.warning(f"[Idempotency] {tool.name} {key[:12]} started earlier but never finished; running again")
+
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, invocation_id, call_id, status, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool.name, tool_context.invocation_id, tool_context.function_call_id, STARTED, time.time()),
+            )
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        self._calls[call] = (key, False)
+        return None
+
+    async def after_tool_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext, result: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        if tool.name not in self.tools:
+            return None
+        key, replayed = self._calls.pop((tool_context.invocation_id, tool_context.function_call_id), (None, True))
+        if replayed:
+            return None
+        paused = tool.is_long_running or tool_context.function_call_id in tool_context.actions.requested_tool_confirmations
+        if paused:
+            # Not an outcome: the confirmed (or resumed) call is the one that must run exactly once.
+            self._metrics["not_stored"] += 1
+            with self._db:
+                self._db.execute("DELETE FROM tool_results WHERE key = ?", (key,))
+            self._release(key, None)
+            return None
+        self._metrics["executed"] += 1
+        now = time.time()
+        with self._db:
+            self._db.execute("UPDATE tool_results SET status = ?, result = ?, created_at = ? WHERE key = ?",
+                             (COMPLETED, json.dumps(result, default=str), now, key))
+        self._remember(key, now, result)
+        self._trim()
+        self._release(key, result)
+        return None
+
+    async def on_tool_error_callback(
+        self, *, tool: BaseTool, tool_args: Dict[str, Any], tool_context: ToolContext, error: Exception
+    ) -> Optional[Dict[str, Any]]:
+        if tool.name not in self.tools:
+            return None
+        key, replayed = self._calls.pop((tool_context.invocation_id, tool_context.function_call_id), (None, True))
+        if not replayed:
+            # A failed call may be retried; it stays "started" so a retry is counted as uncertain.
+            self._release(key, None)
+        return None
+
+    def _release(self, key: str, result: Optional[Dict[str, Any]]) -> None:
+        waiter = self._inflight.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)  # None: waiters run the tool themselves
+
+    def metrics(self) -> Dict[str, Any]:
+        stored = self._db.execute("SELECT count(*) FROM tool_results WHERE status = ?", (COMPLETED,)).fetchone()[0]
+        return {**self._metrics, "stored": stored, "in_memory": len(self._memory)}
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(orders: int = 200, booking_latency: float = 0.05, failure_rate: float = 0.3, max_entries: int = 100):
+    """Bookings made for `orders` approved orders when the post-tool model call fails and the resume is retried."""
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+
+    from approvalQueue import _benchmark_app, approval_response, confirmation_requests
+
+    def shipping_app(bookings: Dict[str, int], plugins=()):
+        app = _benchmark_app()
+        tool = app.root_agent.tools[0]
+        place_order = tool.func
+
+        async def place_shipping_order(num_containers: int, destination: str, tool_context: ToolContext) -> dict:
+            """Books the shipment with the carrier once the order is approved."""
+            result = place_order(num_containers, destination, tool_context)
+            if result["status"] == "Approved":
+                await asyncio.sleep(booking_latency)  # the carrier API call
+                bookings[destination] = bookings.get(destination, 0) + 1
+            return result
+
+        tool.func = place_shipping_order
+        model = app.root_agent.model
+        failing = {f"Port{i}" for i in range(int(orders * failure_rate))}
+
+        class FlakyLlm(type(model)):
+            """Fails once on the summary call of some orders, after the booking has happened."""
+
+            async def generate_content_async(self, llm_request, stream: bool = False):
+                last = llm_request.contents[-1].parts[-1]
+                if last.function_response and last.function_response.name == "place_shipping_order":
+                    destination = next(iter(failing & {p.text.rsplit(" ", 1)[-1] for c in llm_request.contents
+                                                        for p in c.parts if p.text}), None)
+                    if destination:
+                        failing.discard(destination)
+                        raise RuntimeError("503 UNAVAILABLE")
+                async for response in super().generate_content_async(llm_request, stream):
+                    yield response
+
+        app.root_agent.model = FlakyLlm(model="simulated")
+        app.plugins = list(plugins)
+        return app
+
+    async def run(app) -> Tuple[float, int]:
+        runner = Runner(app=app, session_service=InMemorySessionService())
+        started = time.perf_counter()
+        retries = 0
+        for i in range(orders):
+            session = await runner.session_service.create_session(app_name="ShippingApp", user_id="u1")
+            message = types.Content(role="user", parts=[types.Part(text=f"Ship 10 containers to Port{i}")])
+            request = None
+            async for event in runner.run_async(user_id="u1", session_id=session.id, new_message=message):
+                request = request or next(iter(confirmation_requests(event)), None)
+            for attempt in range(3):  # what ApprovalQueue does with a failed resume
+                try:
+                    async for _ in runner.run_async(user_id="u1", session_id=session.id,
+                                                    invocation_id=request["invocation_id"],
+                                                    new_message=approval_response(request["approval_id"], True)):
+                        pass
+                    break
+                except RuntimeError:
+                    retries += 1
+        return time.perf_counter() - started, retries
+
+    print(f"📊 {orders} approved orders, {failure_rate:.0%} hit a model error after booking and are retried "
+          f"(booking latency {booking_latency * 1000:.0f} ms)")
+    with tempfile.TemporaryDirectory() as tmp:
+        bookings: Dict[str, int] = {}
+        elapsed, retries = await run(shipping_app(bookings))
+        print(f"   without idempotency: {sum(bookings.values())} bookings for {len(bookings)} orders "
+              f"({retries} retries) in {elapsed:.2f}s")
+
+        bookings = {}
+        plugin = IdempotencyPlugin(["place_shipping_order"], db_path=os.path.join(tmp, "results.db"),
+                                   max_entries=max_entries)
+        elapsed, retries = await run(shipping_app(bookings, [plugin]))
+        print(f"   with IdempotencyPlugin: {sum(bookings.values())} bookings for {len(bookings)} orders "
+              f"({retries} retries) in {elapsed:.2f}s")
+        print(f"   metrics {plugin.metrics()}")
+
+        # Replay cost: the key lookup the plugin adds to every call, vs running the booking again.
+        class _Context:
+            def __init__(self, i: int):
+                self.invocation_id, self.function_call_id, self.tool_confirmation = f"e-{i}", f"adk-{i}", None
+                self.actions = type("Actions", (), {"requested_tool_confirmations": {}})()
+
+        class _Tool:
+            name, is_long_running = "place_shipping_order", False
+
+        samples = 2_000
+        probe = IdempotencyPlugin(["place_shipping_order"], db_path=os.path.join(tmp, "probe.db"), memory_entries=samples // 2)
+        for i in range(samples):
+            await probe.before_tool_callback(tool=_Tool, tool_args={"i": i}, tool_context=_Context(i))
+            await probe.after_tool_callback(tool=_Tool, tool_args={"i": i}, tool_context=_Context(i), result={"i": i})
+        started = time.perf_counter()
+        for i in range(samples):
+            assert await probe.before_tool_callback(tool=_Tool, tool_args={"i": i}, tool_context=_Context(i)) == {"i": i}
+        replay = (time.perf_counter() - started) / samples
+        print(f"✅ Replay served in {replay * 1e6:.0f} µs on average (half from memory, half from SQLite) "
+              f"instead of a {booking_latency * 1000:.0f} ms booking")
+        probe.close()
+        plugin.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,65 @@
+import os
+import sys
+import asyncio
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+# Tiny stdio MCP server for local tests and benchmarks
+
+# Why: MCP.py talks to `npx @modelcontextprotocol/server-everything`, which needs node, the network and
+# a few seconds per start. The pool and client benchmarks need a server that starts anywhere.
+# What this does:
+    # getTinyImage (same name as in server-everything), add, and crash (exits the process, to test restarts)
+    # LOCAL_MCP_STARTUP_DELAY=<seconds> simulates a slow start (npx resolving and booting a package)
+    # LOCAL_MCP_EXTRA_TOOLS=1 also serves multiply, i.e. a newer release with a changed tool list
+    # lookup waits LOCAL_MCP_LATENCY seconds; with LOCAL_MCP_BLOCKING=1 it blocks the process, so the
+    #   server handles one request at a time (a single-threaded server)
+# Run with: StdioServerParameters(command=sys.executable, args=["localMcpServer.py"])
+
+_LATENCY = float(os.getenv("LOCAL_MCP_LATENCY", "0"))
+_BLOCKING = bool(os.getenv("LOCAL_MCP_BLOCKING"))
+_TINY_PNG = ("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==")
+
+server = FastMCP("local-stand-in", log_level="WARNING")
+
+
+@server.tool(name="getTinyImage")
+def get_tiny_image() -> dict:
+    """Returns a 1x1 PNG image, base64 encoded."""
+    return {"mimeType": "image/png", "data": _TINY_PNG}
+
+
+@server.tool()
+def add(a: int, b: int) -> int:
+    """Adds two numbers."""
+    return a + b
+
+
+@server.tool()
+async def lookup(key: str) -> str:
+    """Looks a key up in a slow backend."""
+    if _BLOCKING:
+        time.sleep(_LATENCY)
+    else:
+        await asyncio.sleep(_LATENCY)
+    return f"value-{key}"
+
+
+@server.tool()
+def crash() -> str:
+    """Exits the server process immediately."""
+    os._exit(1)
+
+
+if os.getenv("LOCAL_MCP_EXTRA_TOOLS"):
+    @server.tool()
+    def multiply(a: int, b: int) -> int:
+        """Multiplies two numbers."""
+        return a * b
+
+
+if __name__ == "__main__":
+    time.sleep(float(os.getenv("LOCAL_MCP_STARTUP_DELAY", "0")))
+    print(f"local MCP server {os.getpid()} ready", file=sys.stderr)
+    server.run("stdio")
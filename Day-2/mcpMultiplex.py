@@ -0,0 +1,220 @@
+import os
+import sys
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp import types as mcp_types
+
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+
+from mcpPool import ConnectionParams, McpServerPool
+
+# Concurrent MCP tool calls: pipelined over a session, fanned out over pooled sessions
+
+# Why: all calls to an McpToolset in MCP.py go through its one stdio session. ClientSession already
+# correlates concurrent JSON-RPC requests by id, so an async server answers them in parallel - but a
+# single-threaded server (blocking tool code) answers one at a time, and nothing bounds how many
+# calls pile up on it or how long a caller waits.
+# What this does:
+    # MultiplexedMcpClient.call_tool() runs on the least-loaded session of an McpServerPool spec,
+    #   over the pool's `size` processes
+    # pipeline_depth caps the requests in flight on each session: 1 for single-threaded servers,
+    #   None (no cap, like a plain ClientSession) for servers that handle requests concurrently
+    # max_in_flight optionally caps the client's calls across all sessions
+    # Calls over either cap queue, and `timeout` covers queueing plus the call, so an overloaded
+    #   server fails fast instead of stalling the agent
+    # client.toolset(...) gives an McpToolset whose tool calls go through the client
+
+logger = logging.getLogger(__name__)
+
+
+class MultiplexedMcpClient:
+    """Concurrency-limited tool calls over one or more pooled sessions of an MCP server."""
+
+    def __init__(
+        self,
+        pool: McpServerPool,
+        connection_params: ConnectionParams,
+        pipeline_depth: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        timeout: Optional[float] = 30.0,
+    ):
+        """
+        Args:
+            pool: Provides the sessions; its `size` is the number of processes calls fan out to.
+            connection_params: The server.
+            pipeline_depth: Requests in flight per session. Use 1 for servers that handle one request at a
+                time; None (no limit) for servers that handle requests concurrently.
+            max_in_flight: Requests in flight over all sessions (None = no limit).
+            timeout: Seconds a call may take, including time spent waiting for a free slot (None = no limit).
+        """
+        self.pool = pool
+        self.connection_params = connection_params
+        self.pipeline_depth = pipeline_depth
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight) if max_in_flight is not None else None
+        self._in_flight = 0
+        self._latencies: List[float] = []
+        self._metrics = {"calls": 0, "errors": 0, "timeouts": 0, "queued": 0, "peak_in_flight": 0}
+
+    async def _call(self, name: str, arguments: Optional[Dict[str, Any]], **kwargs: Any) -> mcp_types.CallToolResult:
+        # lease() picks the process with the fewest calls in flight, and waits while all are at pipeline_depth.
+        async with self.pool.lease(self.connection_params, max_in_use=self.pipeline_depth) as session:
+            self._in_flight += 1
+            self._metrics["peak_in_flight"] = max(self._metrics["peak_in_flight"], self._in_flight)
+            try:
+                return await session.call_tool(name, arguments=arguments, **kwargs)
+            finally:
+                self._in_flight -= 1
+
+    async def _call_within_cap(self, name: str, arguments: Optional[Dict[str, Any]],
+                               **kwargs: Any) -> mcp_types.CallToolResult:
+        if self._slots is None:
+            return await self._call(name, arguments, **kwargs)
+        if self._slots.locked():
+            self._metrics["queued"] += 1
+        async with self._slots:
+            return await self._call(name, arguments, **kwargs)
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                        timeout: Optional[float] = None, **kwargs: Any) -> mcp_types.CallToolResult:
+        """Same as ClientSession.call_tool, within the client's concurrency limit and timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        self._metrics["calls"] += 1
+        try:
+            result = await asyncio.wait_for(self._call_within_cap(name, arguments, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._metrics["timeouts"] += 1
+            raise
+        except Exception:
+            self._metrics["errors"] += 1
+            raise
+        self._latencies.append(time.perf_counter() - started)
+        return result
+
+    def toolset(self, toolset_class: type = McpToolset, **kwargs: Any) -> McpToolset:
+        """An McpToolset (or subclass, same arguments) whose calls go through this client."""
+        toolset = toolset_class(connection_params=self.connection_params, **kwargs)
+        toolset._mcp_session_manager = _MultiplexedSessionManager(self)
+        return toolset
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            **self._metrics,
+            "in_flight": self._in_flight,
+            "depth_waits": self.pool.metrics()["depth_waits"],
+            "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        }
+
+
+class _RoutedSession:
+    """What MCPTool and McpToolset see: call_tool goes through the client, the rest to a pooled session."""
+
+    def __init__(self, client: MultiplexedMcpClient, session: ClientSession):
+        self._client = client
+        self._session = session
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                        read_timeout_seconds: Optional[timedelta] = None, **kwargs: Any) -> mcp_types.CallToolResult:
+        timeout = read_timeout_seconds.total_seconds() if read_timeout_seconds else None
+        return await self._client.call_tool(name, arguments, timeout=timeout, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+
+class _MultiplexedSessionManager:
+    """Stands in for MCPSessionManager: sessions come from the pool, tool calls go through the client."""
+
+    def __init__(self, client: MultiplexedMcpClient):
+        self._client = client
+
+    async def create_session(self, headers: Optional[Dict[str, str]] = None) -> _RoutedSession:
+        return _RoutedSession(self._client, await self._client.pool.session(self._client.connection_params))
+
+    async def close(self) -> None:
+        """Sessions belong to the pool."""
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(calls: int = 200, latency: float = 0.05, sessions: int = 4, capped_depth: int = 8):
+    """Throughput of `calls` concurrent tool calls against a stand-in server with `latency` per call."""
+    from google.adk.tools.mcp_tool.mcp_session_manager import MCPSessionManager
+
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "localMcpServer.py")
+    errlog = open(os.devnull, "w")
+
+    def params(blocking: bool) -> StdioConnectionParams:
+        env = {**os.environ, "LOCAL_MCP_LATENCY": str(latency)}
+        if blocking:
+            env["LOCAL_MCP_BLOCKING"] = "1"
+        return StdioConnectionParams(server_params=StdioServerParameters(command=sys.executable, args=[server], env=env),
+                                     timeout=60)
+
+    async def run(call) -> float:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(i) for i in range(calls)))
+        assert all(result.content[0].text == f"value-{i}" for i, result in enumerate(results))
+        return calls / (time.perf_counter() - started)
+
+    print(f"📊 {calls} concurrent tool calls, {latency * 1000:.0f} ms each on the server")
+    for blocking in (False, True):
+        kind = "single-threaded server" if blocking else "concurrent server"
+        manager = MCPSessionManager(params(blocking), errlog=errlog)  # what McpToolset uses
+        session = await manager.create_session()
+        one_at_a_time = asyncio.Lock()  # a caller that awaits each tool call before starting the next
+
+        async def one_by_one(i: int) -> mcp_types.CallToolResult:
+            async with one_at_a_time:
+                return await session.call_tool("lookup", {"key": str(i)})
+
+        if not blocking:
+            print(f"   {kind:23} stock session, one call at a time:  {await run(one_by_one):7.1f} calls/s")
+
+        # A concurrent server gets one process and no depth limit (what a stock session does), plus a
+        # capped depth to show what the cap costs; extra processes would only compete for the same CPUs.
+        # A single-threaded server gets one call per process, over `sessions` processes.
+        pool = McpServerPool(size=sessions if blocking else 1, idle_timeout=None, errlog=errlog)
+        await pool.warm(params(blocking))
+        clients = {depth: MultiplexedMcpClient(pool, params(blocking), pipeline_depth=depth)
+                   for depth in ((1,) if blocking else (None, capped_depth))}
+        # Best of interleaved rounds for the concurrent server: on one CPU, a round's rate depends on what
+        # else is running, and the first rounds on a fresh process are slower.
+        single, multiplexed = 0.0, dict.fromkeys(clients, 0.0)
+        for _ in range(1 if blocking else 3):
+            single = max(single, await run(lambda i: session.call_tool("lookup", {"key": str(i)})))
+            for depth, client in clients.items():
+                multiplexed[depth] = max(multiplexed[depth],
+                                         await run(lambda i: client.call_tool("lookup", {"key": str(i)})))
+        await manager.close()
+        print(f"   {kind:23} stock session, all calls at once: {single:7.1f} calls/s")
+        for depth, client in clients.items():
+            metrics = client.metrics()
+            print(f"   {kind:23} {pool.size} pooled session(s) x depth {depth or 'unlimited'}: "
+                  f"{multiplexed[depth]:7.1f} calls/s ({multiplexed[depth] / single:.2f}x stock; peak in flight "
+                  f"{metrics['peak_in_flight']}, p99 {metrics['p99_ms']:.0f} ms)")
+
+        if blocking:
+            # Overload: twice the calls a 1 s timeout allows; the excess fails fast instead of queueing forever.
+            client.timeout = 1.0
+            outcomes = await asyncio.gather(*(client.call_tool("lookup", {"key": str(i)})
+                                              for i in range(int(2 * sessions / latency))), return_exceptions=True)
+            timeouts = sum(isinstance(outcome, asyncio.TimeoutError) for outcome in outcomes)
+            print(f"✅ Overload with a 1 s timeout: {len(outcomes) - timeouts} served, {timeouts} timed out  "
+                  f"{client.metrics()}")
+        await pool.close()
+    errlog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,416 @@
+import os
+import sys
+import asyncio
+import hashlib
+import json
+import logging
+import statistics
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import timedelta
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, TextIO, Union
+
+from mcp import ClientSession, StdioServerParameters
+from mcp import types as mcp_types
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+
+# Warm process pool for stdio MCP servers
+
+# Why: every McpToolset in MCP.py owns an MCPSessionManager that spawns its own `npx ...` process and
+# runs the MCP handshake on first use - seconds per toolset, paid again by every agent or runner that
+# builds one.
+# What this does:
+    # McpServerPool keeps `size` initialized ClientSessions per server spec (command, args, env, cwd),
+    #   each owned by one task that opens and closes its stdio process (anyio contexts stay in one task)
+    # lease() hands out the least-loaded healthy session and counts the caller as load until it is
+    #   done; pool.toolset(...) builds an McpToolset whose tool calls each take a lease, and whose
+    #   close() leaves the processes running
+    # A janitor pings every session each health_interval: a crashed or unresponsive process is
+    #   replaced, and a spec not used for idle_timeout has all its processes shut down. A lease whose
+    #   call fails with "Connection closed" retires its process right away
+    # Specs are keyed on command, args, cwd and a hash of env, so API keys in env stay out of logs
+    # The next use of a shut-down spec starts it again (a cold start)
+
+logger = logging.getLogger(__name__)
+
+ConnectionParams = Union[StdioServerParameters, StdioConnectionParams]
+
+
+def _stdio(params: ConnectionParams) -> StdioConnectionParams:
+    if isinstance(params, StdioServerParameters):
+        return StdioConnectionParams(server_params=params)
+    return params
+
+
+def spec_key(params: ConnectionParams) -> str:
+    """Servers are pooled per command, args, env and working directory.
+
+    The env often carries API keys, so the key only holds a hash of it (the key shows up in errors and logs).
+    """
+    server = _stdio(params).server_params
+    env = hashlib.sha256(json.dumps(server.env or {}, sort_keys=True).encode()).hexdigest()[:16]
+    return json.dumps({"command": server.command, "args": list(server.args), "env_sha256": env,
+                       "cwd": str(server.cwd) if server.cwd else None}, sort_keys=True)
+
+
+class _Server:
+    """One server process and its initialized session, owned by `task`."""
+
+    __slots__ = ("session", "task", "stop", "ready", "started_at", "in_use")
+
+    def __init__(self):
+        self.session: Optional[ClientSession] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stop = asyncio.Event()
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.started_at = time.perf_counter()
+        self.in_use = 0
+
+    def healthy(self) -> bool:
+        """Initialized, not retired, and its owning task still running. A process that died without the
+        task noticing is caught by the janitor's ping (or by the failed call, see McpServerPool.lease)."""
+        return (self.session is not None and not self.stop.is_set()
+                and self.task is not None and not self.task.done())
+
+
+class _SpecPool:
+    __slots__ = ("params", "servers", "last_used", "lock", "waiters")
+
+    def __init__(self, params: StdioConnectionParams):
+        self.params = params
+        self.servers: List[_Server] = []
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waiters: Deque[asyncio.Future] = deque()  # callers waiting for a lease to end, oldest first
+
+
+class McpServerPool:
+    """Shared, health-checked stdio MCP server processes, leased to toolsets, agents and runners."""
+
+    def __init__(
+        self,
+        size: int = 2,
+        idle_timeout: Optional[float] = 300.0,
+        health_interval: float = 10.0,
+        ping_timeout: float = 5.0,
+        errlog: TextIO = sys.stderr,
+    ):
+        """
+        Args:
+            size: Warm processes kept per server spec.
+            idle_timeout: Seconds without use before a spec's processes are shut down (None = never).
+            health_interval: Seconds between health checks.
+            ping_timeout: A process that does not answer a ping within it is restarted.
+            errlog: Where the servers' stderr goes.
+        """
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.errlog = errlog
+        self._pools: Dict[str, _SpecPool] = {}
+        self._janitor: Optional[asyncio.Task] = None
+        self._metrics = {"starts": 0, "restarts": 0, "start_failures": 0, "cold_waits": 0, "sessions_served": 0,
+                         "health_failures": 0, "idle_shutdowns": 0, "depth_waits": 0}
+        self._start_times: List[float] = []
+
+    # ------------------------------------------------------------------ processes
+
+    async def _own(self, server: _Server, params: StdioConnectionParams) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await stack.enter_async_context(stdio_client(params.server_params, errlog=self.errlog))
+                session = await stack.enter_async_context(
+                    ClientSession(read, write, read_timeout_seconds=timedelta(seconds=params.timeout)))
+                await session.initialize()
+                server.session = session
+                self._start_times.append(time.perf_counter() - server.started_at)
+                server.ready.set_result(session)
+                await server.stop.wait()
+        except BaseException as error:  # a crashed process surfaces here, often as an ExceptionGroup
+            if not server.ready.done():
+                self._metrics["start_failures"] += 1
+                server.ready.set_exception(error if isinstance(error, Exception) else RuntimeError(repr(error)))
+            elif not server.stop.is_set():
+                logger.warning(f"[MCP pool] Server process ended: {error!r}")
+            if isinstance(error, asyncio.CancelledError):
+                raise
+        finally:
+            server.session = None
+
+    def _spawn(self, pool: _SpecPool) -> _Server:
+        server = _Server()
+        server.task = asyncio.get_running_loop().create_task(self._own(server, pool.params))
+        # Read the exception so a failed start is not reported as "never retrieved".
+        server.ready.add_done_callback(lambda future: future.cancelled() or future.exception())
+        pool.servers.append(server)
+        self._metrics["starts"] += 1
+        return server
+
+    async def _retire(self, server: _Server) -> None:
+        server.stop.set()
+        if server.task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(server.task), timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                server.task.cancel()
+
+    async def _fill(self, pool: _SpecPool) -> None:
+        """Replaces dead processes and starts missing ones (without waiting for them)."""
+        for server in list(pool.servers):
+            if server.ready.done() and not server.healthy():
+                pool.servers.remove(server)
+                self._metrics["restarts"] += 1
+                asyncio.get_running_loop().create_task(self._retire(server))
+        while len(pool.servers) < self.size:
+            self._spawn(pool)
+
+    def _pool(self, params: ConnectionParams) -> _SpecPool:
+        key = spec_key(params)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _SpecPool(_stdio(params))
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.get_running_loop().create_task(self._janitor_loop())
+        return pool
+
+    async def warm(self, params: ConnectionParams) -> None:
+        """Starts the spec's processes and waits until all of them are ready."""
+        pool = self._pool(params)
+        async with pool.lock:
+            await self._fill(pool)
+        await asyncio.gather(*(server.ready for server in pool.servers), return_exceptions=True)
+        pool.last_used = time.monotonic()
+
+    async def _acquire(self, pool: _SpecPool, max_in_use: Optional[int] = None) -> _Server:
+        pool.last_used = time.monotonic()
+        cold_waits = 0
+        while cold_waits < 3:
+            async with pool.lock:
+                await self._fill(pool)
+                healthy = [server for server in pool.servers if server.healthy()]
+                starting = [server.ready for server in pool.servers if not server.ready.done()]
+            if healthy:
+                server = min(healthy, key=lambda server: server.in_use)
+                if max_in_use is None or server.in_use < max_in_use:
+                    return server
+                # Every process is at max_in_use: wait for a lease to end.
+                self._metrics["depth_waits"] += 1
+                waiter = asyncio.get_running_loop().create_future()
+                pool.waiters.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:  # e.g. the caller's timeout
+                    if waiter.done():
+                        self._wake_one(pool)  # pass the freed slot on
+                    else:
+                        pool.waiters.remove(waiter)
+                    raise
+                continue
+            self._metrics["cold_waits"] += 1
+            cold_waits += 1
+            done, _ = await asyncio.wait(starting, return_when=asyncio.FIRST_COMPLETED)
+            if all(future.exception() for future in done) and cold_waits == 3:
+                raise next(iter(done)).exception()
+        raise RuntimeError(f"No healthy MCP server for {spec_key(pool.params)}")
+
+    @staticmethod
+    def _wake_one(pool: _SpecPool) -> None:
+        """A lease ended: the oldest caller waiting on max_in_use retries."""
+        while pool.waiters:
+            waiter = pool.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def session(self, params: ConnectionParams) -> ClientSession:
+        """An initialized session of a healthy process (started on demand).
+
+        The caller is not counted as load, so sessions handed out this way are not balanced across
+        processes. Good for discovery (list_tools); calls should go through lease().
+        """
+        server = await self._acquire(self._pool(params))
+        self._metrics["sessions_served"] += 1
+        return server.session
+
+    @asynccontextmanager
+    async def lease(self, params: ConnectionParams, max_in_use: Optional[int] = None) -> AsyncIterator[ClientSession]:
+        """Like session(), but counts the caller as load on that process until the block exits.
+
+        Args:
+            params: The server.
+            max_in_use: Leases a process may carry at once; when all are at it, waits for one to end
+                (None = no limit).
+        """
+        pool = self._pool(params)
+        server = await self._acquire(pool, max_in_use)
+        self._metrics["sessions_served"] += 1
+        server.in_use += 1
+        try:
+            yield server.session
+        except McpError as error:
+            if error.error.code == mcp_types.CONNECTION_CLOSED:
+                server.stop.set()  # the process is gone; the next _fill() replaces it
+            raise
+        finally:
+            server.in_use -= 1
+            pool.last_used = time.monotonic()
+            self._wake_one(pool)
+
+    # ------------------------------------------------------------------ health and idle
+
+    async def _check(self, server: _Server) -> bool:
+        if not server.healthy():
+            return False
+        try:
+            await asyncio.wait_for(server.session.send_ping(), timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _janitor_loop(self) -> None:
+        while self._pools:
+            await asyncio.sleep(self.health_interval)
+            for pool in list(self._pools.values()):
+                # A spec still starting up (e.g. inside warm()) is not idle.
+                busy = any(server.in_use or not server.ready.done() for server in pool.servers)
+                if (self.idle_timeout is not None and not busy and pool.servers
+                        and time.monotonic() - pool.last_used > self.idle_timeout):
+                    async with pool.lock:
+                        servers, pool.servers = pool.servers, []
+                    self._metrics["idle_shutdowns"] += 1
+                    await asyncio.gather(*(self._retire(server) for server in servers))
+                    continue
+                ready = [server for server in pool.servers if server.ready.done()]
+                results = await asyncio.gather(*(self._check(server) for server in ready))
+                failed = [server for server, ok in zip(ready, results) if not ok]
+                if failed:
+                    self._metrics["health_failures"] += len(failed)
+                    async with pool.lock:
+                        for server in failed:
+                            if server in pool.servers:
+                                pool.servers.remove(server)
+                                self._metrics["restarts"] += 1
+                        await self._fill(pool)
+                    await asyncio.gather(*(self._retire(server) for server in failed))
+
+    async def close(self) -> None:
+        if self._janitor is not None:
+            self._janitor.cancel()
+            await asyncio.gather(self._janitor, return_exceptions=True)
+        pools, self._pools = self._pools, {}
+        await asyncio.gather(*(self._retire(server) for pool in pools.values() for server in pool.servers))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "specs": len(self._pools),
+            "processes": sum(len(pool.servers) for pool in self._pools.values()),
+            "healthy": sum(server.healthy() for pool in self._pools.values() for server in pool.servers),
+            "start_p50_ms": statistics.median(self._start_times) * 1000 if self._start_times else 0.0,
+        }
+
+    # ------------------------------------------------------------------ ADK
+
+    def toolset(self, connection_params: ConnectionParams, toolset_class: type = McpToolset,
+                **kwargs: Any) -> McpToolset:
+        """An McpToolset (or subclass, same arguments) whose tools run on pooled processes."""
+        toolset = toolset_class(connection_params=connection_params, **kwargs)
+        toolset._mcp_session_manager = PooledSessionManager(self, connection_params)
+        return toolset
+
+
+class _LeasedSession:
+    """What McpTool and McpToolset see: call_tool takes a lease, the rest goes to a pooled session."""
+
+    def __init__(self, pool: McpServerPool, connection_params: ConnectionParams, session: ClientSession):
+        self._pool = pool
+        self._connection_params = connection_params
+        self._session = session
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                        read_timeout_seconds: Optional[timedelta] = None, **kwargs: Any) -> mcp_types.CallToolResult:
+        async with self._pool.lease(self._connection_params) as session:
+            return await session.call_tool(name, arguments, read_timeout_seconds=read_timeout_seconds, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+
+class PooledSessionManager:
+    """Stands in for MCPSessionManager: create_session() hands out a pooled session, close() keeps it."""
+
+    def __init__(self, pool: McpServerPool, connection_params: ConnectionParams):
+        self._pool = pool
+        self._connection_params = connection_params
+
+    async def create_session(self, headers: Optional[Dict[str, str]] = None) -> _LeasedSession:
+        return _LeasedSession(self._pool, self._connection_params, await self._pool.session(self._connection_params))
+
+    async def close(self) -> None:
+        """The pool owns the processes; they outlive any single toolset."""
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(runs: int = 10, startup_delay: float = 1.0, size: int = 2):
+    """Latency of a toolset's first use (discovery + one call): a fresh McpToolset vs a pooled one."""
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "localMcpServer.py")
+    params = StdioConnectionParams(
+        server_params=StdioServerParameters(command=sys.executable, args=[server],
+                                            env={**os.environ, "LOCAL_MCP_STARTUP_DELAY": str(startup_delay)}),
+        timeout=30,
+    )
+    errlog = open(os.devnull, "w")
+
+    async def first_use(toolset: McpToolset) -> float:
+        started = time.perf_counter()
+        tools = {tool.name: tool for tool in await toolset.get_tools()}
+        session = await toolset._mcp_session_manager.create_session()
+        result = await session.call_tool("add", {"a": 2, "b": 3})
+        assert "add" in tools and result.content[0].text == "5"
+        elapsed = time.perf_counter() - started
+        await toolset.close()
+        return elapsed
+
+    print(f"📊 First use of an MCP toolset (list_tools + one call), {runs} runs, "
+          f"local Python server with {startup_delay:.1f}s simulated startup")
+    cold = [await first_use(McpToolset(connection_params=params, errlog=errlog)) for _ in range(runs)]
+    print(f"   fresh McpToolset:  p50 {statistics.median(cold) * 1000:8.1f} ms   max {max(cold) * 1000:8.1f} ms")
+
+    pool = McpServerPool(size=size, health_interval=0.5, idle_timeout=3.0, errlog=errlog)
+    started = time.perf_counter()
+    await pool.warm(params)
+    warm_up = time.perf_counter() - started
+    warm = [await first_use(pool.toolset(params)) for _ in range(runs)]
+    print(f"   pooled McpToolset: p50 {statistics.median(warm) * 1000:8.1f} ms   max {max(warm) * 1000:8.1f} ms   "
+          f"({size} processes warmed once in {warm_up:.2f}s)")
+
+    # Crash: the janitor notices, restarts the process, and calls keep going on the healthy one meanwhile.
+    try:
+        async with pool.lease(params) as session:
+            await asyncio.wait_for(session.call_tool("crash", {}), timeout=2)
+    except Exception:
+        pass
+    started = time.perf_counter()
+    calls = 0
+    while pool.metrics()["healthy"] < size:
+        async with pool.lease(params) as session:
+            calls += (await session.call_tool("add", {"a": 1, "b": 1})).content[0].text == "2"
+        await asyncio.sleep(0.05)
+    print(f"✅ Crashed process replaced in {time.perf_counter() - started:.2f}s; {calls} calls succeeded meanwhile")
+
+    await asyncio.sleep(4.0)  # idle_timeout
+    print(f"✅ After {pool.idle_timeout:.0f}s idle: {pool.metrics()['processes']} processes running")
+    print(f"   metrics {pool.metrics()}")
+    await pool.close()
+    errlog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,282 @@
+import os
+import sys
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from mcp import StdioServerParameters
+from mcp import types as mcp_types
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+from google.adk.tools.mcp_tool.mcp_tool import McpTool
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+
+# Persistent cache of MCP tool discovery (list_tools)
+
+# Why: every McpToolset in MCP.py starts its server and runs list_tools before the agent can use a
+# single tool, although server-everything and the Kaggle server return the same schemas every time.
+# The tool_filter is applied only after the whole list has arrived.
+# What this does:
+    # ToolDiscoveryCache stores each server's tool declarations in SQLite, keyed by command/args/cwd
+    #   (or url) and an optional declared version, with a hash of the schemas
+    # CachedMcpToolset.get_tools() registers tools from the cache without touching the server; a list
+    #   tool_filter is applied before any McpTool is built. Only a cache miss waits for discovery
+    # A background refresh (at startup, then every refresh_interval) re-runs list_tools, rewrites the
+    #   cache and, if the schema hash changed, swaps in the new declarations - the next get_tools
+    #   (ADK calls it for every LLM request) returns them
+    # Works with McpServerPool: pool.toolset(params, toolset_class=CachedMcpToolset, cache=...)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_discovery (
+    key          TEXT PRIMARY KEY,
+    spec         TEXT NOT NULL,
+    schema_hash  TEXT NOT NULL,
+    tools        TEXT NOT NULL,
+    fetched_at   REAL NOT NULL,
+    validated_at REAL NOT NULL
+);
+"""
+
+
+def discovery_key(connection_params: Any, server_version: Optional[str] = None) -> str:
+    """Identity of a server's tool list. env is left out: it holds credentials, not schemas."""
+    if isinstance(connection_params, StdioServerParameters):
+        connection_params = StdioConnectionParams(server_params=connection_params)
+    if isinstance(connection_params, StdioConnectionParams):
+        server = connection_params.server_params
+        spec = {"command": server.command, "args": list(server.args), "cwd": str(server.cwd) if server.cwd else None}
+    else:
+        spec = {"url": connection_params.url}
+    spec["version"] = server_version
+    return json.dumps(spec, sort_keys=True)
+
+
+def schema_hash(tools: List[mcp_types.Tool]) -> str:
+    encoded = json.dumps(sorted((tool.model_dump(mode="json", exclude_none=True) for tool in tools),
+                                key=lambda tool: tool["name"]), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ToolDiscoveryCache:
+    """list_tools results per server, kept across restarts."""
+
+    def __init__(self, db_path: str = "mcp_tool_cache.db"):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT schema_hash, tools, fetched_at, validated_at FROM tool_discovery WHERE key = ?",
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        return {"schema_hash": row[0], "tools": [mcp_types.Tool.model_validate(tool) for tool in json.loads(row[1])],
+                "fetched_at": row[2], "validated_at": row[3]}
+
+    def put(self, key: str, tools: List[mcp_types.Tool], digest: str) -> bool:
+        """Stores a discovery result. True if it differs from the cached one."""
+        now = time.time()
+        with self._db:
+            previous = self._db.execute("SELECT schema_hash FROM tool_discovery WHERE key = ?", (key,)).fetchone()
+            if previous is not None and previous[0] == digest:
+                self._db.execute("UPDATE tool_discovery SET validated_at = ? WHERE key = ?", (now, key))
+                return False
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_discovery (key, spec, schema_hash, tools, fetched_at, validated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, key, digest, json.dumps([tool.model_dump(mode="json", exclude_none=True) for tool in tools]),
+                 now, now),
+            )
+        return True
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class CachedMcpToolset(McpToolset):
+    """McpToolset that registers tools from a discovery cache and revalidates it in the background."""
+
+    def __init__(
+        self,
+        *,
+        connection_params: Any,
+        cache: ToolDiscoveryCache,
+        server_version: Optional[str] = None,
+        refresh_interval: Optional[float] = 3600.0,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            connection_params: As for McpToolset.
+            cache: Where discovery results are kept.
+            server_version: Part of the cache key; bump it to ignore entries of an older release.
+            refresh_interval: Seconds between background revalidations (None = only at startup).
+            **kwargs: Passed to McpToolset (tool_filter, tool_name_prefix, ...).
+        """
+        super().__init__(connection_params=connection_params, **kwargs)
+        self._cache = cache
+        self._cache_key = discovery_key(connection_params, server_version)
+        self._refresh_interval = refresh_interval
+        self._tools: Optional[List[McpTool]] = None
+        self._schema_hash: Optional[str] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._last_refresh = 0.0
+        self.metrics = {"cache_hits": 0, "cache_misses": 0, "refreshes": 0, "refresh_failures": 0, "swaps": 0}
+
+    def _install(self, declarations: List[mcp_types.Tool], digest: str) -> None:
+        if isinstance(self.tool_filter, list):
+            declarations = [declaration for declaration in declarations if declaration.name in self.tool_filter]
+        # A single assignment: get_tools sees either the old list or the new one.
+        self._tools = [
+            McpTool(mcp_tool=declaration, mcp_session_manager=self._mcp_session_manager,
+                    auth_scheme=self._auth_scheme, auth_credential=self._auth_credential,
+                    require_confirmation=self._require_confirmation, header_provider=self._header_provider)
+            for declaration in declarations
+        ]
+        self._schema_hash = digest
+
+    async def refresh(self, readonly_context: Optional[ReadonlyContext] = None) -> bool:
+        """Runs list_tools on the server and updates the cache. True if the declarations changed.
+
+        Args:
+            readonly_context: Passed to the header_provider, as McpToolset.get_tools does.
+        """
+        self._last_refresh = time.monotonic()
+        headers = (self._header_provider(readonly_context)
+                   if self._header_provider and readonly_context else None)
+        session = await self._mcp_session_manager.create_session(headers=headers)
+        declarations: List[mcp_types.Tool] = []
+        cursor = None
+        while True:
+            result = await session.list_tools(params=mcp_types.PaginatedRequestParams(cursor=cursor) if cursor else None)
+            declarations.extend(result.tools)
+            cursor = result.nextCursor
+            if not cursor:
+                break
+        digest = schema_hash(declarations)
+        self._cache.put(self._cache_key, declarations, digest)
+        self.metrics["refreshes"] += 1
+        if digest == self._schema_hash:
+            return False
+        if self._schema_hash is not None:
+            self.metrics["swaps"] += 1
+            logger.info(f"[MCP cache] Tool declarations changed for {self._cache_key}; swapped in "
+                        f"{len(declarations)} tools")
+        self._install(declarations, digest)
+        return True
+
+    async def _refresh_quietly(self, readonly_context: Optional[ReadonlyContext]) -> None:
+        try:
+            await self.refresh(readonly_context)
+        except Exception as error:
+            # The cached declarations stay in use; the next interval tries again.
+            self.metrics["refresh_failures"] += 1
+            logger.warning(f"[MCP cache] Refresh failed for {self._cache_key}: {error!r}")
+
+    def _schedule_refresh(self, readonly_context: Optional[ReadonlyContext]) -> None:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.get_running_loop().create_task(self._refresh_quietly(readonly_context))
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        if self._tools is None:
+            record = self._cache.get(self._cache_key)
+            if record is not None:
+                self.metrics["cache_hits"] += 1
+                self._install(record["tools"], record["schema_hash"])
+                self._schedule_refresh(readonly_context)
+            else:
+                self.metrics["cache_misses"] += 1
+                await self.refresh(readonly_context)
+        elif (self._refresh_interval is not None
+              and time.monotonic() - self._last_refresh > self._refresh_interval):
+            self._schedule_refresh(readonly_context)
+        tools = self._tools
+        if isinstance(self.tool_filter, list):
+            return list(tools)
+        return [tool for tool in tools if self._is_tool_selected(tool, readonly_context)]
+
+    async def wait_for_refresh(self) -> None:
+        if self._refreshing is not None:
+            await asyncio.shield(self._refreshing)
+
+    async def close(self) -> None:
+        if self._refreshing is not None and not self._refreshing.done():
+            self._refreshing.cancel()
+            await asyncio.gather(self._refreshing, return_exceptions=True)
+        await super().close()
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(runs: int = 5, startup_delay: float = 1.0):
+    """Time until a toolset's tools are registered (get_tools returns), with and without the cache."""
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "localMcpServer.py")
+    errlog = open(os.devnull, "w")
+
+    def params(**env: str) -> StdioConnectionParams:
+        return StdioConnectionParams(
+            server_params=StdioServerParameters(
+                command=sys.executable, args=[server],
+                env={**os.environ, "LOCAL_MCP_STARTUP_DELAY": str(startup_delay), **env}),
+            timeout=30,
+        )
+
+    async def startup(toolset: McpToolset) -> float:
+        started = time.perf_counter()
+        names = [tool.name for tool in await toolset.get_tools()]
+        elapsed = time.perf_counter() - started
+        assert names == ["getTinyImage"], names
+        if isinstance(toolset, CachedMcpToolset):
+            await toolset.wait_for_refresh()
+        await toolset.close()
+        return elapsed
+
+    print(f"📊 Startup until tools are registered, {runs} runs, local server with {startup_delay:.1f}s simulated startup")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ToolDiscoveryCache(os.path.join(tmp, "tools.db"))
+        results = {
+            "McpToolset": [await startup(McpToolset(connection_params=params(), tool_filter=["getTinyImage"],
+                                                    errlog=errlog)) for _ in range(runs)],
+            "CachedMcpToolset, empty cache": [],
+            "CachedMcpToolset, cached": [],
+        }
+        for _ in range(runs):
+            empty = ToolDiscoveryCache(os.path.join(tmp, f"empty-{time.monotonic_ns()}.db"))
+            results["CachedMcpToolset, empty cache"].append(await startup(CachedMcpToolset(
+                connection_params=params(), cache=empty, tool_filter=["getTinyImage"], errlog=errlog)))
+            empty.close()
+        await startup(CachedMcpToolset(connection_params=params(), cache=cache, tool_filter=["getTinyImage"],
+                                       errlog=errlog))  # fills the shared cache
+        for _ in range(runs):
+            results["CachedMcpToolset, cached"].append(await startup(CachedMcpToolset(
+                connection_params=params(), cache=cache, tool_filter=["getTinyImage"], errlog=errlog)))
+        for name, times in results.items():
+            print(f"   {name:30} p50 {statistics.median(times) * 1000:8.1f} ms   max {max(times) * 1000:8.1f} ms")
+
+        # A server upgrade adds a tool: the stale cache serves the startup, the refresh swaps the new list in.
+        toolset = CachedMcpToolset(connection_params=params(LOCAL_MCP_EXTRA_TOOLS="1"), cache=cache, errlog=errlog)
+        started = time.perf_counter()
+        before = sorted(tool.name for tool in await toolset.get_tools())
+        registered = time.perf_counter() - started
+        await toolset.wait_for_refresh()
+        after = sorted(tool.name for tool in await toolset.get_tools())
+        print(f"✅ Server upgrade: registered {before} from cache in {registered * 1000:.1f} ms, "
+              f"swapped to {after} after {time.perf_counter() - started:.2f}s  {toolset.metrics}")
+        await toolset.close()
+        cache.close()
+    errlog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
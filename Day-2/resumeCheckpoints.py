@@ -0,0 +1,391 @@
+import os
+import asyncio
+import json
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig
+from google.adk.events import Event
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import Session
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
+from google.adk.utils.context_utils import Aclosing
+from google.genai import types
+
+# Resume checkpoints for paused invocations
+
+# Why: run_async(invocation_id=...) in LRO.py rebuilds a paused invocation from the session history.
+# get_session decodes every event, the runner scans them for the user message and agent states, and
+# the contents processor copies them all into the LLM request. At 5k events that is ~2 s per resume.
+# What this does:
+    # CheckpointPlugin keeps the invocation's agent states up to date as events are stored (O(1) each)
+    #   and writes a checkpoint row the moment the invocation pauses: agent path, pending tool calls and
+    #   their args, user message, agent states, and where the context window starts
+    # CheckpointRunner: a resume with a checkpoint restores the invocation context from that row and
+    #   loads the session with GetSessionConfig(after_timestamp=window start), i.e. the invocation's own
+    #   events plus `context_events` events before it - independent of how long the history is
+    # context_events=None keeps the full history in the resumed LLM request (stock behaviour, only the
+    #   scans are skipped); a window also drops compaction summaries older than it
+    # The checkpoint is deleted once the invocation has finished; without one, resume is unchanged
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resume_checkpoints (
+    invocation_id TEXT PRIMARY KEY,
+    app_name      TEXT NOT NULL,
+    user_id       TEXT NOT NULL,
+    session_id    TEXT NOT NULL,
+    agent_path    TEXT NOT NULL,
+    pending_calls TEXT NOT NULL,
+    user_message  TEXT,
+    agent_states  TEXT NOT NULL,
+    end_of_agents TEXT NOT NULL,
+    window_start  REAL,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resume_checkpoints_session ON resume_checkpoints (app_name, user_id, session_id);
+"""
+
+_COLUMNS = ("invocation_id", "app_name", "user_id", "session_id", "agent_path", "pending_calls", "user_message",
+            "agent_states", "end_of_agents", "window_start", "created_at")
+_JSON_COLUMNS = ("pending_calls", "user_message", "agent_states", "end_of_agents")
+
+
+class ResumeCheckpointStore:
+    """One SQLite row per paused invocation."""
+
+    def __init__(self, db_path: str = "resume_checkpoints.db"):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def put(self, checkpoint: Dict[str, Any]) -> None:
+        values = [json.dumps(checkpoint[column], default=str) if column in _JSON_COLUMNS else checkpoint[column]
+                  for column in _COLUMNS]
+        with self._db:
+            self._db.execute(f"INSERT OR REPLACE INTO resume_checkpoints ({', '.join(_COLUMNS)})"
+                             f" VALUES ({', '.join('?' * len(_COLUMNS))})", values)
+
+    def get(self, invocation_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM resume_checkpoints WHERE invocation_id = ?",
+                               (invocation_id,)).fetchone()
+        if row is None:
+            return None
+        checkpoint = dict(zip(_COLUMNS, row))
+        for column in _JSON_COLUMNS:
+            checkpoint[column] = json.loads(checkpoint[column])
+        return checkpoint
+
+    def delete(self, invocation_id: str) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM resume_checkpoints WHERE invocation_id = ?", (invocation_id,))
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT count(*) FROM resume_checkpoints").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def _pending_calls(event: Event) -> List[Dict[str, Any]]:
+    """The long-running calls of an event; confirmation requests are unwrapped to the tool call they guard."""
+    calls = []
+    for call in event.get_function_calls():
+        if call.id not in (event.long_running_tool_ids or ()):
+            continue
+        pending = {"id": call.id, "name": call.name, "args": call.args or {}}
+        if call.name == "adk_request_confirmation":
+            original = (call.args or {}).get("originalFunctionCall") or {}
+            pending = {"id": original.get("id"), "name": original.get("name"), "args": original.get("args") or {},
+                       "confirmation_id": call.id,
+                       "hint": ((call.args or {}).get("toolConfirmation") or {}).get("hint")}
+        calls.append(pending)
+    return calls
+
+
+class CheckpointPlugin(BasePlugin):
+    """Tracks each invocation's agent states and checkpoints it when it pauses."""
+
+    def __init__(self, store: ResumeCheckpointStore, context_events: Optional[int] = 20,
+                 name: str = "resume_checkpoints"):
+        super().__init__(name=name)
+        self.store = store
+        self.context_events = context_events
+        self._live: Dict[str, Dict[str, Any]] = {}
+        self.written = 0
+
+    async def before_run_callback(self, *, invocation_context: InvocationContext) -> Optional[types.Content]:
+        ctx = invocation_context
+        previous = self.store.get(ctx.invocation_id)
+        window_start = previous["window_start"] if previous else None
+        if previous is None and self.context_events is not None:
+            # Only this invocation's own events are walked - just its user message for a new invocation.
+            events = ctx.session.events
+            first = len(events) - 1
+            while first > 0 and events[first - 1].invocation_id == ctx.invocation_id:
+                first -= 1
+            if events:
+                window_start = events[max(0, first - self.context_events)].timestamp
+        self._live[ctx.invocation_id] = {
+            "agent_states": dict(ctx.agent_states),
+            "end_of_agents": dict(ctx.end_of_agents),
+            "window_start": window_start,
+            "user_message": ctx.user_content.model_dump(mode="json", exclude_none=True) if ctx.user_content else None,
+            "paused_by": None,
+            "run": ctx,  # a resume reuses the invocation id, so discard() checks which run this is
+        }
+        if previous and previous["user_message"]:
+            # On resume user_content is the confirmation response; keep the message that started the invocation.
+            self._live[ctx.invocation_id]["user_message"] = previous["user_message"]
+        return None
+
+    async def on_event_callback(self, *, invocation_context: InvocationContext, event: Event) -> Optional[Event]:
+        live = self._live.get(invocation_context.invocation_id)
+        if live is None or event.partial:
+            return None
+        # Same rules as InvocationContext.populate_invocation_agent_states, one event at a time.
+        if event.actions.end_of_agent:
+            live["end_of_agents"][event.author] = True
+            live["agent_states"].pop(event.author, None)
+        elif event.actions.agent_state is not None:
+            live["agent_states"][event.author] = event.actions.agent_state
+            live["end_of_agents"][event.author] = False
+        elif event.author != "user" and event.content and not live["agent_states"].get(event.author):
+            live["agent_states"][event.author] = {}
+            live["end_of_agents"][event.author] = False
+        if event.long_running_tool_ids and event.content:
+            live["paused_by"] = event
+            self._write(invocation_context, live)  # durable as soon as the pause exists
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        live = self._live.pop(invocation_context.invocation_id, None)
+        if live is None:
+            return
+        if live["paused_by"] is not None:
+            self._write(invocation_context, live)
+        else:
+            self.store.delete(invocation_context.invocation_id)
+
+    def discard(self, invocation_context: InvocationContext) -> None:
+        """Drops the tracking of a run that ended without after_run_callback (an error, or the caller
+        stopped reading events). A pause that happened before is already checkpointed."""
+        live = self._live.get(invocation_context.invocation_id)
+        if live is not None and live["run"] is invocation_context:
+            del self._live[invocation_context.invocation_id]
+
+    def _write(self, ctx: InvocationContext, live: Dict[str, Any]) -> None:
+        event = live["paused_by"]
+        agent = ctx.agent.root_agent.find_agent(event.author) or ctx.agent
+        path = []
+        while agent is not None:
+            path.append(agent.name)
+            agent = agent.parent_agent
+        self.store.put({
+            "invocation_id": ctx.invocation_id,
+            "app_name": ctx.session.app_name,
+            "user_id": ctx.session.user_id,
+            "session_id": ctx.session.id,
+            "agent_path": "/".join(reversed(path)),
+            "pending_calls": _pending_calls(event),
+            "user_message": live["user_message"],
+            "agent_states": live["agent_states"],
+            "end_of_agents": live["end_of_agents"],
+            "window_start": live["window_start"],
+            "created_at": time.time(),
+        })
+        self.written += 1
+
+
+class WindowedSessionService(BaseSessionService):
+    """Delegates to a session service; the next get_session of a session can be limited to a time window."""
+
+    def __init__(self, inner: BaseSessionService):
+        self.inner = inner
+        self._windows: Dict[Tuple[str, str, str], float] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def limit_next_load(self, app_name: str, user_id: str, session_id: str, after_timestamp: float) -> None:
+        self._windows[(app_name, user_id, session_id)] = after_timestamp
+
+    def clear_next_load_limit(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Drops a limit that no get_session used (e.g. the run failed before loading the session)."""
+        self._windows.pop((app_name, user_id, session_id), None)
+
+    async def create_session(self, **kwargs: Any) -> Session:
+        return await self.inner.create_session(**kwargs)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        after_timestamp = self._windows.pop((app_name, user_id, session_id), None)
+        if after_timestamp is not None and config is None:
+            config = GetSessionConfig(after_timestamp=after_timestamp)
+        return await self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        return await self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        return await self.inner.append_event(session, event)
+
+
+class CheckpointRunner(Runner):
+    """Runner whose resumes start from a checkpoint instead of the full session history."""
+
+    def __init__(self, *, checkpoints: ResumeCheckpointStore, context_events: Optional[int] = 20, **kwargs: Any):
+        """
+        Args:
+            checkpoints: Store written at pause time and read on resume.
+            context_events: Events before the paused invocation kept in the resumed context (None = all).
+            **kwargs: Passed to Runner.
+        """
+        super().__init__(**kwargs)
+        self.checkpoints = checkpoints
+        self.session_service = WindowedSessionService(self.session_service)
+        self.checkpoint_plugin = CheckpointPlugin(checkpoints, context_events)
+        self.plugin_manager.register_plugin(self.checkpoint_plugin)
+        self._resuming: Dict[str, Dict[str, Any]] = {}
+        self.checkpoint_resumes = 0
+
+    async def run_async(
+        self,
+        *,
+        user_id: str,
+        session_id: str,
+        invocation_id: Optional[str] = None,
+        new_message: Optional[types.Content] = None,
+        state_delta: Optional[Dict[str, Any]] = None,
+        run_config: Optional[RunConfig] = None,
+    ) -> AsyncGenerator[Event, None]:
+        checkpoint = self.checkpoints.get(invocation_id) if invocation_id else None
+        if checkpoint and (checkpoint["user_id"], checkpoint["session_id"]) == (user_id, session_id):
+            self._resuming[invocation_id] = checkpoint
+            if checkpoint["window_start"] is not None:
+                self.session_service.limit_next_load(self.app_name, user_id, session_id, checkpoint["window_start"])
+        try:
+            async for event in super().run_async(user_id=user_id, session_id=session_id, invocation_id=invocation_id,
+                                                 new_message=new_message, state_delta=state_delta,
+                                                 run_config=run_config):
+                yield event
+        finally:
+            self._resuming.pop(invocation_id, None)
+            self.session_service.clear_next_load_limit(self.app_name, user_id, session_id)
+
+    async def _exec_with_plugin(
+        self,
+        invocation_context: InvocationContext,
+        session: Session,
+        execute_fn: Callable[[InvocationContext], AsyncGenerator[Event, None]],
+        is_live_call: bool = False,
+    ) -> AsyncGenerator[Event, None]:
+        # after_run_callback is skipped when the run raises or its events stop being read.
+        try:
+            async with Aclosing(super()._exec_with_plugin(invocation_context, session, execute_fn,
+                                                          is_live_call=is_live_call)) as events:
+                async for event in events:
+                    yield event
+        finally:
+            self.checkpoint_plugin.discard(invocation_context)
+
+    async def _setup_context_for_resumed_invocation(
+        self,
+        *,
+        session: Session,
+        new_message: Optional[types.Content],
+        invocation_id: Optional[str],
+        run_config: RunConfig,
+        state_delta: Optional[Dict[str, Any]],
+    ) -> InvocationContext:
+        checkpoint = self._resuming.pop(invocation_id, None)
+        if checkpoint is None or not session.events:
+            return await super()._setup_context_for_resumed_invocation(
+                session=session, new_message=new_message, invocation_id=invocation_id,
+                run_config=run_config, state_delta=state_delta)
+
+        user_message = new_message or (
+            types.Content.model_validate(checkpoint["user_message"]) if checkpoint["user_message"] else None)
+        if not user_message:
+            raise ValueError(f"No user message available for resuming invocation: {invocation_id}")
+        invocation_context = self._new_invocation_context(
+            session, new_message=user_message, run_config=run_config, invocation_id=invocation_id)
+        if new_message:
+            await self._handle_new_message(session=session, new_message=user_message,
+                                           invocation_context=invocation_context, run_config=run_config,
+                                           state_delta=state_delta)
+        invocation_context.agent_states = dict(checkpoint["agent_states"])
+        invocation_context.end_of_agents = dict(checkpoint["end_of_agents"])
+        if self.agent.name not in invocation_context.end_of_agents:
+            agent = self.agent.find_agent(checkpoint["agent_path"].rsplit("/", 1)[-1])
+            invocation_context.agent = agent or self._find_agent_to_run(session, self.agent)
+        self.checkpoint_resumes += 1
+        return invocation_context
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(history_lengths=(10, 100, 1_000, 10_000), resumes: int = 3, context_events: int = 20):
+    """Resume latency against session length: stock Runner vs CheckpointRunner, on a DatabaseSessionService."""
+    from google.adk.sessions import DatabaseSessionService
+
+    from approvalQueue import _benchmark_app, approval_response, confirmation_requests
+
+    async def pause(runner: Runner, session: Session, i: int) -> Dict[str, Any]:
+        message = types.Content(role="user", parts=[types.Part(text=f"Ship 10 containers to Port{i}")])
+        async for event in runner.run_async(user_id=session.user_id, session_id=session.id, new_message=message):
+            for request in confirmation_requests(event):
+                return request
+
+    async def resume(runner: Runner, session: Session, request: Dict[str, Any]) -> Tuple[float, str]:
+        started = time.perf_counter()
+        texts = []
+        async for event in runner.run_async(user_id=session.user_id, session_id=session.id,
+                                            invocation_id=request["invocation_id"],
+                                            new_message=approval_response(request["approval_id"], True)):
+            texts += [part.text for part in event.content.parts if part.text] if event.content else []
+        return time.perf_counter() - started, " ".join(texts)
+
+    print(f"📊 Resume latency vs session length (median of {resumes}, DatabaseSessionService, "
+          f"checkpoint window {context_events} events)")
+    with tempfile.TemporaryDirectory() as tmp:
+        service = DatabaseSessionService(f"sqlite:///{os.path.join(tmp, 'sessions.db')}")
+        store = ResumeCheckpointStore(os.path.join(tmp, "checkpoints.db"))
+        stock = Runner(app=_benchmark_app(), session_service=service)
+        checkpointed = CheckpointRunner(app=_benchmark_app(), session_service=service, checkpoints=store,
+                                        context_events=context_events)
+        for length in history_lengths:
+            session = await service.create_session(app_name="ShippingApp", user_id="u1")
+            for i in range(length):
+                author = "user" if i % 2 == 0 else "ShippingAgent"
+                await service.append_event(session, Event(
+                    invocation_id=f"e-history-{i // 2}", author=author,
+                    content=types.Content(role="user" if author == "user" else "model",
+                                          parts=[types.Part(text=f"Earlier order {i // 2}: status update " * 8)])))
+            timings = {}
+            for name, runner in (("stock", stock), ("checkpoint", checkpointed)):
+                runs = []
+                for r in range(resumes):
+                    request = await pause(runner, session, r)
+                    runs.append(await resume(runner, session, request))
+                timings[name] = (statistics.median(t for t, _ in runs), {text for _, text in runs})
+            assert timings["stock"][1] == timings["checkpoint"][1]
+            print(f"   {length:6,} events: stock {timings['stock'][0] * 1000:8.1f} ms   "
+                  f"checkpoint {timings['checkpoint'][0] * 1000:6.1f} ms   "
+                  f"({timings['stock'][0] / timings['checkpoint'][0]:5.1f}x)  -> {timings['checkpoint'][1]}")
+        print(f"✅ {checkpointed.checkpoint_resumes} resumes from checkpoints, {len(store)} left (finished ones are deleted), "
+              f"{len(checkpointed.checkpoint_plugin._live)} runs still tracked")
+        store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -14,6 +14,10 @@ from google.adk.memory import InMemoryMemoryService
 from google.adk.tools import load_memory, preload_memory
 from google.genai import types
 
+from bm25MemoryService import BM25MemoryService
+from cachedMemoryService import CachedMemoryService
+from cowSessionService import CopyOnWriteSessionService
+
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -77,8 +81,11 @@ user_agent = LlmAgent(
     tools=[preload_memory]
 )
 
-memory_service = InMemoryMemoryService()
-session_service = InMemorySessionService()
+# BM25 over an inverted index instead of scanning every stored event on each search,
+# wrapped in a cache, so repeated preload_memory lookups skip the search until memory changes
+memory_service = CachedMemoryService(BM25MemoryService(top_k=10))
+# Same as InMemorySessionService, but reads share events instead of deep-copying the history
+session_service = CopyOnWriteSessionService()
 
 runner = Runner(agent=user_agent, app_name=APP_NAME, session_service=session_service, memory_service=memory_service)
 
@@ -125,6 +132,8 @@ async def main():
             text = memory.content.parts[0].text[:80]
             print(f"[{memory.author}]: {text}...")
 
+    print(f"\n📊 Retrieval cache: {memory_service.stats()}")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -11,6 +11,10 @@ from google.adk.sessions import InMemorySessionService
 from google.adk.memory import InMemoryMemoryService
 from google.adk.tools import preload_memory
 
+from cachedMemoryService import CachedMemoryService
+from consolidatingMemoryService import ConsolidatingMemoryService
+from cowSessionService import CopyOnWriteSessionService
+
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -65,11 +69,17 @@ retry_config = types.HttpRetryOptions(
 )
 
 # Initialize Services
-memory_service = InMemoryMemoryService()
-session_service = InMemorySessionService()
+# Saving after every turn only ingests the events added since the previous save (per-session
+# watermark); repeated facts are merged and each user keeps at most 500 memories.
+consolidating_memory = ConsolidatingMemoryService(max_memories_per_user=500, top_k=5)
+# preload_memory searches on every model request; identical lookups are served from a cache
+# that is dropped whenever the user's memory changes (new events or a consolidation pass).
+memory_service = CachedMemoryService(consolidating_memory, max_entries=1024)
+consolidating_memory.on_change = memory_service.invalidate
+session_service = CopyOnWriteSessionService()
 
 async def auto_save_to_memory(callback_context):
-    """Automatically save session to memory after each agent turn."""
+    """Automatically save session to memory after each agent turn (only new events are ingested)."""
     await callback_context._invocation_context.memory_service.add_session_to_memory(
         callback_context._invocation_context.session
     )
@@ -93,6 +103,8 @@ runner = Runner(
 )
 
 async def main():
+    consolidating_memory.start_background_consolidation(interval=30.0)
+
     await run_session(
         runner,
         "I gifted a new Hotwheels car to my nephew on his 1st birthday!",
@@ -105,5 +117,10 @@ async def main():
         "autosave-test-02",
     )
 
+    consolidating_memory.stop_background_consolidation()
+    consolidating_memory.consolidate()
+    print(f"\n📊 Memory metrics: {consolidating_memory.metrics()}")
+    print(f"📊 Retrieval cache: {memory_service.stats()}")
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -15,6 +15,8 @@ from google.adk.runners import Runner
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
+from compactSessionService import CompactInMemorySessionService
+
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -93,7 +95,8 @@ root_agent = Agent(
 
 # Step 2: Set up Session Management
 # InMemorySessionService stores conversations in RAM (temporary)
-session_service = InMemorySessionService()
+# CompactInMemorySessionService does the same with a much smaller memory footprint per event
+session_service = CompactInMemorySessionService()
 
 # Step 3: Create the Runner
 runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
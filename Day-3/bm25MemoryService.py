@@ -0,0 +1,260 @@
+import asyncio
+import bisect
+import heapq
+import math
+import random
+import re
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from google.adk.memory import BaseMemoryService, InMemoryMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai import types
+
+from incrementalMemory import SessionWatermarks
+
+# Inverted-index BM25 memory service
+
+# Why: InMemoryMemoryService scans every stored event of the user on every search_memory call,
+# and preload_memory searches on every turn - latency grows linearly with a user's history.
+# What this does:
+    # One incremental inverted index per (app_name, user_id); new events are indexed as they arrive,
+    #   and a per-session watermark means only events past it are even looked at
+    # Tokenization, stop-word removal and light suffix stemming ("birthdays" -> "birthday")
+    # BM25 ranking; only the top_k memories are returned
+    # MaxScore early termination: once the top_k are known to be safe, the remaining (common)
+    #   query terms only re-score existing candidates instead of walking their whole posting lists
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these they this those
+through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_stem_cache: Dict[str, str] = {}
+
+
+def stem(word: str) -> str:
+    """Light suffix-stripping stemmer (plural, -ing, -ed, -ly, -ness, -ment)."""
+    cached = _stem_cache.get(word)
+    if cached is not None:
+        return cached
+    w = word
+    if len(w) > 4 and w.endswith("ies"):
+        w = w[:-3] + "y"
+    elif w.endswith("sses"):
+        w = w[:-2]
+    elif len(w) > 3 and w.endswith("s") and not w.endswith(("ss", "us", "is")):
+        w = w[:-1]
+    for suffix, min_len in (("ing", 6), ("ed", 5), ("ly", 5), ("ness", 7), ("ment", 7)):
+        if len(w) >= min_len and w.endswith(suffix):
+            w = w[: -len(suffix)]
+            if len(w) > 2 and w[-1] == w[-2] and w[-1] not in "lsz":
+                w = w[:-1]  # "shipping" -> "shipp" -> "ship"
+            break
+    if len(_stem_cache) < 200_000:
+        _stem_cache[word] = w
+    return w
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases, splits, drops stop words and stems."""
+    return [stem(token) for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in STOP_WORDS]
+
+
+class _UserIndex:
+    """Inverted index and document store for one (app_name, user_id)."""
+
+    def __init__(self):
+        # term -> (doc ids, term frequencies). Doc ids only grow, so each list stays sorted.
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        self.texts: List[str] = []
+        self.authors: List[Optional[str]] = []
+        self.roles: List[Optional[str]] = []
+        self.timestamps = array("d")
+        # session id -> ids of the events already indexed (re-adding a session is idempotent)
+        self.indexed_events: Dict[str, Set[str]] = {}
+
+    def add(self, text: str, author: Optional[str], role: Optional[str], timestamp: float) -> None:
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        doc_id = len(self.texts)
+        self.texts.append(text)
+        self.authors.append(author)
+        self.roles.append(role)
+        self.timestamps.append(timestamp)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = (array("I"), array("H"))
+            posting[0].append(doc_id)
+            posting[1].append(min(tf, 65535))
+
+    def search(self, query: str, top_k: int, k1: float, b: float) -> List[Tuple[float, int]]:
+        n_docs = len(self.texts)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+
+        terms = []
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting:
+                df = len(posting[0])
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                terms.append((idf * (k1 + 1), idf, posting))  # idf*(k1+1) bounds a term's score
+        # Rare (high-idf) terms first: they decide the candidates, common terms refine them.
+        terms.sort(key=lambda term: term[0], reverse=True)
+        remaining_bound = sum(term[0] for term in terms)
+
+        scores: Dict[int, float] = {}
+        lengths = self.doc_lengths
+        for upper_bound, idf, (doc_ids, tfs) in terms:
+            remaining_bound -= upper_bound
+            if len(scores) >= top_k and heapq.nlargest(top_k, scores.values())[-1] >= remaining_bound + upper_bound:
+                # No unseen doc can reach the top_k any more: only update known candidates.
+                for doc_id in scores:
+                    i = bisect.bisect_left(doc_ids, doc_id)
+                    if i < len(doc_ids) and doc_ids[i] == doc_id:
+                        tf = tfs[i]
+                        scores[doc_id] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_id] / avg_length))
+                continue
+            for doc_id, tf in zip(doc_ids, tfs):
+                score = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_id] / avg_length))
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+        return heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in scores.items()))
+
+
+class BM25MemoryService(BaseMemoryService):
+    """Memory service with a per-user inverted index and BM25 ranking.
+
+    This class is thread-safe. Only text parts are indexed and returned, which is also all
+    that preload_memory/load_memory put into the prompt.
+    """
+
+    def __init__(self, top_k: int = 10, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            top_k: Maximum number of memories returned per search.
+            k1: BM25 term-frequency saturation.
+            b: BM25 document-length normalization.
+        """
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _UserIndex] = {}
+        self._watermarks = SessionWatermarks()
+
+    def _index(self, app_name: str, user_id: str) -> _UserIndex:
+        key = f"{app_name}/{user_id}"
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = _UserIndex()
+        return index
+
+    def _index_events(self, index: _UserIndex, session_id: str, events: Iterable) -> int:
+        """Indexes the events of a session that were not indexed before."""
+        seen = index.indexed_events.setdefault(session_id, set())
+        added = 0
+        for event in events:
+            if event.id in seen or not event.content or not event.content.parts:
+                continue
+            seen.add(event.id)
+            text = " ".join(part.text for part in event.content.parts if part.text)
+            if text:
+                index.add(text, event.author, event.content.role, event.timestamp)
+                added += 1
+        return added
+
+    async def add_session_to_memory(self, session) -> None:
+        with self._lock:
+            new = self._watermarks.new_events(session)
+            if new:
+                self._index_events(self._index(session.app_name, session.user_id), session.id, new)
+                self._watermarks.advance(session)
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        with self._lock:
+            index = self._indexes.get(f"{app_name}/{user_id}")
+            if index is None:
+                return SearchMemoryResponse()
+            hits = index.search(query, self.top_k, self.k1, self.b)
+            return SearchMemoryResponse(memories=[
+                MemoryEntry(
+                    content=types.Content(role=index.roles[doc_id], parts=[types.Part(text=index.texts[doc_id])]),
+                    author=index.authors[doc_id],
+                    timestamp=datetime.fromtimestamp(index.timestamps[doc_id]).isoformat(),
+                    custom_metadata={"score": round(score, 4)},
+                )
+                for score, doc_id in hits
+            ])
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(sizes=(1_000, 100_000, 1_000_000), queries: int = 50, baseline_limit: int = 100_000):
+    """Measures search latency against InMemoryMemoryService's keyword scan."""
+    from google.adk.events import Event
+    from google.adk.sessions import Session
+
+    rng = random.Random(7)
+    vocabulary = [f"word{i}" for i in range(20_000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf-like word frequencies
+
+    def sentence() -> str:
+        return " ".join(rng.choices(vocabulary, weights=weights, k=12))
+
+    test_queries = [" ".join(rng.choices(vocabulary, weights=weights, k=4)) for _ in range(queries)]
+
+    print(f"📊 search_memory latency ({queries} queries of 4 words, top_k=10)")
+    for size in sizes:
+        bm25 = BM25MemoryService()
+        index = bm25._index("bench", "u1")
+        texts = [sentence() for _ in range(size)]
+        started = time.perf_counter()
+        for i, text in enumerate(texts):
+            index.add(text, "user", "user", 1_700_000_000 + i)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for query in test_queries:
+            await bm25.search_memory(app_name="bench", user_id="u1", query=query)
+        bm25_latency = (time.perf_counter() - started) / queries
+
+        line = f"   {size:>9,} entries  BM25: {bm25_latency * 1000:8.2f} ms/query (index build {build:.1f}s)"
+        if size <= baseline_limit:
+            keyword = InMemoryMemoryService()
+            session = Session(id="s1", app_name="bench", user_id="u1", events=[
+                Event(author="user", content=types.Content(role="user", parts=[types.Part(text=text)]))
+                for text in texts
+            ])
+            await keyword.add_session_to_memory(session)
+            started = time.perf_counter()
+            for query in test_queries[:10]:
+                await keyword.search_memory(app_name="bench", user_id="u1", query=query)
+            line += f"   keyword scan: {(time.perf_counter() - started) / 10 * 1000:9.2f} ms/query"
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
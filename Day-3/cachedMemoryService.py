@@ -0,0 +1,215 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+
+from incrementalMemory import SessionWatermarks
+
+# Retrieval cache in front of a memory service
+
+# Why: preload_memory calls search_memory on every model request - including the extra requests
+# of a tool-calling turn and questions the user repeats - although neither the query nor the
+# user's memory changed in between.
+# What this does:
+    # Results are cached under (app, user, normalized query, memory version of that user)
+    # add_session_to_memory bumps the user's version only when the session really has new
+    #   events, and drops that user's cached results right away (bounded LRU, so no stale garbage)
+    # Concurrent misses for the same key share one search (single flight)
+    # Results served without a search are reported to the inner service's record_hits(), if it
+    #   has one, so retrieval counts (e.g. ConsolidatingMemoryService's eviction score) stay right
+    # stats() reports hits, misses and the hit rate
+# Normalization lowercases and keeps word characters only, which is what the keyword, BM25
+# and vector services match on - "What's my birthday?" and "what s my birthday" share a result.
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_Key = Tuple[str, str, str, int]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(_WORD_RE.findall(query.lower()))
+
+
+class CachedMemoryService(BaseMemoryService):
+    """Wraps a memory service with a bounded, version-invalidated cache of search results.
+
+    This class is thread-safe. If the wrapped service changes on its own (e.g. a background
+    consolidation job), call invalidate() afterwards or set a ttl.
+    """
+
+    def __init__(self, inner: BaseMemoryService, max_entries: int = 1024, ttl: Optional[float] = None):
+        """
+        Args:
+            inner: The memory service to cache.
+            max_entries: Maximum number of cached search results (least recently used go first).
+            ttl: Optional lifetime of a cached result in seconds.
+        """
+        self.inner = inner
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[_Key, Tuple[float, SearchMemoryResponse]]" = OrderedDict()
+        self._keys_by_user: Dict[Tuple[str, str], Set[_Key]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._inflight: Dict[_Key, asyncio.Future] = {}
+        self._watermarks = SessionWatermarks()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    # ------------------------------------------------------------------ writes
+
+    async def add_session_to_memory(self, session) -> None:
+        with self._lock:
+            changed = bool(self._watermarks.new_events(session))
+            self._watermarks.advance(session)
+        await self.inner.add_session_to_memory(session)
+        if changed:
+            # After the write, so a search racing with it cannot cache pre-write results
+            # under the new version.
+            self.invalidate(session.app_name, session.user_id)
+
+    def invalidate(self, app_name: str, user_id: Optional[str] = None) -> None:
+        """Bumps the memory version of one user (or every user of the app) and drops their results."""
+        with self._lock:
+            users = [user for user in self._versions if user[0] == app_name] if user_id is None else [(app_name, user_id)]
+            for user in users:
+                self._versions[user] = self._versions.get(user, 0) + 1
+                for key in self._keys_by_user.pop(user, ()):
+                    self._cache.pop(key, None)
+                self._stats["invalidations"] += 1
+
+    # ------------------------------------------------------------------ reads
+
+    def _forget(self, key: _Key) -> None:
+        keys = self._keys_by_user.get((key[0], key[1]))
+        if keys is not None:
+            keys.discard(key)
+
+    def _served(self, app_name: str, user_id: str, response: SearchMemoryResponse) -> SearchMemoryResponse:
+        """A copy of a result the inner service did not search for this call, reported to it as hits."""
+        record_hits = getattr(self.inner, "record_hits", None)
+        if record_hits is not None:
+            record_hits(app_name, user_id, response.memories)
+        return response.model_copy(update={"memories": list(response.memories)})
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        hit = None
+        with self._lock:
+            key = (app_name, user_id, normalize_query(query), self._versions.get((app_name, user_id), 0))
+            cached = self._cache.get(key)
+            if cached is not None and (self.ttl is None or time.monotonic() - cached[0] < self.ttl):
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                hit = cached[1]
+            else:
+                self._stats["misses"] += 1
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+                    leader = True
+                else:
+                    leader = False
+
+        if hit is not None:
+            return self._served(app_name, user_id, hit)
+        if not leader:
+            return self._served(app_name, user_id, await asyncio.shield(pending))
+
+        try:
+            response = await self.inner.search_memory(app_name=app_name, user_id=user_id, query=query)
+        except BaseException as error:
+            with self._lock:
+                self._inflight.pop(key, None)
+            if not pending.done():
+                pending.set_exception(error)
+                pending.exception()  # mark as retrieved when nobody else is waiting
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            # Only cache if no write happened while searching.
+            if self._versions.get((app_name, user_id), 0) == key[3]:
+                self._cache[key] = (time.monotonic(), response)
+                self._cache.move_to_end(key)
+                self._keys_by_user.setdefault((app_name, user_id), set()).add(key)
+                while len(self._cache) > self.max_entries:
+                    old_key, _ = self._cache.popitem(last=False)
+                    self._forget(old_key)
+                    self._stats["evictions"] += 1
+        pending.set_result(response)
+        return response.model_copy(update={"memories": list(response.memories)})
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._cache),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(memories: int = 100_000, turns: int = 200, requests_per_turn: int = 3, repeat_rate: float = 0.3):
+    """preload_memory-style lookups: several model requests per turn, some questions asked again."""
+    from google.adk.events import Event
+    from google.adk.sessions import Session
+    from google.genai import types
+
+    from bm25MemoryService import BM25MemoryService
+
+    rng = random.Random(11)
+    vocabulary = [f"word{i}" for i in range(20_000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def sentence(k: int) -> str:
+        return " ".join(rng.choices(vocabulary, weights=weights, k=k))
+
+    bm25 = BM25MemoryService()
+    index = bm25._index("bench", "u1")
+    for i in range(memories):
+        index.add(sentence(12), "user", "user", 1_700_000_000 + i)
+
+    asked, questions = [], []
+    for _ in range(turns):
+        if asked and rng.random() < repeat_rate:
+            question = rng.choice(asked).upper() + "?"  # same question, different casing/punctuation
+        else:
+            question = sentence(4)
+            asked.append(question)
+        questions.append(question)
+
+    async def run(service: BaseMemoryService) -> float:
+        session = Session(id="s1", app_name="bench", user_id="u1")
+        started = time.perf_counter()
+        for turn, question in enumerate(questions):
+            for _ in range(requests_per_turn):  # preload_memory runs once per model request
+                await service.search_memory(app_name="bench", user_id="u1", query=question)
+            if turn % 20 == 19:  # memory is saved every 20 turns
+                session.events.append(Event(
+                    author="user",
+                    content=types.Content(role="user", parts=[types.Part(text=question)]),
+                ))
+                await service.add_session_to_memory(session)
+        return (time.perf_counter() - started) / (turns * requests_per_turn)
+
+    print(f"📊 {turns} turns x {requests_per_turn} model requests, {memories:,} memories, "
+          f"{repeat_rate:.0%} repeated questions")
+    uncached = await run(bm25)
+    print(f"   BM25MemoryService            {uncached * 1000:7.3f} ms/lookup")
+    cached = CachedMemoryService(bm25)
+    latency = await run(cached)
+    stats = cached.stats()
+    print(f"   CachedMemoryService(BM25)    {latency * 1000:7.3f} ms/lookup  "
+          f"hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['invalidations']} invalidations)")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
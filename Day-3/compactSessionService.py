@@ -0,0 +1,362 @@
+import asyncio
+import copy
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+from google.genai import types
+
+# Memory-optimized drop-in for InMemorySessionService
+
+# Why: InMemorySessionService keeps full pydantic Event/Content objects for every session,
+# so RSS grows quickly on a multi-tenant box.
+# What this does:
+    # Events are stored as small __slots__ records
+    # author / invocation_id / role / branch strings are interned and shared
+    # Text parts go into a reference-counted pool, so repeated text is stored once
+    # UUID event ids are kept as 16 raw bytes
+    # Everything else on an event (actions, function calls, usage metadata...) is kept as
+    #   compact JSON bytes, and only when it differs from the defaults
+    # Event objects are rebuilt only when a session is read, and only for the events returned
+
+_EXCLUDED = {"id", "invocation_id", "author", "timestamp", "branch", "content"}
+
+
+class _TextPool:
+    """Reference-counted store for deduplicated text parts."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._texts: List[Optional[str]] = []
+        self._refs: List[int] = []
+        self._free: List[int] = []
+
+    def add(self, text: str) -> int:
+        text_id = self._ids.get(text)
+        if text_id is None:
+            if self._free:
+                text_id = self._free.pop()
+                self._texts[text_id] = text
+                self._refs[text_id] = 0
+            else:
+                text_id = len(self._texts)
+                self._texts.append(text)
+                self._refs.append(0)
+            self._ids[text] = text_id
+        self._refs[text_id] += 1
+        return text_id
+
+    def get(self, text_id: int) -> str:
+        return self._texts[text_id]
+
+    def release(self, text_id: int) -> None:
+        self._refs[text_id] -= 1
+        if self._refs[text_id] == 0:
+            del self._ids[self._texts[text_id]]
+            self._texts[text_id] = None
+            self._free.append(text_id)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class _EventRecord:
+    """Compact form of an Event."""
+
+    __slots__ = ("id", "invocation_id", "author", "timestamp", "branch", "role", "texts", "extra")
+
+    def __init__(self, event_id, invocation_id, author, timestamp, branch, role, texts, extra):
+        self.id = event_id
+        self.invocation_id = invocation_id
+        self.author = author
+        self.timestamp = timestamp
+        self.branch = branch
+        self.role = role
+        self.texts: Optional[Tuple[int, ...]] = texts  # None when content is kept in `extra`
+        self.extra: Optional[bytes] = extra
+
+
+class _CompactSession:
+    __slots__ = ("state", "events", "last_update_time")
+
+    def __init__(self, state: Dict[str, Any], last_update_time: float):
+        self.state = state
+        self.events: List[_EventRecord] = []
+        self.last_update_time = last_update_time
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+def _pack_id(event_id: str):
+    try:
+        packed = uuid.UUID(event_id)
+    except ValueError:
+        return _intern(event_id)
+    return packed.bytes if str(packed) == event_id else _intern(event_id)
+
+
+def _unpack_id(event_id) -> str:
+    return str(uuid.UUID(bytes=event_id)) if isinstance(event_id, bytes) else event_id
+
+
+class CompactInMemorySessionService(BaseSessionService):
+    """In-memory session service that stores events in a compact representation.
+
+    Like InMemorySessionService, it is meant for a single process and is not thread-safe.
+    """
+
+    def __init__(self):
+        # app name -> user id -> session id -> session
+        self.sessions: Dict[str, Dict[str, Dict[str, _CompactSession]]] = {}
+        # app name -> user id -> key -> value
+        self.user_state: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # app name -> key -> value
+        self.app_state: Dict[str, Dict[str, Any]] = {}
+        self.texts = _TextPool()
+
+    # ------------------------------------------------------------------ encoding
+
+    def _encode(self, event: Event) -> _EventRecord:
+        content = event.content
+        texts, role = None, None
+        text_only = content is not None and bool(content.parts) and all(
+            part.text is not None and part.model_dump(exclude_none=True).keys() == {"text"}
+            for part in content.parts
+        )
+        exclude = _EXCLUDED if text_only or content is None else _EXCLUDED - {"content"}
+        if text_only:
+            texts = tuple(self.texts.add(part.text) for part in content.parts)
+            role = _intern(content.role)
+
+        extra = event.model_dump(mode="json", exclude_defaults=True, exclude=exclude)
+        return _EventRecord(
+            _pack_id(event.id),
+            _intern(event.invocation_id),
+            _intern(event.author),
+            event.timestamp,
+            _intern(event.branch),
+            role,
+            texts,
+            json.dumps(extra, separators=(",", ":")).encode("utf-8") if extra else None,
+        )
+
+    def _decode(self, record: _EventRecord) -> Event:
+        fields: Dict[str, Any] = {
+            "id": _unpack_id(record.id),
+            "invocation_id": record.invocation_id,
+            "author": record.author,
+            "timestamp": record.timestamp,
+            "branch": record.branch,
+        }
+        if record.extra is None:
+            # Fast path: plain text event, no JSON parsing needed.
+            if record.texts is not None:
+                fields["content"] = types.Content(
+                    role=record.role,
+                    parts=[types.Part(text=self.texts.get(text_id)) for text_id in record.texts],
+                )
+            return Event(**fields)
+
+        data = json.loads(record.extra)
+        data.update(fields)
+        if record.texts is not None:
+            data["content"] = {
+                "role": record.role,
+                "parts": [{"text": self.texts.get(text_id)} for text_id in record.texts],
+            }
+        # JSON validation so base64-encoded bytes (inline data, signatures) decode correctly.
+        return Event.model_validate_json(json.dumps(data))
+
+    def _release(self, session: _CompactSession) -> None:
+        for record in session.events:
+            for text_id in record.texts or ():
+                self.texts.release(text_id)
+
+    # ------------------------------------------------------------------ helpers
+
+    def _lookup(self, app_name: str, user_id: str, session_id: str) -> Optional[_CompactSession]:
+        return self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+
+    def _merged_state(self, app_name: str, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        merged = copy.deepcopy(state)
+        for key, value in self.app_state.get(app_name, {}).items():
+            merged[State.APP_PREFIX + key] = value
+        for key, value in self.user_state.get(app_name, {}).get(user_id, {}).items():
+            merged[State.USER_PREFIX + key] = value
+        return merged
+
+    def _apply_state(self, app_name: str, user_id: str, stored: Optional[_CompactSession], state: Dict[str, Any]) -> None:
+        for key, value in state.items():
+            if key.startswith(State.APP_PREFIX):
+                self.app_state.setdefault(app_name, {})[key.removeprefix(State.APP_PREFIX)] = value
+            elif key.startswith(State.USER_PREFIX):
+                self.user_state.setdefault(app_name, {}).setdefault(user_id, {})[
+                    key.removeprefix(State.USER_PREFIX)
+                ] = value
+            elif not key.startswith(State.TEMP_PREFIX) and stored is not None:
+                stored.state[key] = value
+
+    # ------------------------------------------------------------------ BaseSessionService
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        if session_id and self._lookup(app_name, user_id, session_id):
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+
+        stored = _CompactSession({}, time.time())
+        self._apply_state(app_name, user_id, stored, state or {})
+        self.sessions.setdefault(app_name, {}).setdefault(user_id, {})[session_id] = stored
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=self._merged_state(app_name, user_id, stored.state),
+            last_update_time=stored.last_update_time,
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        stored = self._lookup(app_name, user_id, session_id)
+        if stored is None:
+            return None
+
+        records = stored.events
+        if config:
+            if config.num_recent_events:
+                records = records[-config.num_recent_events:]
+            if config.after_timestamp:
+                i = len(records) - 1
+                while i >= 0 and records[i].timestamp >= config.after_timestamp:
+                    i -= 1
+                records = records[i + 1:]
+
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=self._merged_state(app_name, user_id, stored.state),
+            events=[self._decode(record) for record in records],
+            last_update_time=stored.last_update_time,
+        )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        users = self.sessions.get(app_name, {})
+        if user_id is not None:
+            users = {user_id: users.get(user_id, {})}
+        return ListSessionsResponse(sessions=[
+            Session(
+                id=session_id,
+                app_name=app_name,
+                user_id=uid,
+                state=self._merged_state(app_name, uid, stored.state),
+                last_update_time=stored.last_update_time,
+            )
+            for uid, sessions in users.items()
+            for session_id, stored in sessions.items()
+        ])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        stored = self.sessions.get(app_name, {}).get(user_id, {}).pop(session_id, None)
+        if stored is not None:
+            self._release(stored)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        stored = self._lookup(session.app_name, session.user_id, session.id)
+        if stored is None:
+            logging.warning(f"Failed to append event to session {session.id}: session not found")
+            return event
+
+        # Update the caller's session object, then the compact copy.
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        stored.events.append(self._encode(event))
+        stored.last_update_time = event.timestamp
+        if event.actions and event.actions.state_delta:
+            self._apply_state(session.app_name, session.user_id, stored, event.actions.state_delta)
+        return event
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(sessions: int = 100_000, events_per_session: int = 6):
+    """Measures bytes per event and per session with tracemalloc for both services."""
+    replies = [
+        "Sure! Here is what I found.",
+        "The capital of the USA is Washington, D.C.",
+        "I saved your name and country.",
+        "Your name is Sid and you are from India.",
+    ]
+
+    def make_event(s: int, i: int) -> Event:
+        if i % 2 == 0:
+            author, role, text = "user", "user", f"Hi, I am user {s}. Question number {i}?"
+        else:
+            author, role, text = "text_chat_bot", "model", replies[(s + i) % len(replies)]
+        return Event(
+            invocation_id=f"e-{s}-{i // 2}",
+            author=author,
+            content=types.Content(role=role, parts=[types.Part(text=text)]),
+        )
+
+    async def measure(service: BaseSessionService) -> int:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for s in range(sessions):
+            session = await service.create_session(app_name="bench", user_id=f"user-{s}")
+            for i in range(events_per_session):
+                await service.append_event(session, make_event(s, i))
+            del session
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return used
+
+    total_events = sessions * events_per_session
+    print(f"📊 {sessions:,} sessions x {events_per_session} events (tracemalloc)")
+    for name, factory in (
+        ("InMemorySessionService", InMemorySessionService),
+        ("CompactInMemorySessionService", CompactInMemorySessionService),
+    ):
+        service = factory()
+        used = await measure(service)
+        print(
+            f"   {name:32} {used / 2**20:9.1f} MiB  "
+            f"{used / total_events:7.0f} B/event  {used / sessions:8.0f} B/session"
+        )
+        del service
+        gc.collect()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,295 @@
+import os
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Physical pruning of compacted events from a DatabaseSessionService SQLite file
+
+# Why: once a compaction summary is stored, the raw events it replaces never reach a prompt again,
+# but they stay in the events table forever - every get_session still loads and unpickles them,
+# and the database file only grows.
+# What this does:
+    # For each session, finds the raw events ADK's contents processor already skips: events that
+    #   come before a compaction event and are not older than its start (same rule as
+    #   _process_compaction_events, so prompts are unchanged). Only compactions older than
+    #   `min_age` seconds count, so an in-flight turn never loses events it is reading
+    # Superseded events are copied to an optional archive file (same columns) and deleted
+    # Every pruned invocation keeps a tombstone so run_async(invocation_id=...) still works:
+    #   the user message that started it, and per agent the last row carrying agent_state or
+    #   end_of_agent (with its content dropped). Invocations waiting on a long-running tool
+    #   are never pruned
+    # VACUUM runs afterwards, in a worker thread when pruning runs in the background
+
+logger = logging.getLogger(__name__)
+
+_TIMESTAMP_SLACK = 1e-6  # stored timestamps are rounded to microseconds
+
+
+def _adk_timestamp(value: str) -> float:
+    # DatabaseSessionService stores naive local datetimes (datetime.fromtimestamp).
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _parts(content: Optional[str]) -> List[Dict[str, Any]]:
+    return (json.loads(content).get("parts") or []) if content else []
+
+
+def _is_user_message(author: str, content: Optional[str]) -> bool:
+    # Mirrors Runner._find_user_message_for_invocation.
+    parts = _parts(content)
+    return author == "user" and bool(parts) and bool(parts[0].get("text"))
+
+
+class CompactedEventPruner:
+    """Deletes (or archives) events superseded by stored compaction summaries, leaving tombstones."""
+
+    def __init__(self, db_path: str, archive_path: Optional[str] = None, min_age: float = 60.0):
+        """
+        Args:
+            db_path: SQLite file of a DatabaseSessionService.
+            archive_path: Optional SQLite file that receives the pruned rows (cold storage).
+            min_age: Seconds a compaction event must have been stored before it is acted on.
+        """
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self.min_age = min_age
+        self._pruner: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        if self.archive_path:
+            db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            db.execute("CREATE TABLE IF NOT EXISTS archive.events AS SELECT * FROM main.events WHERE 0")
+        return db
+
+    # ------------------------------------------------------------------ planning
+
+    def _plan(self, rows: List[tuple], now: float) -> Tuple[List[int], List[int]]:
+        """Splits one session's superseded events into rows to delete and rows to keep as tombstones.
+
+        Args:
+            rows: (rowid, invocation_id, author, timestamp, actions, content, long_running_tool_ids_json)
+                ordered by timestamp.
+
+        Returns:
+            (rowids to delete, rowids to keep with their content dropped)
+        """
+        answered: Set[str] = set()
+        for row in rows:
+            for part in _parts(row[5]):
+                response = part.get("function_response") or part.get("functionResponse")
+                if response and response.get("id"):
+                    answered.add(response["id"])
+
+        superseded: Dict[str, List[tuple]] = {}
+        boundary = float("inf")
+        for row in reversed(rows):
+            timestamp, actions = _adk_timestamp(row[3]), pickle.loads(row[4])
+            compaction = actions.compaction
+            if compaction and compaction.start_timestamp is not None and compaction.end_timestamp is not None:
+                if timestamp <= now - self.min_age:
+                    boundary = min(boundary, compaction.start_timestamp - _TIMESTAMP_SLACK)
+            elif timestamp >= boundary:
+                superseded.setdefault(row[1], []).append((row, actions))
+
+        delete: List[int] = []
+        tombstones: List[int] = []
+        for invocation_rows in superseded.values():
+            if any(set(json.loads(row[6] or "[]")) - answered for row, _ in invocation_rows):
+                continue  # waiting on a long-running tool: it may still be resumed with full context
+            invocation_rows.reverse()  # back to timestamp order
+            user_message = next((row[0] for row, _ in invocation_rows if _is_user_message(row[2], row[5])), None)
+            # populate_invocation_agent_states only needs the last agent_state/end_of_agent per agent.
+            last_state: Dict[str, int] = {}
+            for row, actions in invocation_rows:
+                if actions.agent_state is not None or actions.end_of_agent:
+                    last_state[row[2]] = row[0]
+            keep = set(last_state.values())
+            if not keep and user_message is None:
+                keep.add(invocation_rows[0][0][0])  # something must still carry the invocation id
+            tombstones.extend(keep - {user_message})
+            delete.extend(row[0] for row, _ in invocation_rows if row[0] not in keep and row[0] != user_message)
+        return delete, tombstones
+
+    # ------------------------------------------------------------------ pruning
+
+    def prune(self) -> Dict[str, int]:
+        """Prunes every session once. Each session is its own transaction.
+
+        Returns:
+            Dict[str, int]: sessions touched, events deleted, tombstones written, events archived.
+        """
+        report = {"sessions": 0, "deleted": 0, "tombstones": 0, "archived": 0}
+        now = time.time()
+        db = self._connect()
+        try:
+            sessions = db.execute("SELECT app_name, user_id, id FROM sessions").fetchall()
+            for key in sessions:
+                rows = db.execute(
+                    "SELECT rowid, invocation_id, author, timestamp, actions, content, long_running_tool_ids_json"
+                    " FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY timestamp",
+                    key,
+                ).fetchall()
+                delete, tombstones = self._plan(rows, now)
+                if not delete and not tombstones:
+                    continue
+                touched = delete + tombstones
+                with db:
+                    for start in range(0, len(touched), 500):
+                        chunk = touched[start:start + 500]
+                        marks = ",".join("?" * len(chunk))
+                        if self.archive_path:
+                            db.execute(f"INSERT INTO archive.events SELECT * FROM main.events WHERE rowid IN ({marks})", chunk)
+                    for start in range(0, len(delete), 500):
+                        chunk = delete[start:start + 500]
+                        db.execute(f"DELETE FROM events WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+                    db.executemany(
+                        "UPDATE events SET content = NULL, grounding_metadata = NULL, usage_metadata = NULL,"
+                        " citation_metadata = NULL, custom_metadata = ? WHERE rowid = ?",
+                        [(json.dumps({"pruned": True}), rowid) for rowid in tombstones],
+                    )
+                report["sessions"] += 1
+                report["deleted"] += len(delete)
+                report["tombstones"] += len(tombstones)
+                report["archived"] += len(touched) if self.archive_path else 0
+        finally:
+            db.close()
+        return report
+
+    def vacuum(self) -> int:
+        """Rewrites the database file without the freed pages.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        before = os.path.getsize(self.db_path)
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            db.execute("VACUUM")
+        finally:
+            db.close()
+        return before - os.path.getsize(self.db_path)
+
+    def start_background_pruning(self, interval: float = 600.0) -> None:
+        """Periodically prunes and vacuums in a worker thread while the event loop keeps serving turns."""
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                report = await asyncio.to_thread(self.prune)
+                if report["deleted"]:
+                    report["reclaimed_bytes"] = await asyncio.to_thread(self.vacuum)
+                    logger.info(f"[Pruner] {report}")
+
+        self._pruner = asyncio.get_running_loop().create_task(loop())
+
+    def stop_background_pruning(self) -> None:
+        if self._pruner is not None:
+            self._pruner.cancel()
+            self._pruner = None
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(sessions: int = 10, invocations: int = 100, compaction_interval: int = 5):
+    """Storage reclaimed and get_session time before and after pruning a compacted database."""
+    from google.adk.events import Event
+    from google.adk.events.event_actions import EventActions, EventCompaction
+    from google.adk.flows.llm_flows.contents import _process_compaction_events
+    from google.adk.runners import Runner
+    from google.adk.sessions import DatabaseSessionService
+    from google.genai import types
+
+    def prompt_view(session) -> List[Tuple[str, str]]:
+        # DatabaseSessionService returns actions.compaction as a plain dict; re-validate first.
+        events = [Event.model_validate(event.model_dump(warnings=False)) for event in session.events]
+        return [(event.author, json.dumps(event.content.model_dump(exclude_none=True, mode="json")))
+                for event in _process_compaction_events(events) if event.content]
+
+    async def load_all(service, keys) -> Tuple[float, list]:
+        started = time.perf_counter()
+        loaded = [await service.get_session(app_name="bench", user_id=user_id, session_id=session_id)
+                  for user_id, session_id in keys]
+        return time.perf_counter() - started, loaded
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sessions.db")
+        service = DatabaseSessionService(f"sqlite:///{db_path}")
+        keys = []
+        clock = time.time() - 86400
+        for s in range(sessions):
+            session = await service.create_session(app_name="bench", user_id=f"u{s}")
+            keys.append((session.user_id, session.id))
+            window_start = None
+            for i in range(invocations):
+                invocation_id = f"inv-{s}-{i}"
+                # question, tool call, tool result, answer, and the end_of_agent marker of a resumable app
+                for author, content, end_of_agent in (
+                    ("user", types.Content(role="user", parts=[types.Part(text=f"Question {i}: " + "context " * 30)]), False),
+                    ("bot", types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                        id=f"call-{i}", name="google_search", args={"query": f"question {i}"}))]), False),
+                    ("bot", types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                        id=f"call-{i}", name="google_search", response={"result": "search result " * 150}))]), False),
+                    ("bot", types.Content(role="model", parts=[types.Part(text=f"Answer {i}: " + "explanation " * 80)]), False),
+                    ("bot", None, True),
+                ):
+                    clock += 1
+                    await service.append_event(session, Event(
+                        invocation_id=invocation_id, author=author, timestamp=clock, content=content,
+                        actions=EventActions(end_of_agent=end_of_agent),
+                    ))
+                    window_start = window_start or clock
+                if i % compaction_interval == compaction_interval - 1 and i < invocations - compaction_interval:
+                    clock += 1
+                    await service.append_event(session, Event(
+                        invocation_id=invocation_id, author="user", timestamp=clock,
+                        actions=EventActions(compaction=EventCompaction(
+                            start_timestamp=window_start, end_timestamp=clock - 1,
+                            compacted_content=types.Content(role="model", parts=[types.Part(text="Summary " * 40)]),
+                        )),
+                    ))
+                    window_start = None
+
+        load_before, before = await load_all(service, keys)
+        size_before = os.path.getsize(db_path)
+        events_before = sum(len(session.events) for session in before)
+        service.db_engine.dispose()
+
+        pruner = CompactedEventPruner(db_path, archive_path=os.path.join(tmp, "archive.db"))
+        started = time.perf_counter()
+        report = pruner.prune()
+        prune_time = time.perf_counter() - started
+        started = time.perf_counter()
+        reclaimed = pruner.vacuum()
+        vacuum_time = time.perf_counter() - started
+
+        service = DatabaseSessionService(f"sqlite:///{db_path}")
+        load_after, after = await load_all(service, keys)
+        events_after = sum(len(session.events) for session in after)
+        service.db_engine.dispose()
+
+        # Same prompts, and every pruned invocation can still be resumed.
+        assert all(prompt_view(a) == prompt_view(b) for a, b in zip(before, after))
+        runner = Runner.__new__(Runner)
+        for a, b in zip(before, after):
+            for invocation_id in {event.invocation_id for event in a.events}:
+                assert runner._find_user_message_for_invocation(a.events, invocation_id) == \
+                    runner._find_user_message_for_invocation(b.events, invocation_id)
+
+        print(f"📊 {sessions} sessions x {invocations} invocations, compaction every {compaction_interval}")
+        print(f"   pruned: {report}  in {prune_time:.2f}s, VACUUM {vacuum_time:.2f}s")
+        print(f"   events loaded:  {events_before:,} -> {events_after:,}")
+        print(f"   database file:  {size_before / 1e6:.2f} MB -> {os.path.getsize(db_path) / 1e6:.2f} MB "
+              f"({reclaimed / 1e6:.2f} MB reclaimed, archive {os.path.getsize(os.path.join(tmp, 'archive.db')) / 1e6:.2f} MB)")
+        print(f"   get_session:    {load_before / sessions * 1000:.1f} ms -> {load_after / sessions * 1000:.1f} ms per session")
+        print("✅ Prompts unchanged and every invocation still has its user message")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,441 @@
+import asyncio
+import heapq
+import logging
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from google.adk.memory import BaseMemoryService, InMemoryMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai import types
+
+from bm25MemoryService import tokenize
+from incrementalMemory import SessionWatermarks
+
+# Bounded per-user memory with near-duplicate consolidation and eviction
+
+# Why: every add_session_to_memory call adds raw events that are never removed, so the same fact
+# ("my birthday is 16th April", said five times) is stored - and injected by preload_memory - again and again.
+# What this does:
+    # Ingestion is cheap: new events (past the session watermark) are queued as raw entries
+    # A consolidation pass (background job, or inline when the queue gets long) computes a
+    #   MinHash signature per entry and looks up near-duplicates through LSH banding. Matches are merged
+    #   into one canonical entry that keeps the most recent wording plus a count of how often it was said
+    # Each user has a budget of memories. Over budget, the lowest-scoring entries are evicted:
+    #   score = recency (exponential decay) + frequency (times said + times retrieved) + importance
+    #   (user-stated facts, names and numbers score higher than "thanks!" / "you're welcome")
+    # metrics() reports stored memories/tokens and the prompt tokens saved compared to returning
+    #   every raw duplicate
+    # Entries are tokenized once when they are ingested; record_hits() lets a cache in front of
+    #   the service (CachedMemoryService) count the results it serves, so eviction sees them
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+_FACT_RE = re.compile(r"\b(my|i am|i'm|i like|i love|i prefer|i have|i live|remember|favorite|favourite)\b", re.I)
+
+
+def _approx_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def importance(text: str, author: Optional[str]) -> float:
+    """Heuristic importance in [0, 1]: first-person facts, numbers and names by the user score high."""
+    score = 0.4 if author == "user" else 0.2
+    if _FACT_RE.search(text):
+        score += 0.3
+    if any(ch.isdigit() for ch in text) or any(word[:1].isupper() for word in text.split()[1:]):
+        score += 0.2
+    if len(tokenize(text)) < 3:
+        score -= 0.2
+    return min(1.0, max(0.0, score))
+
+
+class MinHasher:
+    """MinHash signatures over token unigrams + bigrams (multiply-shift hash family)."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)  # odd multipliers
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def shingles(tokens: List[str]) -> Set[str]:
+        return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in self.shingles(tokens)), dtype=np.uint64
+        )
+        # (a * x + b) mod 2^64, keep the high 32 bits; min over shingles for each permutation.
+        with np.errstate(over="ignore"):
+            mixed = (np.outer(hashes, self._a) + self._b) & _MASK64
+        return (mixed >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+class _Memory:
+    __slots__ = (
+        "text", "words", "terms", "author", "role", "timestamp", "count", "hits", "importance",
+        "tokens", "raw_tokens", "signature", "bands",
+    )
+
+    def __init__(self, text: str, words: List[str], author: Optional[str], role: Optional[str], timestamp: float):
+        self.text = text
+        self.words: Optional[List[str]] = words  # kept until the MinHash signature is computed
+        self.terms = frozenset(words)  # what search_memory matches on
+        self.author = author
+        self.role = role
+        self.timestamp = timestamp  # last time this fact was said
+        self.count = 1  # times it was said (merged duplicates)
+        self.hits = 0  # times it was returned by search_memory
+        self.importance = importance(text, author)
+        self.tokens = _approx_tokens(text)
+        self.raw_tokens = self.tokens  # tokens of every raw duplicate merged into this entry
+        self.signature: Optional[np.ndarray] = None
+        self.bands: List[bytes] = []
+
+
+class _UserMemory:
+    def __init__(self, num_bands: int):
+        self.entries: Dict[int, _Memory] = {}
+        self.pending: List[_Memory] = []
+        self.buckets: List[Dict[bytes, Set[int]]] = [{} for _ in range(num_bands)]
+        self.next_id = 0
+        self.by_text: Optional[Dict[str, _Memory]] = None  # built by record_hits, reset on every change
+
+
+class ConsolidatingMemoryService(BaseMemoryService):
+    """Memory service with a per-user budget, near-duplicate merging and score-based eviction.
+
+    This class is thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_memories_per_user: int = 500,
+        top_k: int = 5,
+        similarity_threshold: float = 0.6,
+        num_perm: int = 64,
+        bands: int = 16,
+        half_life: float = 7 * 24 * 3600,
+        max_pending: int = 1_000,
+    ):
+        """
+        Args:
+            max_memories_per_user: Budget of consolidated memories kept per user.
+            top_k: Maximum number of memories returned per search.
+            similarity_threshold: Estimated Jaccard similarity above which two memories are merged.
+            num_perm: MinHash signature length.
+            bands: LSH bands (num_perm must be divisible by it). More bands find less similar pairs.
+            half_life: Seconds after which the recency part of the eviction score halves.
+            max_pending: Raw entries a user may queue before consolidation runs inline.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.max_memories_per_user = max_memories_per_user
+        self.top_k = top_k
+        self.similarity_threshold = similarity_threshold
+        self.num_bands = bands
+        self.rows = num_perm // bands
+        self.half_life = half_life
+        self.max_pending = max_pending
+        self.hasher = MinHasher(num_perm)
+        self._lock = threading.Lock()
+        self._users: Dict[Tuple[str, str], _UserMemory] = {}
+        self._watermarks = SessionWatermarks()
+        self._consolidator: Optional[asyncio.Task] = None
+        # Called with (app_name, user_id) after a consolidation pass changed that user's memories,
+        # e.g. CachedMemoryService.invalidate.
+        self.on_change: Optional[Callable[[str, str], None]] = None
+        self._metrics = {
+            "raw_ingested": 0,
+            "raw_tokens_ingested": 0,
+            "merged": 0,
+            "evicted": 0,
+            "consolidation_runs": 0,
+            "consolidation_seconds": 0.0,
+            "searches": 0,
+            "prompt_tokens_injected": 0,
+            "prompt_tokens_saved": 0,
+        }
+
+    def _user(self, app_name: str, user_id: str) -> _UserMemory:
+        key = (app_name, user_id)
+        memory = self._users.get(key)
+        if memory is None:
+            memory = self._users[key] = _UserMemory(self.num_bands)
+        return memory
+
+    # ------------------------------------------------------------------ ingestion
+
+    async def add_session_to_memory(self, session) -> None:
+        with self._lock:
+            memory = self._user(session.app_name, session.user_id)
+            for event in self._watermarks.new_events(session):
+                if not event.content or not event.content.parts:
+                    continue
+                text = " ".join(part.text for part in event.content.parts if part.text)
+                words = tokenize(text) if text else []
+                if not words:
+                    continue
+                memory.pending.append(_Memory(text, words, event.author, event.content.role, event.timestamp))
+                memory.by_text = None
+                self._metrics["raw_ingested"] += 1
+                self._metrics["raw_tokens_ingested"] += _approx_tokens(text)
+            self._watermarks.advance(session)
+            if len(memory.pending) >= self.max_pending:
+                self._consolidate_user(memory)  # backpressure when the background job falls behind
+
+    # ------------------------------------------------------------------ consolidation
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.num_bands)]
+
+    def _link(self, memory: _UserMemory, entry_id: int, entry: _Memory) -> None:
+        for bucket, key in zip(memory.buckets, entry.bands):
+            bucket.setdefault(key, set()).add(entry_id)
+
+    def _unlink(self, memory: _UserMemory, entry_id: int, entry: _Memory) -> None:
+        for bucket, key in zip(memory.buckets, entry.bands):
+            ids = bucket.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del bucket[key]
+
+    def _score(self, entry: _Memory, now: float) -> float:
+        recency = 0.5 ** (max(0.0, now - entry.timestamp) / self.half_life)
+        frequency = min(1.0, math.log1p(entry.count + entry.hits) / math.log1p(20))
+        return 0.4 * recency + 0.3 * frequency + 0.3 * entry.importance
+
+    def _consolidate_user(self, memory: _UserMemory) -> None:
+        started = time.perf_counter()
+        pending, memory.pending = memory.pending, []
+        memory.by_text = None
+        for raw in pending:
+            raw.signature = self.hasher.signature(raw.words)
+            raw.bands = self._band_keys(raw.signature)
+            raw.words = None
+
+            candidates: Set[int] = set()
+            for bucket, key in zip(memory.buckets, raw.bands):
+                candidates.update(bucket.get(key, ()))
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in candidates:
+                similarity = float(np.mean(memory.entries[entry_id].signature == raw.signature))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                entry_id = memory.next_id
+                memory.next_id += 1
+                memory.entries[entry_id] = raw
+                self._link(memory, entry_id, raw)
+                continue
+
+            # Merge: keep the most recent wording as the canonical text.
+            canonical = memory.entries[best_id]
+            canonical.count += 1
+            canonical.hits += raw.hits  # it may have been returned while still pending
+            canonical.raw_tokens += raw.tokens
+            canonical.importance = max(canonical.importance, raw.importance)
+            if raw.timestamp >= canonical.timestamp:
+                self._unlink(memory, best_id, canonical)
+                canonical.text, canonical.terms = raw.text, raw.terms
+                canonical.author, canonical.role = raw.author, raw.role
+                canonical.timestamp, canonical.tokens = raw.timestamp, raw.tokens
+                canonical.signature, canonical.bands = raw.signature, raw.bands
+                self._link(memory, best_id, canonical)
+            self._metrics["merged"] += 1
+
+        overflow = len(memory.entries) - self.max_memories_per_user
+        if overflow > 0:
+            now = time.time()
+            victims = heapq.nsmallest(
+                overflow, memory.entries.items(), key=lambda item: self._score(item[1], now)
+            )
+            for entry_id, entry in victims:
+                self._unlink(memory, entry_id, entry)
+                del memory.entries[entry_id]
+            self._metrics["evicted"] += overflow
+        self._metrics["consolidation_seconds"] += time.perf_counter() - started
+
+    def consolidate(self) -> Dict[str, int]:
+        """Consolidates the queued entries of every user. Safe to call from any thread."""
+        with self._lock:
+            users = list(self._users.items())
+        merged_before, evicted_before = self._metrics["merged"], self._metrics["evicted"]
+        for key, memory in users:
+            with self._lock:  # one user at a time, so searches are never blocked for long
+                if not memory.pending:
+                    continue
+                self._consolidate_user(memory)
+            if self.on_change is not None:
+                self.on_change(*key)
+        with self._lock:
+            self._metrics["consolidation_runs"] += 1
+            return {
+                "merged": self._metrics["merged"] - merged_before,
+                "evicted": self._metrics["evicted"] - evicted_before,
+            }
+
+    def start_background_consolidation(self, interval: float = 30.0) -> None:
+        """Periodically consolidates in a worker thread while the event loop keeps serving turns."""
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                result = await asyncio.to_thread(self.consolidate)
+                if result["merged"] or result["evicted"]:
+                    logging.info(f"[Memory] Consolidated: {result}")
+
+        self._consolidator = asyncio.get_running_loop().create_task(loop())
+
+    def stop_background_consolidation(self) -> None:
+        if self._consolidator is not None:
+            self._consolidator.cancel()
+            self._consolidator = None
+
+    # ------------------------------------------------------------------ search
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        query_terms = set(tokenize(query))
+        with self._lock:
+            memory = self._users.get((app_name, user_id))
+            if memory is None or not query_terms:
+                return SearchMemoryResponse()
+
+            # The user's memory is bounded, so a scan is cheap. Rarer terms weigh more (idf).
+            entries = list(memory.entries.values()) + memory.pending
+            df = {term: sum(term in entry.terms for entry in entries) for term in query_terms}
+            scored = []
+            for entry in entries:
+                score = sum(math.log(1 + len(entries) / df[term]) for term in query_terms & entry.terms)
+                if score > 0:
+                    scored.append((score, entry.timestamp, id(entry), entry))
+            hits = heapq.nlargest(self.top_k, scored)
+
+            self._metrics["searches"] += 1
+            for _, _, _, entry in hits:
+                entry.hits += 1
+                self._metrics["prompt_tokens_injected"] += entry.tokens
+                self._metrics["prompt_tokens_saved"] += entry.raw_tokens - entry.tokens
+            return SearchMemoryResponse(memories=[
+                MemoryEntry(
+                    content=types.Content(role=entry.role, parts=[types.Part(text=entry.text)]),
+                    author=entry.author,
+                    timestamp=datetime.fromtimestamp(entry.timestamp).isoformat(),
+                )
+                for _, _, _, entry in hits
+            ])
+
+    def record_hits(self, app_name: str, user_id: str, memories: List[MemoryEntry]) -> None:
+        """Counts results served without a search (e.g. from a cache) as hits of their entries.
+
+        Args:
+            app_name: The app of the search.
+            user_id: The user of the search.
+            memories: The results as returned by search_memory.
+        """
+        with self._lock:
+            memory = self._users.get((app_name, user_id))
+            if memory is None:
+                return
+            if memory.by_text is None:
+                memory.by_text = {entry.text: entry for entry in list(memory.entries.values()) + memory.pending}
+            for result in memories:
+                entry = memory.by_text.get(result.content.parts[0].text)
+                if entry is not None:
+                    entry.hits += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            memories = sum(len(memory.entries) for memory in self._users.values())
+            return {
+                **self._metrics,
+                "users": len(self._users),
+                "memories": memories,
+                "pending": sum(len(memory.pending) for memory in self._users.values()),
+                "stored_tokens": sum(
+                    entry.tokens for memory in self._users.values() for entry in memory.entries.values()
+                ),
+            }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(facts: int = 300, repeats: int = 20, budget: int = 250, queries: int = 200):
+    """Storage and preload prompt size with and without consolidation for one chatty user."""
+    from google.adk.events import Event
+    from google.adk.sessions import Session
+
+    rng = random.Random(3)
+    subjects = ["birthday", "anniversary", "dentist appointment", "car service", "flight", "gym class"]
+    months = ["January", "February", "March", "April", "May", "June", "July", "August",
+              "September", "October", "November", "December"]
+    fillers = ["", "Just so you know,", "Remember that", "As I said,", "Reminder:"]
+    small_talk = ["Thanks!", "Great, thank you so much.", "You're welcome!", "Ok cool, sounds good."]
+
+    statements = []
+    for fact in range(facts):
+        subject = f"{subjects[fact % len(subjects)]} for contact{fact}"
+        detail = f"is on {months[fact % 12]} {fact % 28 + 10}th at venue{fact}"
+        for _ in range(rng.randint(1, repeats)):
+            statements.append(f"{rng.choice(fillers)} my {subject} {detail}".strip())
+    rng.shuffle(statements)
+    statements += [rng.choice(small_talk) for _ in range(len(statements) // 4)]
+
+    sessions, now = [], time.time()
+    for s in range(0, len(statements), 20):
+        events = [
+            Event(author="user", timestamp=now - len(statements) + s + i,
+                  content=types.Content(role="user", parts=[types.Part(text=text)]))
+            for i, text in enumerate(statements[s:s + 20])
+        ]
+        sessions.append(Session(id=f"s{s}", app_name="bench", user_id="u1", events=events))
+    asked = rng.sample(range(facts), min(queries, facts))
+    test_queries = [(f"when is the {subjects[f % len(subjects)]} for contact{f}?", f"venue{f}") for f in asked]
+
+    print(f"📊 {len(statements):,} raw statements ({facts} distinct facts, budget {budget} memories)")
+    raw = InMemoryMemoryService()
+    for session in sessions:
+        await raw.add_session_to_memory(session)
+    raw_tokens = 0
+    for query, _ in test_queries:
+        response = await raw.search_memory(app_name="bench", user_id="u1", query=query)
+        raw_tokens += sum(_approx_tokens(m.content.parts[0].text) for m in response.memories)
+    print(f"   InMemoryMemoryService      stored {len(statements):6,}  "
+          f"{raw_tokens / len(test_queries):9.0f} prompt tokens/query")
+
+    service = ConsolidatingMemoryService(max_memories_per_user=budget)
+    started = time.perf_counter()
+    for session in sessions:
+        await service.add_session_to_memory(session)
+    ingest = time.perf_counter() - started
+    started = time.perf_counter()
+    service.consolidate()
+    final_pass = time.perf_counter() - started
+    found = 0
+    for query, answer in test_queries:
+        response = await service.search_memory(app_name="bench", user_id="u1", query=query)
+        found += any(answer in m.content.parts[0].text.split() for m in response.memories)
+    stats = service.metrics()
+    print(f"   ConsolidatingMemoryService stored {stats['memories']:6,}  "
+          f"{stats['prompt_tokens_injected'] / len(test_queries):9.0f} prompt tokens/query  "
+          f"answer in top {service.top_k}: {found / len(test_queries):.0%}")
+    print(f"   merged {stats['merged']:,}, evicted {stats['evicted']:,}; "
+          f"ingest {ingest * 1000:.0f} ms, final consolidate() {final_pass * 1000:.0f} ms "
+          f"(consolidation {stats['consolidation_seconds'] * 1000:.0f} ms in all)")
+    print(f"   stored tokens {stats['raw_tokens_ingested']:,} -> {stats['stored_tokens']:,}, "
+          f"prompt tokens saved by merging: {stats['prompt_tokens_saved']:,}")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
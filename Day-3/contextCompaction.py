@@ -15,6 +15,10 @@ from google.adk.runners import Runner
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
+from rollingSummarizer import RollingEventsSummarizer
+from tokenBudgetCompaction import TokenBudgetCompactionPlugin
+from tokenEstimator import TokenEstimator
+
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -89,22 +93,60 @@ chatbot_agent = LlmAgent(
     description="A text chatbot with persistent memory",
 )
 
+# Compaction is driven by the estimated prompt size instead of a fixed number of invocations
+# (EventsCompactionConfig(compaction_interval=3, overlap_size=1)), and the summary is written by
+# a background task - the turn that crosses the budget does not wait for the summarization call.
+# Each summary covers only the events added since the previous one (rolling), and a range that
+# was summarized once is never sent to the summarizer again.
+# Event sizes come from a local estimator calibrated (in main) against the usage_metadata Gemini
+# returned in earlier runs (persistent_session.db), instead of a flat chars/4.
+token_estimator = TokenEstimator()
+
+compaction_plugin = TokenBudgetCompactionPlugin(
+    summarizer=RollingEventsSummarizer(
+        llm=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config)
+    ),
+    max_prompt_tokens=8000,
+    keep_recent_tokens=2000,
+    token_estimator=token_estimator.count_event,
+)
+
 research_app_compacting = App(
     name="research_app_compacting",
-    model = Gemini(
-        model = "gemini-2.5-flash-lite",
-        retry_options=retry_config
-    ),
-    description="A research app with compacting",
-    events_compaction_config=EventsCompactionConfig(
-        compaction_interval = 3,
-        overlap_size = 1
-    )
+    root_agent=chatbot_agent,
+    plugins=[compaction_plugin],
 )
 
+session_service = InMemorySessionService()
+# With a DatabaseSessionService, raw events replaced by a stored summary can also be removed from
+# disk (archived, with tombstones kept for resumability) by a background pruner:
+# pruner = CompactedEventPruner("compaction_sessions.db", archive_path="compaction_archive.db")
+# pruner.start_background_pruning(interval=600)
+
 # Create a new runner for our upgraded app
 research_runner_compacting = Runner(
     app=research_app_compacting, session_service=session_service
 )
 
-print("✅ Research App upgraded with Events Compaction!")
\ No newline at end of file
+print("✅ Research App upgraded with Events Compaction!")
+
+
+async def main():
+    if os.path.exists("persistent_session.db"):
+        print(f"📊 Token estimator calibration: {token_estimator.calibrate_from_session_db('persistent_session.db')}")
+    await run_session(
+        research_runner_compacting,
+        [
+            "What is the latest news about AI in healthcare?",
+            "Are there any new developments in drug discovery?",
+            "Tell me more about the second development you found.",
+            "Who are the main companies involved in that?",
+        ],
+        "compaction_demo",
+    )
+    await compaction_plugin.close()
+    print(f"\n📊 Compaction metrics: {compaction_plugin.metrics()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
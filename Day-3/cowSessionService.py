@@ -0,0 +1,144 @@
+import asyncio
+import copy
+import logging
+import time
+from typing import Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+# InMemorySessionService without the deep copies
+
+# Why: get_session/list_sessions deep-copy the whole session (every event) on every call,
+# so each turn of run_session costs O(history) in copying alone.
+# What this does:
+    # Stored events are treated as immutable: append_event stores its own copy of the event,
+    #   and nothing but append_event ever touches the stored list
+    # Reads hand out sessions whose events list is new but whose Event objects are shared with
+    #   the store (a pointer copy, no per-event work). Appends by the caller go to the caller's
+    #   list only, so other readers never see them - the copy-on-write part
+    # State is still copied (its size does not grow with history)
+# Events returned by get_session are read-only views: change session state through
+# append_event/state_delta, never by editing a returned event in place.
+
+
+class CopyOnWriteSessionService(InMemorySessionService):
+    """InMemorySessionService whose reads share immutable events instead of deep-copying them."""
+
+    def _view(self, app_name: str, user_id: str, stored: Session, events: list) -> Session:
+        # model_construct skips re-validating every event of the history.
+        view = Session.model_construct(
+            id=stored.id,
+            app_name=stored.app_name,
+            user_id=stored.user_id,
+            state=copy.deepcopy(stored.state),
+            events=events,
+            last_update_time=stored.last_update_time,
+        )
+        return self._merge_state(app_name, user_id, view)
+
+    def _get_session_impl(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        stored = self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+        if stored is None:
+            return None
+
+        events = stored.events
+        if config:
+            if config.num_recent_events:
+                events = events[-config.num_recent_events:]
+            if config.after_timestamp:
+                i = len(events) - 1
+                while i >= 0 and events[i].timestamp >= config.after_timestamp:
+                    i -= 1
+                events = events[i + 1:]
+        return self._view(app_name, user_id, stored, list(events))
+
+    def _list_sessions_impl(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        users = self.sessions.get(app_name, {})
+        if user_id is not None:
+            users = {user_id: users.get(user_id, {})}
+        return ListSessionsResponse(sessions=[
+            self._view(app_name, uid, stored, [])
+            for uid, sessions in users.items()
+            for stored in sessions.values()
+        ])
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        stored = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+        if stored is None:
+            logging.warning(f"Failed to append event to session {session.id}: session not found")
+            return event
+
+        # Update the caller's session (trims temp: keys and applies the state delta).
+        await BaseSessionService.append_event(self, session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        # The store keeps its own copy, so later edits to the caller's event cannot leak
+        # into what other readers see. This is O(size of one event), not O(history).
+        stored.events.append(event.model_copy(deep=True))
+        stored.last_update_time = event.timestamp
+
+        if event.actions and event.actions.state_delta:
+            for key, value in event.actions.state_delta.items():
+                if key.startswith(State.APP_PREFIX):
+                    self.app_state.setdefault(session.app_name, {})[key.removeprefix(State.APP_PREFIX)] = value
+                elif key.startswith(State.USER_PREFIX):
+                    self.user_state.setdefault(session.app_name, {}).setdefault(session.user_id, {})[
+                        key.removeprefix(State.USER_PREFIX)
+                    ] = value
+                elif not key.startswith(State.TEMP_PREFIX):
+                    stored.state[key] = value
+        return event
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(history_sizes=(10, 100, 1_000, 10_000), turns: int = 20):
+    """Measures per-turn session overhead (get_session + 2x append_event) as history grows."""
+    from google.genai import types
+
+    def make_event(i: int) -> Event:
+        return Event(
+            invocation_id=f"e-{i // 2}",
+            author="user" if i % 2 == 0 else "text_chat_bot",
+            content=types.Content(
+                role="user" if i % 2 == 0 else "model",
+                parts=[types.Part(text=f"message number {i} in this conversation")],
+            ),
+        )
+
+    async def per_turn(service: InMemorySessionService, history: int) -> float:
+        session = await service.create_session(app_name="bench", user_id="u1")
+        stored = service.sessions["bench"]["u1"][session.id]
+        stored.events.extend(make_event(i) for i in range(history))  # pre-fill without timing appends
+
+        started = time.perf_counter()
+        for turn in range(turns):
+            session = await service.get_session(app_name="bench", user_id="u1", session_id=session.id)
+            await service.append_event(session, make_event(history + 2 * turn))
+            await service.append_event(session, make_event(history + 2 * turn + 1))
+        return (time.perf_counter() - started) / turns
+
+    print(f"📊 Per-turn session overhead ({turns} turns per size)")
+    print(f"   {'history':>8}  {'InMemorySessionService':>24}  {'CopyOnWriteSessionService':>26}")
+    for history in history_sizes:
+        deep = await per_turn(InMemorySessionService(), history)
+        cow = await per_turn(CopyOnWriteSessionService(), history)
+        print(f"   {history:>8}  {deep * 1000:>21.3f} ms  {cow * 1000:>23.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,481 @@
+import os
+import asyncio
+import json
+import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy import bindparam, text
+
+from google.adk.events import Event
+from google.adk.sessions import DatabaseSessionService, Session
+from google.adk.sessions import _session_util
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.database_session_service import StorageEvent, StorageSession
+from google.adk.sessions.state import State
+
+# Delta-only state persistence for DatabaseSessionService
+
+# Why: DatabaseSessionService stores app, user and session state as one JSON column each. A tool
+# that sets one key (save_info in sessionState.py) rewrites the whole JSON of its scope, so every
+# state change costs O(state size) in bytes written.
+# What this does:
+    # Each state key is a row of a side table, state_entries(scope, app, user, session, key, value);
+    #   a change is a keyed upsert of the touched keys only (initial app:/user: state of
+    #   create_session too). The shared JSON columns are never rewritten - they keep whatever
+    #   state existed before the service was switched on
+    # Deltas are buffered and coalesced: several tool calls of one invocation that touch the same
+    #   keys become a single upsert per key, written when the invocation ends (final response or a
+    #   new invocation id), before any read, or when the buffer gets large
+    # The events themselves (including actions.state_delta) are still written immediately, so the
+    #   buffer is never the only copy: recover() replays the deltas of events newer than each
+    #   session's watermark (state_watermarks) after a crash
+    # State is materialized on read: get_session overlays the key rows on the stored JSON state
+    # The buffer is guarded by a lock, so the service can be shared by several threads (e.g. the
+    #   backend thread of WriteBehindSessionService and direct callers on the event loop)
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[str, str, str]
+_EntryKey = Tuple[str, str, str, str, str]  # scope, app_name, user_id, session_id, key
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS state_entries ("
+    " scope VARCHAR(8) NOT NULL, app_name VARCHAR(128) NOT NULL, user_id VARCHAR(128) NOT NULL,"
+    " session_id VARCHAR(128) NOT NULL, key VARCHAR(256) NOT NULL, value TEXT,"
+    " PRIMARY KEY (app_name, scope, user_id, session_id, key))",
+    "CREATE TABLE IF NOT EXISTS state_watermarks ("
+    " app_name VARCHAR(128) NOT NULL, user_id VARCHAR(128) NOT NULL, session_id VARCHAR(128) NOT NULL,"
+    " applied_until FLOAT NOT NULL, PRIMARY KEY (app_name, user_id, session_id))",
+)
+_UPSERT_ENTRY = text(
+    "INSERT INTO state_entries (scope, app_name, user_id, session_id, key, value)"
+    " VALUES (:scope, :app_name, :user_id, :session_id, :key, :value)"
+    " ON CONFLICT (app_name, scope, user_id, session_id, key) DO UPDATE SET value = excluded.value"
+)
+_UPSERT_WATERMARK = text(
+    "INSERT INTO state_watermarks (app_name, user_id, session_id, applied_until)"
+    " VALUES (:app_name, :user_id, :session_id, :applied_until)"
+    " ON CONFLICT (app_name, user_id, session_id) DO UPDATE SET applied_until = excluded.applied_until"
+)
+
+
+def _entry_keys(app_name: str, user_id: str, session_id: str, state_delta: Dict[str, Any]):
+    """Maps a state delta to (entry key, value) pairs, one per scope-stripped key."""
+    deltas = _session_util.extract_state_delta(state_delta)
+    for key, value in deltas["app"].items():
+        yield ("app", app_name, "", "", key), value
+    for key, value in deltas["user"].items():
+        yield ("user", app_name, user_id, "", key), value
+    for key, value in deltas["session"].items():
+        yield ("session", app_name, user_id, session_id, key), value
+
+
+class DeltaStateSessionService(DatabaseSessionService):
+    """DatabaseSessionService that persists state as coalesced per-key upserts in a side table."""
+
+    def __init__(self, db_url: str, max_pending: int = 1000, **kwargs: Any):
+        """
+        Args:
+            db_url: SQLAlchemy database URL (SQLite or PostgreSQL - the upserts use ON CONFLICT).
+            max_pending: Buffered key changes that force a flush even mid-invocation.
+            **kwargs: Passed to DatabaseSessionService / create_engine.
+        """
+        super().__init__(db_url, **kwargs)
+        with self.db_engine.begin() as conn:
+            for statement in _SCHEMA:
+                conn.execute(text(statement))
+        self.max_pending = max_pending
+        self._lock = threading.RLock()  # guards _pending, _pending_marks and _invocations
+        self._pending: "OrderedDict[_EntryKey, Any]" = OrderedDict()
+        self._pending_marks: Dict[SessionKey, float] = {}  # session -> timestamp of its last buffered event
+        self._invocations: Dict[SessionKey, str] = {}
+        self.flushes = 0
+        self.keys_written = 0
+        self.keys_coalesced = 0
+
+    # ------------------------------------------------------------------ buffer
+
+    def flush(self) -> int:
+        """Writes the buffered key changes and session watermarks in one transaction.
+
+        Returns:
+            int: Number of keys written.
+        """
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        if not self._pending and not self._pending_marks:
+            return 0
+        entries = [
+            {"scope": scope, "app_name": app_name, "user_id": user_id, "session_id": session_id,
+             "key": key, "value": json.dumps(value, default=str)}
+            for (scope, app_name, user_id, session_id, key), value in self._pending.items()
+        ]
+        marks = [
+            {"app_name": app_name, "user_id": user_id, "session_id": session_id, "applied_until": mark}
+            for (app_name, user_id, session_id), mark in self._pending_marks.items()
+        ]
+        with self.db_engine.begin() as conn:
+            if entries:
+                conn.execute(_UPSERT_ENTRY, entries)
+            if marks:
+                conn.execute(_UPSERT_WATERMARK, marks)
+        self._pending.clear()
+        self._pending_marks.clear()
+        self.flushes += 1
+        self.keys_written += len(entries)
+        return len(entries)
+
+    def _buffer(self, session: Session, event: Event) -> None:
+        # Caller holds self._lock.
+        for entry_key, value in _entry_keys(session.app_name, session.user_id, session.id, event.actions.state_delta):
+            if entry_key in self._pending:
+                self.keys_coalesced += 1
+                self._pending.move_to_end(entry_key)
+            self._pending[entry_key] = value
+        self._pending_marks[(session.app_name, session.user_id, session.id)] = event.timestamp
+
+    # ------------------------------------------------------------------ reads
+
+    def _overlay(self, sessions: List[Session]) -> None:
+        """Materializes the key rows into the sessions' merged state."""
+        if not sessions:
+            return
+        app_name = sessions[0].app_name
+        user_ids = {session.user_id for session in sessions}
+        with self.db_engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT scope, user_id, session_id, key, value FROM state_entries WHERE app_name = :app_name"
+                     " AND (scope = 'app' OR user_id IN :user_ids)").bindparams(
+                    bindparam("user_ids", expanding=True)),
+                {"app_name": app_name, "user_ids": sorted(user_ids)},
+            ).all()
+        by_session = {session.id: session for session in sessions}
+        for scope, user_id, session_id, key, value in rows:
+            value = json.loads(value) if value is not None else None
+            if scope == "app":
+                for session in sessions:
+                    session.state[State.APP_PREFIX + key] = value
+            elif scope == "user":
+                for session in sessions:
+                    if session.user_id == user_id:
+                        session.state[State.USER_PREFIX + key] = value
+            else:
+                session = by_session.get(session_id)
+                if session is not None and session.user_id == user_id:
+                    session.state[key] = value
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        self.flush()
+        # Initial session state goes to the new session row; app:/user: keys become key rows.
+        state = state or {}
+        shared = {k: v for k, v in state.items() if k.startswith((State.APP_PREFIX, State.USER_PREFIX))}
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, session_id=session_id,
+            state={k: v for k, v in state.items() if k not in shared},
+        )
+        entries = [
+            {"scope": scope, "app_name": app_name, "user_id": entry_user, "session_id": entry_session,
+             "key": key, "value": json.dumps(value, default=str)}
+            for (scope, _, entry_user, entry_session, key), value in _entry_keys(app_name, user_id, session.id, shared)
+        ]
+        with self.db_engine.begin() as conn:
+            if entries:
+                conn.execute(_UPSERT_ENTRY, entries)
+            conn.execute(_UPSERT_WATERMARK, {"app_name": app_name, "user_id": user_id,
+                                             "session_id": session.id, "applied_until": session.last_update_time})
+        self._overlay([session])
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        self.flush()
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._overlay([session])
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        self.flush()
+        response = await super().list_sessions(app_name=app_name, user_id=user_id)
+        self._overlay(response.sessions)
+        return response
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            self._pending_marks.pop(key, None)
+            self._invocations.pop(key, None)
+            for entry_key in [k for k in self._pending if k[0] == "session" and k[1:4] == key]:
+                del self._pending[entry_key]
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        with self.db_engine.begin() as conn:
+            params = {"app_name": app_name, "user_id": user_id, "session_id": session_id}
+            conn.execute(text("DELETE FROM state_entries WHERE scope = 'session' AND app_name = :app_name"
+                              " AND user_id = :user_id AND session_id = :session_id"), params)
+            conn.execute(text("DELETE FROM state_watermarks WHERE app_name = :app_name"
+                              " AND user_id = :user_id AND session_id = :session_id"), params)
+
+    # ------------------------------------------------------------------ writes
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = self._trim_temp_delta_state(event)
+        key = (session.app_name, session.user_id, session.id)
+
+        # A new invocation on this session closes the previous one's coalescing window.
+        with self._lock:
+            if self._invocations.get(key) not in (None, event.invocation_id):
+                self._flush_locked()
+            self._invocations[key] = event.invocation_id
+
+        # Same as DatabaseSessionService.append_event, minus the rewrite of the state JSON columns.
+        with self.database_session_factory() as sql_session:
+            storage_session = sql_session.get(StorageSession, key)
+            if storage_session.update_timestamp_tz > session.last_update_time:
+                raise ValueError(
+                    f"The last_update_time provided in the session object ({session.last_update_time}) is earlier"
+                    f" than the update_time in storage ({storage_session.update_timestamp_tz})."
+                    " Please check if it is a stale session."
+                )
+            # Every append bumps update_time to the event's timestamp, so stale-session detection
+            # keeps working. SQLite stores naive datetimes read back as UTC.
+            if self.db_engine.dialect.name == "sqlite":
+                storage_session.update_time = datetime.utcfromtimestamp(event.timestamp)
+            else:
+                storage_session.update_time = datetime.fromtimestamp(event.timestamp)
+            sql_session.add(StorageEvent.from_event(session, event))
+            sql_session.commit()
+            sql_session.refresh(storage_session)
+            session.last_update_time = storage_session.update_timestamp_tz
+
+        with self._lock:
+            if event.actions and event.actions.state_delta:
+                self._buffer(session, event)
+            if event.is_final_response() or len(self._pending) >= self.max_pending:
+                self._flush_locked()
+
+        # Applies the delta to the in-memory session and appends the event.
+        await BaseSessionService.append_event(self, session=session, event=event)
+        return event
+
+    async def recover(self) -> int:
+        """Replays state deltas of events written after each session's watermark (e.g. after a crash).
+
+        Sessions without a watermark predate this service; their JSON state is already complete.
+
+        Returns:
+            int: Number of events whose deltas were re-applied.
+        """
+        with self.db_engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO state_watermarks (app_name, user_id, session_id, applied_until)"
+                " SELECT s.app_name, s.user_id, s.id, 1e18 FROM sessions s LEFT JOIN state_watermarks w"
+                " ON w.app_name = s.app_name AND w.user_id = s.user_id AND w.session_id = s.id"
+                " WHERE w.session_id IS NULL"
+            ))
+            marks = conn.execute(text("SELECT app_name, user_id, session_id, applied_until FROM state_watermarks"
+                                      " WHERE applied_until < 1e18")).all()
+        replay: List[Tuple[float, Tuple[str, str, str], Event]] = []
+        with self.database_session_factory() as sql_session:
+            for app_name, user_id, session_id, applied_until in marks:
+                rows = sql_session.query(StorageEvent).filter(
+                    StorageEvent.app_name == app_name,
+                    StorageEvent.user_id == user_id,
+                    StorageEvent.session_id == session_id,
+                    StorageEvent.timestamp > datetime.fromtimestamp(applied_until),
+                ).all()
+                for row in rows:
+                    event = row.to_event()
+                    if event.actions and event.actions.state_delta:
+                        replay.append((event.timestamp, (app_name, user_id, session_id), event))
+        # Global timestamp order, so app:/user: keys shared by several sessions end at the latest write.
+        with self._lock:
+            for _, (app_name, user_id, session_id), event in sorted(replay, key=lambda item: item[0]):
+                for entry_key, value in _entry_keys(app_name, user_id, session_id, event.actions.state_delta):
+                    self._pending[entry_key] = value
+                    self._pending.move_to_end(entry_key)
+                self._pending_marks[(app_name, user_id, session_id)] = event.timestamp
+            self._flush_locked()
+        if replay:
+            logger.info("Re-applied state deltas of %d events", len(replay))
+        return len(replay)
+
+    async def close(self) -> None:
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "flushes": self.flushes,
+            "keys_written": self.keys_written,
+            "keys_coalesced": self.keys_coalesced,
+            "pending_keys": len(self._pending),
+        }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(state_sizes=(10, 100, 1000, 5000), invocations: int = 100, tool_calls: int = 3):
+    """Bytes written and append latency of state changes as user: state grows."""
+    from google.adk.events.event_actions import EventActions
+    from google.genai import types
+
+    def measure_writes(engine) -> Dict[str, int]:
+        written = {"bytes": 0, "statements": 0}
+
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            rows = parameters if executemany else [parameters]
+            written["bytes"] += sum(len(str(value)) for row in rows for value in (row.values() if isinstance(row, dict) else row or ()))
+            written["statements"] += 1
+
+        sqlalchemy_event.listen(engine, "before_cursor_execute", before_execute)
+        return written
+
+    async def run(service: DatabaseSessionService, keys: int) -> Tuple[float, float, int]:
+        initial = {f"user:pref_{i}": f"value {i} " * 4 for i in range(keys)}
+        session = await service.create_session(app_name="bench", user_id="u1", state=initial)
+        written = measure_writes(service.db_engine)
+        started = time.perf_counter()
+        for turn in range(invocations):
+            invocation_id = f"inv-{turn}"
+            # Like save_info: each tool call sets the same two keys, then the model answers.
+            for call in range(tool_calls):
+                await service.append_event(session, Event(
+                    invocation_id=invocation_id, author="bot",
+                    content=types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                        name="save_info", response={"status": "success"}))]),
+                    actions=EventActions(state_delta={"user:name": f"Sid {turn}.{call}", "user:country": "India"}),
+                ))
+            await service.append_event(session, Event(
+                invocation_id=invocation_id, author="bot",
+                content=types.Content(role="model", parts=[types.Part(text="Saved.")]),
+            ))
+        append_time = time.perf_counter() - started
+        read_time = float("inf")
+        for _ in range(5):
+            started = time.perf_counter()
+            loaded = await service.get_session(app_name="bench", user_id="u1", session_id=session.id)
+            read_time = min(read_time, time.perf_counter() - started)
+        assert loaded.state["user:name"] == f"Sid {invocations - 1}.{tool_calls - 1}"
+        assert len([k for k in loaded.state if k.startswith("user:")]) == keys + 2
+        return append_time, read_time, written["bytes"]
+
+    print(f"📊 {invocations} invocations x {tool_calls} state-changing tool calls (2 keys each)")
+    print(f"   {'user: keys':>10}  {'service':28} {'bytes written':>14} {'ms/event':>9} {'get_session ms':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for keys in state_sizes:
+            for name, factory in (("DatabaseSessionService", DatabaseSessionService),
+                                  ("DeltaStateSessionService", DeltaStateSessionService)):
+                service = factory(f"sqlite:///{os.path.join(tmp, f'{name}-{keys}.db')}")
+                append_time, read_time, written = await run(service, keys)
+                print(f"   {keys:>10,}  {name:28} {written:>14,} "
+                      f"{append_time / (invocations * (tool_calls + 1)) * 1000:>9.2f} {read_time * 1000:>15.2f}")
+                service.db_engine.dispose()
+
+        # Crash between the event writes and the coalesced flush: recover() rebuilds the keys.
+        path = f"sqlite:///{os.path.join(tmp, 'crash.db')}"
+        service = DeltaStateSessionService(path)
+        session = await service.create_session(app_name="bench", user_id="u1")
+        await service.append_event(session, Event(
+            invocation_id="inv-1", author="bot",
+            content=types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                name="save_info", response={"status": "success"}))]),
+            actions=EventActions(state_delta={"user:name": "Sid", "step": 3}),
+        ))
+        service._pending.clear()  # simulated crash: the buffer is lost
+        service._pending_marks.clear()
+        service.db_engine.dispose()
+        restarted = DeltaStateSessionService(path)
+        replayed = await restarted.recover()
+        loaded = await restarted.get_session(app_name="bench", user_id="u1", session_id=session.id)
+        print(f"✅ Crash recovery: {replayed} event(s) replayed, state = "
+              f"{ {k: loaded.state[k] for k in ('user:name', 'step')} }")
+        restarted.db_engine.dispose()
+
+
+
+async def check_adk_storage_compat():
+    """Regression check for the append_event override, which writes through ADK's private storage
+    classes: the events it stores must read back through a stock DatabaseSessionService exactly as
+    if DatabaseSessionService.append_event had written them. Fails when the ADK schema changes."""
+    from google.adk.events.event_actions import EventActions
+    from google.genai import types
+
+    for name in ("update_timestamp_tz", "update_time"):
+        assert hasattr(StorageSession, name), f"StorageSession.{name} is gone"
+    assert callable(getattr(StorageEvent, "from_event", None)), "StorageEvent.from_event is gone"
+
+    def events(invocation_id: str) -> List[Event]:
+        return [
+            Event(invocation_id=invocation_id, author="user",
+                  content=types.Content(role="user", parts=[types.Part(text="Remember my name")])),
+            Event(invocation_id=invocation_id, author="bot",
+                  content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                      id="call-1", name="save_info", args={"name": "Sid"}))])),
+            Event(invocation_id=invocation_id, author="bot",
+                  content=types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                      id="call-1", name="save_info", response={"status": "success"}))]),
+                  actions=EventActions(state_delta={"user:name": "Sid", "step": 1, "temp:scratch": "x"})),
+            Event(invocation_id=invocation_id, author="bot",
+                  content=types.Content(role="model", parts=[types.Part(text="Saved.")]),
+                  actions=EventActions(state_delta={"app:greeting": "hi"})),
+        ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        loaded, states = {}, {}
+        for factory in (DatabaseSessionService, DeltaStateSessionService):
+            url = f"sqlite:///{os.path.join(tmp, factory.__name__)}.db"
+            service = factory(url)
+            session = await service.create_session(app_name="check", user_id="u1", session_id="s1")
+            stale = session.model_copy(deep=True)
+            stale.last_update_time -= 60  # update_time has one-second resolution in SQLite
+            for event in events("inv-1"):
+                appended = await service.append_event(session, event.model_copy(deep=True))
+            assert session.last_update_time >= stale.last_update_time
+            if factory is DeltaStateSessionService:
+                assert abs(session.last_update_time - appended.timestamp) < 1e-3, "update_time is not the event's"
+            try:
+                await service.append_event(stale, events("inv-2")[0])
+                raise AssertionError(f"{factory.__name__} accepted an event for a stale session")
+            except ValueError:
+                pass
+            states[factory.__name__] = (await service.get_session(app_name="check", user_id="u1",
+                                                                  session_id="s1")).state
+            service.db_engine.dispose()
+            stock = DatabaseSessionService(url)  # reads the rows the way ADK does
+            stored = await stock.get_session(app_name="check", user_id="u1", session_id="s1")
+            loaded[factory.__name__] = [event.model_dump(exclude={"id", "timestamp"}) for event in stored.events]
+            stock.db_engine.dispose()
+    assert loaded["DeltaStateSessionService"] == loaded["DatabaseSessionService"], "stored events differ"
+    assert states["DeltaStateSessionService"] == states["DatabaseSessionService"], \
+        (states["DeltaStateSessionService"], states["DatabaseSessionService"])
+    print(f"✅ append_event override matches DatabaseSessionService: {len(loaded['DatabaseSessionService'])} "
+          f"events, state {states['DatabaseSessionService']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(check_adk_storage_compat())
+    asyncio.run(benchmark())
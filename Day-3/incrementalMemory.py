@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.memory import BaseMemoryService, InMemoryMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.sessions import Session
+from google.genai import types
+
+# Watermark-based incremental ingestion into memory
+
+# Why: auto_save_to_memory (after_agent_callback) hands the whole session to
+# add_session_to_memory after every turn, so a session of N turns is ingested N times -
+# O(N²) events processed, and stores that append what they are given keep duplicates.
+# What this does:
+    # Remembers, per (app, user, session), how far the session was already ingested:
+    #   the event count, the id and timestamp of the last event, and the ids that share that timestamp
+    # Fast path: if the event at the watermark still has the same id, only events[count:] are new
+    # Slow path (history trimmed or rewritten, e.g. by compaction or a num_recent_events read):
+    #   find the watermark again by timestamp, walking back from the end - still O(new events)
+    # Re-ingesting a session that has no new events is a no-op
+
+_Key = Tuple[str, str, str]
+
+
+class _Mark:
+    __slots__ = ("count", "last_id", "last_timestamp", "boundary_ids")
+
+    def __init__(self, count: int, last_id: str, last_timestamp: float, boundary_ids: frozenset):
+        self.count = count
+        self.last_id = last_id
+        self.last_timestamp = last_timestamp
+        self.boundary_ids = boundary_ids  # ids of ingested events with timestamp == last_timestamp
+
+
+class SessionWatermarks:
+    """Per-session ingestion watermarks.
+
+    Not thread-safe on its own; callers hold their own lock around new_events/advance.
+    """
+
+    def __init__(self):
+        self._marks: Dict[_Key, _Mark] = {}
+
+    @staticmethod
+    def _key(session: Session) -> _Key:
+        return (session.app_name, session.user_id, session.id)
+
+    def new_events(self, session: Session) -> List[Event]:
+        """Returns the events of the session that are past its watermark.
+
+        Args:
+            session: The session about to be ingested.
+
+        Returns:
+            The events not ingested yet, in session order.
+        """
+        events = session.events
+        mark = self._marks.get(self._key(session))
+        if mark is None:
+            return list(events)
+        if 0 < mark.count <= len(events) and events[mark.count - 1].id == mark.last_id:
+            return events[mark.count:]
+
+        # The prefix changed: locate the watermark by timestamp instead of by position.
+        i = len(events)
+        while i > 0 and events[i - 1].timestamp >= mark.last_timestamp:
+            i -= 1
+        return [
+            event for event in events[i:]
+            if event.timestamp > mark.last_timestamp or event.id not in mark.boundary_ids
+        ]
+
+    def advance(self, session: Session) -> Optional[_Mark]:
+        """Moves the watermark to the end of the session.
+
+        Returns:
+            The previous watermark, to hand back to restore() if ingestion fails.
+        """
+        key = self._key(session)
+        previous = self._marks.get(key)
+        events = session.events
+        if not events:
+            return previous
+
+        last = events[-1]
+        boundary = set()
+        if previous is not None and previous.last_timestamp == last.timestamp:
+            boundary.update(previous.boundary_ids)
+        i = len(events)
+        while i > 0 and events[i - 1].timestamp == last.timestamp:
+            boundary.add(events[i - 1].id)
+            i -= 1
+        self._marks[key] = _Mark(len(events), last.id, last.timestamp, frozenset(boundary))
+        return previous
+
+    def restore(self, session: Session, previous: Optional[_Mark]) -> None:
+        if previous is None:
+            self._marks.pop(self._key(session), None)
+        else:
+            self._marks[self._key(session)] = previous
+
+    def forget(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Drops the watermark of a deleted session."""
+        self._marks.pop((app_name, user_id, session_id), None)
+
+    def __len__(self) -> int:
+        return len(self._marks)
+
+
+class IncrementalMemoryService(BaseMemoryService):
+    """Wraps a memory service so that each add_session_to_memory call only forwards new events.
+
+    The wrapped service receives a session holding just the events past the watermark, so it
+    must *append* what it is given (BM25MemoryService, VectorMemoryService, Vertex AI memory
+    bank...). InMemoryMemoryService replaces a session's events on every call and must not
+    be wrapped - it would forget everything but the last turn.
+    """
+
+    def __init__(self, inner: BaseMemoryService):
+        if isinstance(inner, InMemoryMemoryService):
+            raise ValueError("InMemoryMemoryService replaces sessions on add; it cannot ingest deltas")
+        self.inner = inner
+        self.watermarks = SessionWatermarks()
+        self._lock = threading.Lock()
+        self.events_forwarded = 0
+        self.events_skipped = 0
+
+    async def add_session_to_memory(self, session: Session) -> None:
+        # Claim the delta under the lock, so two overlapping calls never forward the same events.
+        with self._lock:
+            new = self.watermarks.new_events(session)
+            if not new:
+                self.events_skipped += len(session.events)
+                return
+            previous = self.watermarks.advance(session)
+            self.events_forwarded += len(new)
+            self.events_skipped += len(session.events) - len(new)
+
+        delta = Session.model_construct(
+            id=session.id,
+            app_name=session.app_name,
+            user_id=session.user_id,
+            state=session.state,
+            events=new,
+            last_update_time=session.last_update_time,
+        )
+        try:
+            await self.inner.add_session_to_memory(delta)
+        except Exception:
+            # Give the events back so the next turn retries them.
+            with self._lock:
+                self.watermarks.restore(session, previous)
+                self.events_forwarded -= len(new)
+            raise
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        return await self.inner.search_memory(app_name=app_name, user_id=user_id, query=query)
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(turns: int = 2_000):
+    """Ingestion throughput when a growing session is saved to memory after every turn."""
+    from bm25MemoryService import BM25MemoryService
+
+    def make_event(i: int) -> Event:
+        return Event(
+            invocation_id=f"e-{i // 2}",
+            author="user" if i % 2 == 0 else "text_chat_bot",
+            timestamp=1_700_000_000 + i,
+            content=types.Content(
+                role="user" if i % 2 == 0 else "model",
+                parts=[types.Part(text=f"turn {i // 2}: my nephew liked the hotwheels car number {i}")],
+            ),
+        )
+
+    total = 2 * turns
+    events = [make_event(i) for i in range(total)]
+
+    async def run(add) -> float:
+        session = Session(id="s1", app_name="bench", user_id="u1")
+        started = time.perf_counter()
+        for i in range(0, total, 2):
+            session.events.extend(events[i:i + 2])
+            await add(session)
+        return time.perf_counter() - started
+
+    print(f"📊 Saving a {turns}-turn session to memory after every turn ({total:,} events)")
+
+    # Full re-ingest: every call walks the whole history (the behaviour without watermarks).
+    bm25 = BM25MemoryService()
+    index = bm25._index("bench", "u1")
+
+    async def full(session):
+        with bm25._lock:
+            bm25._index_events(index, session.id, session.events)
+
+    elapsed = await run(full)
+    processed = turns * (total + 2) // 2
+    print(f"   full re-ingest         {elapsed * 1000:9.1f} ms  {processed:>9,} events walked  "
+          f"{total / elapsed:10,.0f} new events/s  ({len(index.texts):,} stored)")
+
+    bm25 = BM25MemoryService()
+    elapsed = await run(bm25.add_session_to_memory)
+    stored = len(bm25._index("bench", "u1").texts)
+    print(f"   incremental (BM25)     {elapsed * 1000:9.1f} ms  {total:>9,} events walked  "
+          f"{total / elapsed:10,.0f} new events/s  ({stored:,} stored)")
+
+    wrapped = IncrementalMemoryService(BM25MemoryService())
+    elapsed = await run(wrapped.add_session_to_memory)
+    await run(wrapped.add_session_to_memory)  # same session again: nothing new is forwarded
+    stored = len(wrapped.inner._index("bench", "u1").texts)
+    print(f"   IncrementalMemoryService {elapsed * 1000:7.1f} ms  {total:>9,} events walked  "
+          f"{total / elapsed:10,.0f} new events/s  ({stored:,} stored after re-ingesting everything)")
+
+    keyword = InMemoryMemoryService()
+    elapsed = await run(keyword.add_session_to_memory)
+    print(f"   InMemoryMemoryService  {elapsed * 1000:9.1f} ms  {processed:>9,} events walked  "
+          f"{total / elapsed:10,.0f} new events/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,847 @@
+import os
+import asyncio
+import bisect
+import copy
+import hashlib
+import json
+import logging
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+# Append-only, log-structured session store
+
+# Why: sessions are append-mostly, and a relational row per event with pickled actions is a poor fit.
+# Layout of the store directory:
+    # seg-00000001.log ...  segment files of length-prefixed binary records (header + key + JSON payload)
+    # index-<gen>/<hash>.idx  one memory-mapped offset index per session:
+    #     a fixed header (latest state snapshot position) followed by one fixed-size entry per event
+    # manifest.json          checkpoint of app/user state and session metadata, written on close/compaction
+# Reads of the last N events are O(N): the index entries are sliced straight out of the mmap.
+# Every `snapshot_every` events the session state is snapshotted, so loading state only replays the
+# events written after the latest snapshot - never the full history.
+# compact() rewrites live records into fresh segments and drops deleted/superseded data. The rewrite
+# runs without the store lock; only the cut and the final swap (plus the records appended meanwhile)
+# hold it, so a background compaction does not block the event loop.
+
+_RECORD_HEADER = struct.Struct("<IIBH")  # payload length, crc32, record type, key length
+_INDEX_HEADER = struct.Struct("<4sIQII")  # magic, snapshot segment, offset, length, events covered
+_INDEX_ENTRY = struct.Struct("<IQId")  # segment, offset, record length, event timestamp
+_INDEX_HEADER_SIZE = 32
+_INDEX_MAGIC = b"LSI1"
+
+REC_CREATE = 1
+REC_EVENT = 2
+REC_SNAPSHOT = 3
+REC_DELETE = 4
+REC_APP_STATE = 5
+REC_USER_STATE = 6
+
+_SEP = "\x1f"
+
+
+def _session_key(app_name: str, user_id: str, session_id: str) -> str:
+    return _SEP.join((app_name, user_id, session_id))
+
+
+class _IndexHandle:
+    """An open index file: its size and the current read-only mapping (remapped only after growth)."""
+
+    __slots__ = ("fd", "size", "mapped")
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.size = os.fstat(fd).st_size
+        self.mapped: Optional[mmap.mmap] = None
+
+
+class _SessionMeta:
+    """What the store keeps in memory per session."""
+
+    __slots__ = ("create_time", "last_update_time", "state", "events_since_snapshot")
+
+    def __init__(self, create_time: float, last_update_time: float):
+        self.create_time = create_time
+        self.last_update_time = last_update_time
+        self.state: Optional[Dict[str, Any]] = None  # loaded lazily from snapshot + tail
+        self.events_since_snapshot = 0
+
+
+class LogStructuredSessionService(BaseSessionService):
+    """Session service that stores events in append-only segment files."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 64 * 1024 * 1024,
+        snapshot_every: int = 50,
+        fsync: bool = False,
+    ):
+        """
+        Args:
+            directory: Directory holding segments, indexes and the manifest.
+            segment_size: Size (bytes) after which a new segment file is started.
+            snapshot_every: Number of events between two state snapshots of a session.
+            fsync: fsync segment writes (durable against power loss, slower).
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, _SessionMeta] = {}
+        self._app_state: Dict[str, Dict[str, Any]] = {}
+        self._user_state: Dict[str, Dict[str, Any]] = {}
+        self._readers: Dict[int, int] = {}  # segment id -> read fd
+        self._indexes: Dict[str, _IndexHandle] = {}  # session key -> open index file (current generation)
+        self._compaction_lock = threading.Lock()  # one compaction at a time
+        self._compacting = False  # the active segment does not roll while a compaction runs
+        self._generation = 0
+        self._segments: List[int] = []
+        self._garbage_bytes = 0
+        self._compactor: Optional[asyncio.Task] = None
+        self._open()
+
+    # ------------------------------------------------------------------ files
+
+    def _segment_path(self, segment: int, suffix: str = ".log") -> str:
+        return os.path.join(self.directory, f"seg-{segment:08d}{suffix}")
+
+    def _index_dir(self, generation: Optional[int] = None) -> str:
+        return os.path.join(self.directory, f"index-{self._generation if generation is None else generation}")
+
+    def _index_path(self, key: str, generation: Optional[int] = None) -> str:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._index_dir(generation), f"{name}.idx")
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def _reader(self, segment: int) -> int:
+        fd = self._readers.get(segment)
+        if fd is None:
+            fd = os.open(self._segment_path(segment), os.O_RDONLY)
+            self._readers[segment] = fd
+        return fd
+
+    def _close_readers(self) -> None:
+        for fd in self._readers.values():
+            os.close(fd)
+        self._readers.clear()
+        for handle in self._indexes.values():
+            os.close(handle.fd)
+        self._indexes.clear()
+
+    # ------------------------------------------------------------------ records
+
+    @staticmethod
+    def _encode(record_type: int, key: str, payload: bytes) -> bytes:
+        key_bytes = key.encode("utf-8")
+        body = key_bytes + payload
+        return _RECORD_HEADER.pack(len(payload), zlib.crc32(body), record_type, len(key_bytes)) + body
+
+    def _append_record(self, record_type: int, key: str, payload: Dict[str, Any] | bytes) -> Tuple[int, int, int]:
+        """Appends one record to the active segment. Returns (segment, offset, length)."""
+        if isinstance(payload, dict):
+            payload = json.dumps(payload).encode("utf-8")
+        data = self._encode(record_type, key, payload)
+        if self._writer.tell() + len(data) > self.segment_size and self._writer.tell() > 0 and not self._compacting:
+            self._roll_segment()
+        offset = self._writer.tell()
+        self._writer.write(data)
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+        return self._segments[-1], offset, len(data)
+
+    def _roll_segment(self) -> None:
+        self._writer.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._writer = open(self._segment_path(self._segments[-1]), "ab")
+
+    def _read_record(self, segment: int, offset: int, length: int) -> Tuple[int, str, bytes]:
+        data = os.pread(self._reader(segment), length, offset)
+        size, crc, record_type, key_len = _RECORD_HEADER.unpack_from(data)
+        body = data[_RECORD_HEADER.size:]
+        if zlib.crc32(body) != crc:
+            raise IOError(f"Corrupt record in segment {segment} at offset {offset}")
+        return record_type, body[:key_len].decode("utf-8"), body[key_len:]
+
+    def _scan_segment(self, segment: int, start: int = 0):
+        """Yields (offset, length, type, key, payload) and truncates a torn tail record."""
+        path = self._segment_path(segment)
+        with open(path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                size, crc, record_type, key_len = _RECORD_HEADER.unpack(header)
+                body = f.read(key_len + size)
+                if len(body) < key_len + size or zlib.crc32(body) != crc:
+                    break
+                length = _RECORD_HEADER.size + len(body)
+                yield offset, length, record_type, body[:key_len].decode("utf-8"), body[key_len:]
+                offset += length
+        if offset < os.path.getsize(path):
+            logging.warning(f"[LogStore] Truncating torn record at {path}:{offset}")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    # ------------------------------------------------------------------ index files
+
+    @staticmethod
+    def _write_empty_index(path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, 0, 0, 0, 0).ljust(_INDEX_HEADER_SIZE, b"\0"))
+
+    def _create_index(self, key: str) -> None:
+        self._write_empty_index(self._index_path(key))
+
+    def _index(self, key: str) -> _IndexHandle:
+        handle = self._indexes.get(key)
+        if handle is None:
+            handle = self._indexes[key] = _IndexHandle(os.open(self._index_path(key), os.O_RDWR))
+        return handle
+
+    def _remove_index(self, key: str) -> None:
+        handle = self._indexes.pop(key, None)
+        if handle is not None:
+            os.close(handle.fd)
+        if os.path.exists(self._index_path(key)):
+            os.remove(self._index_path(key))
+
+    def _index_append(self, key: str, segment: int, offset: int, length: int, timestamp: float) -> None:
+        handle = self._index(key)
+        os.pwrite(handle.fd, _INDEX_ENTRY.pack(segment, offset, length, timestamp), handle.size)
+        handle.size += _INDEX_ENTRY.size
+
+    def _index_set_snapshot(self, key: str, segment: int, offset: int, length: int, events: int) -> None:
+        os.pwrite(self._index(key).fd, _INDEX_HEADER.pack(_INDEX_MAGIC, segment, offset, length, events), 0)
+
+    def _index_last(self, key: str) -> Optional[Tuple[int, int, int, float]]:
+        handle = self._index(key)
+        if handle.size <= _INDEX_HEADER_SIZE:
+            return None
+        return _INDEX_ENTRY.unpack(os.pread(handle.fd, _INDEX_ENTRY.size, handle.size - _INDEX_ENTRY.size))
+
+    def _index_read(self, key: str) -> Tuple[Tuple[int, int, int, int], "IndexView"]:
+        """Returns (snapshot header, entry view) from the session's mapping, remapped if the file grew."""
+        handle = self._index(key)
+        if handle.mapped is None or len(handle.mapped) != handle.size:
+            # The previous mapping is left to views still holding it; the header is shared memory,
+            # so snapshot updates are visible without a remap.
+            handle.mapped = mmap.mmap(handle.fd, handle.size, access=mmap.ACCESS_READ)
+        _, seg, off, length, events = _INDEX_HEADER.unpack_from(handle.mapped)
+        return (seg, off, length, events), IndexView(handle.mapped)
+
+    # ------------------------------------------------------------------ startup / checkpoint
+
+    def _open(self) -> None:
+        # Leftovers of an interrupted compaction are resolved against the manifest.
+        manifest: Dict[str, Any] = {}
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        self._generation = manifest.get("generation", 0)
+        listed = set(manifest.get("segments", []))
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".compact"):
+                segment = int(name[4:12])
+                if segment in listed:
+                    os.replace(path, self._segment_path(segment))
+                else:
+                    os.remove(path)
+            elif name.startswith("index-") and name != os.path.basename(self._index_dir()):
+                shutil.rmtree(path, ignore_errors=True)
+
+        segments = sorted(
+            int(name[4:12]) for name in os.listdir(self.directory)
+            if name.startswith("seg-") and name.endswith(".log")
+        )
+        if listed:
+            for segment in [s for s in segments if s < min(listed)]:
+                os.remove(self._segment_path(segment))  # superseded by a finished compaction
+            segments = [s for s in segments if s >= min(listed)]
+        self._segments = segments or [1]
+        os.makedirs(self._index_dir(), exist_ok=True)
+
+        self._app_state = manifest.get("app_state", {})
+        self._user_state = manifest.get("user_state", {})
+        self._garbage_bytes = manifest.get("garbage_bytes", 0)
+        for key, (create_time, last_update_time) in manifest.get("sessions", {}).items():
+            self._sessions[key] = _SessionMeta(create_time, last_update_time)
+
+        # Catch up on records written after the last checkpoint.
+        tail_segment, tail_offset = manifest.get("tail", [self._segments[0], 0])
+        for segment in self._segments:
+            if segment < tail_segment or not os.path.exists(self._segment_path(segment)):
+                continue
+            start = tail_offset if segment == tail_segment else 0
+            for offset, length, record_type, key, payload in self._scan_segment(segment, start):
+                self._replay(segment, offset, length, record_type, key, payload)
+
+        self._writer = open(self._segment_path(self._segments[-1]), "ab")
+
+    def _replay(self, segment: int, offset: int, length: int, record_type: int, key: str, payload: bytes) -> None:
+        """Applies a record found during the startup catch-up scan."""
+        if record_type == REC_CREATE:
+            data = json.loads(payload)
+            self._sessions[key] = _SessionMeta(data["create_time"], data["create_time"])
+            if not os.path.exists(self._index_path(key)):
+                self._create_index(key)
+        elif record_type == REC_EVENT and key in self._sessions:
+            last = self._index_last(key)
+            timestamp = json.loads(payload)["timestamp"]
+            # The index is written right after the log, so only the newest entry can be missing.
+            if last is None or (last[0], last[1]) < (segment, offset):
+                self._index_append(key, segment, offset, length, timestamp)
+            self._sessions[key].last_update_time = timestamp
+        elif record_type == REC_SNAPSHOT and key in self._sessions:
+            self._index_set_snapshot(key, segment, offset, length, json.loads(payload)["events"])
+        elif record_type == REC_DELETE:
+            if self._sessions.pop(key, None):
+                self._remove_index(key)
+        elif record_type == REC_APP_STATE:
+            self._app_state.setdefault(key, {}).update(json.loads(payload))
+        elif record_type == REC_USER_STATE:
+            self._user_state.setdefault(key, {}).update(json.loads(payload))
+
+    def _write_manifest(self, segments: List[int], tail: Tuple[int, int]) -> None:
+        manifest = {
+            "generation": self._generation,
+            "segments": segments,
+            "tail": list(tail),
+            "garbage_bytes": self._garbage_bytes,
+            "app_state": self._app_state,
+            "user_state": self._user_state,
+            "sessions": {
+                key: [meta.create_time, meta.last_update_time] for key, meta in self._sessions.items()
+            },
+        }
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+
+    def checkpoint(self) -> None:
+        """Writes the manifest so the next startup only scans newer records."""
+        with self._lock:
+            self._writer.flush()
+            self._write_manifest(self._segments, (self._segments[-1], self._writer.tell()))
+
+    async def close(self) -> None:
+        if self._compactor:
+            self._compactor.cancel()
+            self._compactor = None
+        self.checkpoint()
+        with self._lock:
+            self._writer.close()
+            self._close_readers()
+
+    # ------------------------------------------------------------------ state helpers
+
+    def _load_state(self, key: str) -> Dict[str, Any]:
+        """Session-scoped state: latest snapshot plus the deltas of the events after it."""
+        meta = self._sessions[key]
+        if meta.state is not None:
+            return meta.state
+        (seg, off, length, covered), entries = self._index_read(key)
+        state: Dict[str, Any] = {}
+        if length:
+            _, _, payload = self._read_record(seg, off, length)
+            state = json.loads(payload)["state"]
+        for entry in entries[covered:]:
+            event = self._decode_event(entry)
+            if event.actions and event.actions.state_delta:
+                state.update(_session_delta(event.actions.state_delta))
+        meta.state = state
+        meta.events_since_snapshot = len(entries) - covered
+        return state
+
+    def _decode_event(self, entry: Tuple[int, int, int, float]) -> Event:
+        _, _, payload = self._read_record(entry[0], entry[1], entry[2])
+        return Event.model_validate_json(payload)
+
+    def _merged_state(self, app_name: str, user_id: str, session_state: Dict[str, Any]) -> Dict[str, Any]:
+        merged = copy.deepcopy(session_state)
+        for key, value in self._app_state.get(app_name, {}).items():
+            merged[State.APP_PREFIX + key] = value
+        for key, value in self._user_state.get(_SEP.join((app_name, user_id)), {}).items():
+            merged[State.USER_PREFIX + key] = value
+        return merged
+
+    def _apply_shared_deltas(self, app_name: str, user_id: str, state: Optional[Dict[str, Any]]) -> None:
+        app_delta, user_delta = {}, {}
+        for key, value in (state or {}).items():
+            if key.startswith(State.APP_PREFIX):
+                app_delta[key.removeprefix(State.APP_PREFIX)] = value
+            elif key.startswith(State.USER_PREFIX):
+                user_delta[key.removeprefix(State.USER_PREFIX)] = value
+        if app_delta:
+            _, _, length = self._append_record(REC_APP_STATE, app_name, app_delta)
+            self._garbage_bytes += length  # fully folded into the manifest at the next checkpoint
+            self._app_state.setdefault(app_name, {}).update(app_delta)
+        if user_delta:
+            user_key = _SEP.join((app_name, user_id))
+            _, _, length = self._append_record(REC_USER_STATE, user_key, user_delta)
+            self._garbage_bytes += length
+            self._user_state.setdefault(user_key, {}).update(user_delta)
+
+    # ------------------------------------------------------------------ BaseSessionService
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        key = _session_key(app_name, user_id, session_id)
+        with self._lock:
+            if key in self._sessions:
+                raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+            now = time.time()
+            session_state = _session_delta(state or {})
+            self._append_record(REC_CREATE, key, {"create_time": now})
+            self._create_index(key)
+            meta = _SessionMeta(now, now)
+            self._sessions[key] = meta
+            self._apply_shared_deltas(app_name, user_id, state)
+            if session_state:
+                self._write_snapshot(key, meta, session_state, 0)
+            meta.state = session_state
+            return Session(
+                id=session_id,
+                app_name=app_name,
+                user_id=user_id,
+                state=self._merged_state(app_name, user_id, session_state),
+                last_update_time=now,
+            )
+
+    def _write_snapshot(self, key: str, meta: _SessionMeta, state: Dict[str, Any], events: int) -> None:
+        (_, _, old_length, _), _ = self._index_read(key)
+        seg, off, length = self._append_record(REC_SNAPSHOT, key, {"state": state, "events": events})
+        self._index_set_snapshot(key, seg, off, length, events)
+        self._garbage_bytes += old_length
+        meta.events_since_snapshot = 0
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = _session_key(app_name, user_id, session_id)
+        with self._lock:
+            meta = self._sessions.get(key)
+            if meta is None:
+                return None
+            session_state = self._load_state(key)
+            _, entries = self._index_read(key)
+
+            start = 0
+            if config and config.after_timestamp:
+                start = entries.bisect_timestamp(config.after_timestamp)
+            if config and config.num_recent_events:
+                start = max(start, len(entries) - config.num_recent_events)
+            events = [self._decode_event(entry) for entry in entries[start:]]
+
+            return Session(
+                id=session_id,
+                app_name=app_name,
+                user_id=user_id,
+                state=self._merged_state(app_name, user_id, session_state),
+                events=events,
+                last_update_time=meta.last_update_time,
+            )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        sessions = []
+        with self._lock:
+            for key, meta in self._sessions.items():
+                key_app, key_user, session_id = key.split(_SEP)
+                if key_app != app_name or (user_id is not None and key_user != user_id):
+                    continue
+                sessions.append(Session(
+                    id=session_id,
+                    app_name=key_app,
+                    user_id=key_user,
+                    state=self._merged_state(key_app, key_user, self._load_state(key)),
+                    last_update_time=meta.last_update_time,
+                ))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = _session_key(app_name, user_id, session_id)
+        with self._lock:
+            if key not in self._sessions:
+                return
+            (_, _, snapshot_length, _), entries = self._index_read(key)
+            self._garbage_bytes += snapshot_length + sum(entry[2] for entry in entries)
+            self._append_record(REC_DELETE, key, b"")
+            del self._sessions[key]
+            self._remove_index(key)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        key = _session_key(session.app_name, session.user_id, session.id)
+        with self._lock:
+            known = key in self._sessions
+        if not known:
+            logging.warning(f"[LogStore] Failed to append event to unknown session {session.id}")
+            return event
+
+        # Updates the caller's session (trims temp: keys, applies the delta); no store data involved.
+        await super().append_event(session=session, event=event)
+
+        with self._lock:
+            meta = self._sessions.get(key)
+            if meta is None:
+                return event  # deleted in the meantime
+            state = self._load_state(key)
+            seg, off, length = self._append_record(
+                REC_EVENT, key, event.model_dump_json(exclude_none=True).encode("utf-8")
+            )
+            self._index_append(key, seg, off, length, event.timestamp)
+            meta.last_update_time = event.timestamp
+            session.last_update_time = event.timestamp
+
+            if event.actions and event.actions.state_delta:
+                state.update(_session_delta(event.actions.state_delta))
+                self._apply_shared_deltas(session.app_name, session.user_id, event.actions.state_delta)
+
+            meta.events_since_snapshot += 1
+            if meta.events_since_snapshot >= self.snapshot_every:
+                _, entries = self._index_read(key)
+                self._write_snapshot(key, meta, state, len(entries))
+        return event
+
+    # ------------------------------------------------------------------ compaction
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(
+                os.path.getsize(self._segment_path(s)) for s in self._segments
+                if os.path.exists(self._segment_path(s))
+            )
+        return {
+            "sessions": len(self._sessions),
+            "segments": len(self._segments),
+            "total_bytes": total,
+            "garbage_bytes": self._garbage_bytes,
+            "garbage_ratio": self._garbage_bytes / total if total else 0.0,
+        }
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrites live data into new segments and a new index generation.
+
+        Each live session becomes: CREATE, its events (raw bytes, no re-encoding) and one
+        snapshot of its current state. App/user state moves to the manifest.
+
+        The store lock is held only to take the cut (the log position the rewrite copies up to)
+        and for the swap at the end, which also carries over whatever was appended after the cut.
+
+        Returns:
+            Dict[str, int]: Segment bytes before and after compaction.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                before = self.stats()["total_bytes"]
+                self._writer.flush()
+                cut = (self._segments[-1], self._writer.tell())
+                # The compacted segments are numbered after the cut segment, so appends stay in it.
+                self._compacting = True
+                new_generation = self._generation + 1
+                old_index_dir = self._index_dir()
+                live = []
+                for key, meta in self._sessions.items():
+                    header = _INDEX_HEADER.unpack(os.pread(self._index(key).fd, _INDEX_HEADER.size, 0))[1:]
+                    live.append((key, meta.create_time, header, dict(meta.state) if meta.state is not None else None))
+
+            output = _CompactionOutput(self, cut[0] + 1, self._index_dir(new_generation) + ".tmp")
+            try:
+                for key, create_time, header, state in live:
+                    output.copy_session(old_index_dir, key, create_time, header, state, cut)
+                with self._lock:
+                    return self._finish_compaction(output, cut, new_generation, old_index_dir, live, before)
+            finally:
+                output.close()
+                with self._lock:
+                    self._compacting = False
+
+    def _finish_compaction(self, output: "_CompactionOutput", cut: Tuple[int, int], new_generation: int,
+                           old_index_dir: str, live: List[Tuple], before: int) -> Dict[str, int]:
+        """Swap step of compact(), under the store lock."""
+        # Records appended after the cut go to the new segments too, in log order.
+        self._writer.flush()
+        for _, _, record_type, key, payload in self._scan_segment(cut[0], cut[1]):
+            output.carry(record_type, key, payload)
+        for key, _, _, _ in live:
+            if key in self._sessions:
+                self._sessions[key].events_since_snapshot = output.events_after_snapshot.get(key, 0)
+        tail = output.finish()
+
+        # Commit point: the manifest names the new generation and segments.
+        os.replace(output.index_dir, self._index_dir(new_generation))
+        old_segments = list(self._segments)
+        self._writer.close()
+        self._close_readers()
+        self._generation = new_generation
+        self._garbage_bytes = 0
+        self._write_manifest(output.segments, tail)
+
+        for seg in output.segments:
+            os.replace(self._segment_path(seg, ".compact"), self._segment_path(seg))
+        for seg in old_segments:
+            os.remove(self._segment_path(seg))
+        shutil.rmtree(old_index_dir, ignore_errors=True)
+
+        self._segments = output.segments
+        self._writer = open(self._segment_path(self._segments[-1]), "ab")
+        return {"bytes_before": before, "bytes_after": self.stats()["total_bytes"]}
+
+    def start_background_compaction(self, interval: float = 60.0, min_garbage_ratio: float = 0.5) -> None:
+        """Periodically compacts in a worker thread when enough of the log is garbage."""
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                if self.stats()["garbage_ratio"] >= min_garbage_ratio:
+                    result = await asyncio.to_thread(self.compact)
+                    logging.info(f"[LogStore] Compacted segments: {result}")
+
+        self._compactor = asyncio.get_running_loop().create_task(loop())
+
+
+class _CompactionOutput:
+    """New segments and index files being written by compact(), with its own file handles."""
+
+    def __init__(self, store: LogStructuredSessionService, first_segment: int, index_dir: str):
+        self.store = store
+        self.segments = [first_segment]
+        self.index_dir = index_dir
+        self.events_after_snapshot: Dict[str, int] = {}
+        os.makedirs(index_dir, exist_ok=True)
+        self._out = open(store._segment_path(first_segment, ".compact"), "wb")
+        self._readers: Dict[int, int] = {}
+
+    def _write(self, data: bytes) -> Tuple[int, int]:
+        if self._out.tell() + len(data) > self.store.segment_size and self._out.tell() > 0:
+            self._out.close()
+            self.segments.append(self.segments[-1] + 1)
+            self._out = open(self.store._segment_path(self.segments[-1], ".compact"), "wb")
+        offset = self._out.tell()
+        self._out.write(data)
+        return self.segments[-1], offset
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        fd = self._readers.get(segment)
+        if fd is None:
+            fd = self._readers[segment] = os.open(self.store._segment_path(segment), os.O_RDONLY)
+        return os.pread(fd, length, offset)
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.index_dir, os.path.basename(self.store._index_path(key)))
+
+    def copy_session(self, old_index_dir: str, key: str, create_time: float, header: Tuple[int, int, int, int],
+                     state: Optional[Dict[str, Any]], cut: Tuple[int, int]) -> None:
+        """Copies a session's events before the cut, then a snapshot of its state at the cut."""
+        try:
+            with open(os.path.join(old_index_dir, os.path.basename(self.store._index_path(key))), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return  # deleted after the cut; its DELETE record is carried over at the swap
+        entries = IndexView(mapped)
+        count = len(entries)
+        while count and (entries[count - 1][0], entries[count - 1][1]) >= cut:
+            count -= 1  # appended after the cut
+        if state is None:
+            # Not loaded in memory: latest snapshot (taken at the cut) plus the deltas after it.
+            seg, off, length, covered = header
+            state = {}
+            if length:
+                record = self._read(seg, off, length)
+                state = json.loads(record[_RECORD_HEADER.size + len(key.encode("utf-8")):])["state"]
+            for entry in entries[covered:count]:
+                raw = self._read(entry[0], entry[1], entry[2])
+                event = Event.model_validate_json(raw[_RECORD_HEADER.size + len(key.encode("utf-8")):])
+                if event.actions and event.actions.state_delta:
+                    state.update(_session_delta(event.actions.state_delta))
+        with open(self._index_path(key), "wb") as index:
+            self._write(self.store._encode(REC_CREATE, key, json.dumps({"create_time": create_time}).encode()))
+            index.write(b"\0" * _INDEX_HEADER_SIZE)
+            for entry in entries[:count]:
+                seg, off = self._write(self._read(entry[0], entry[1], entry[2]))
+                index.write(_INDEX_ENTRY.pack(seg, off, entry[2], entry[3]))
+            snapshot = self.store._encode(REC_SNAPSHOT, key, json.dumps({"state": state, "events": count}).encode())
+            seg, off = self._write(snapshot)
+            index.seek(0)
+            index.write(_INDEX_HEADER.pack(_INDEX_MAGIC, seg, off, len(snapshot), count))
+        mapped.close()
+
+    def carry(self, record_type: int, key: str, payload: bytes) -> None:
+        """Re-applies a record appended after the cut to the new segments and index files."""
+        if record_type in (REC_APP_STATE, REC_USER_STATE):
+            return  # the manifest written at the swap holds the current app/user state
+        path = self._index_path(key)
+        if record_type == REC_DELETE:
+            if os.path.exists(path):
+                os.remove(path)
+            self.events_after_snapshot.pop(key, None)
+            return
+        if record_type != REC_CREATE and not os.path.exists(path):
+            return
+        data = self.store._encode(record_type, key, payload)
+        seg, off = self._write(data)
+        if record_type == REC_CREATE:
+            self.store._write_empty_index(path)
+            self.events_after_snapshot[key] = 0
+        elif record_type == REC_EVENT:
+            with open(path, "ab") as index:
+                index.write(_INDEX_ENTRY.pack(seg, off, len(data), json.loads(payload)["timestamp"]))
+            self.events_after_snapshot[key] = self.events_after_snapshot.get(key, 0) + 1
+        elif record_type == REC_SNAPSHOT:
+            with open(path, "r+b") as index:
+                index.write(_INDEX_HEADER.pack(_INDEX_MAGIC, seg, off, len(data), json.loads(payload)["events"]))
+            self.events_after_snapshot[key] = 0
+
+    def finish(self) -> Tuple[int, int]:
+        """Makes the new segments durable and returns the tail position for the manifest."""
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        return self.segments[-1], self._out.tell()
+
+    def close(self) -> None:
+        self._out.close()
+        for fd in self._readers.values():
+            os.close(fd)
+        self._readers.clear()
+
+
+class IndexView:
+    """Read-only view over the fixed-size entries of a memory-mapped index file."""
+
+    def __init__(self, mapped: mmap.mmap):
+        self._mapped = mapped
+        self._count = (len(mapped) - _INDEX_HEADER_SIZE) // _INDEX_ENTRY.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self._count))]
+        if item < 0:
+            item += self._count
+        if not 0 <= item < self._count:
+            raise IndexError(item)
+        return _INDEX_ENTRY.unpack_from(self._mapped, _INDEX_HEADER_SIZE + item * _INDEX_ENTRY.size)
+
+    def bisect_timestamp(self, timestamp: float) -> int:
+        """First entry with an event timestamp >= `timestamp` (events are appended in time order)."""
+        return bisect.bisect_left(range(self._count), timestamp, key=lambda i: self[i][3])
+
+
+def _session_delta(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value
+        for key, value in state.items()
+        if not key.startswith((State.APP_PREFIX, State.USER_PREFIX, State.TEMP_PREFIX))
+    }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(sessions: int = 20, events_per_session: int = 200, tail: int = 10):
+    """Compares append and load latency with the SQLite-backed DatabaseSessionService."""
+    from google.adk.events import EventActions
+    from google.adk.sessions import DatabaseSessionService
+    from google.genai import types
+
+    def make_event(i: int) -> Event:
+        return Event(
+            invocation_id=f"inv-{i}",
+            author="user" if i % 2 == 0 else "text_chat_bot",
+            content=types.Content(role="user", parts=[types.Part(text=f"message {i} " * 20)]),
+            actions=EventActions(state_delta={"turn": i}),
+        )
+
+    async def measure(service: BaseSessionService) -> Dict[str, float]:
+        created = [
+            await service.create_session(app_name="bench", user_id=f"u{s}", session_id=f"s{s}")
+            for s in range(sessions)
+        ]
+        started = time.perf_counter()
+        for i in range(events_per_session):
+            for session in created:
+                await service.append_event(session, make_event(i))
+        append = (time.perf_counter() - started) / (sessions * events_per_session)
+
+        started = time.perf_counter()
+        for s in range(sessions):
+            await service.get_session(app_name="bench", user_id=f"u{s}", session_id=f"s{s}")
+        load_full = (time.perf_counter() - started) / sessions
+
+        started = time.perf_counter()
+        for s in range(sessions):
+            await service.get_session(
+                app_name="bench", user_id=f"u{s}", session_id=f"s{s}",
+                config=GetSessionConfig(num_recent_events=tail),
+            )
+        load_tail = (time.perf_counter() - started) / sessions
+        return {"append": append, "load_full": load_full, "load_tail": load_tail}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = await measure(DatabaseSessionService(db_url=f"sqlite:///{tmp}/sessions.db"))
+        log_store = LogStructuredSessionService(os.path.join(tmp, "log"))
+        log_structured = await measure(log_store)
+
+        # A cold store has to rebuild session state from snapshots, not from full history.
+        await log_store.close()
+        reopened = LogStructuredSessionService(os.path.join(tmp, "log"))
+        started = time.perf_counter()
+        for s in range(sessions):
+            await reopened.get_session(
+                app_name="bench", user_id=f"u{s}", session_id=f"s{s}",
+                config=GetSessionConfig(num_recent_events=tail),
+            )
+        cold_tail = (time.perf_counter() - started) / sessions
+        await reopened.close()
+
+    print(f"📊 {sessions} sessions x {events_per_session} events")
+    print(f"   {'':28}{'DatabaseSessionService':>24}{'LogStructured':>16}")
+    print(f"   {'append_event':28}{database['append'] * 1000:>21.3f} ms{log_structured['append'] * 1000:>13.3f} ms")
+    print(f"   {'get_session (all events)':28}{database['load_full'] * 1000:>21.3f} ms{log_structured['load_full'] * 1000:>13.3f} ms")
+    print(f"   {f'get_session (last {tail})':28}{database['load_tail'] * 1000:>21.3f} ms{log_structured['load_tail'] * 1000:>13.3f} ms")
+    print(f"   {f'cold get_session (last {tail})':28}{'':>24}{cold_tail * 1000:>13.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
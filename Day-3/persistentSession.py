@@ -15,6 +15,9 @@ from google.adk.runners import Runner
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
+from cachedSessionService import WriteBehindSessionService
+from deltaStateSessionService import DeltaStateSessionService
+
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -93,7 +96,16 @@ chatbot_agent = LlmAgent(
 # Step 2: Switch to DatabaseSessionService
 # SQLite database will be created automatically
 db_url = "sqlite:///persistent_session.db"
-session_service = DatabaseSessionService(db_url=db_url)
+
+# Step 2b: Put a write-behind cache in front of the database
+# Reads are served from memory and events are flushed to SQLite in the background.
+# The write-ahead log lets recover() replay anything a crash left un-flushed.
+# State changes are stored as per-key rows instead of rewriting the whole state JSON each time.
+database_service = DeltaStateSessionService(db_url=db_url)
+session_service = WriteBehindSessionService(
+    database_service,
+    wal_path="persistent_session.wal",
+)
 
 # Step 3: Create a new runner with persistent storage
 runner = Runner(
@@ -103,11 +115,19 @@ runner = Runner(
 )
 
 async def main():
+    await database_service.recover()
+    await session_service.recover()
+
     await run_session(
         runner,
         ["Hello! what is my name?"],
         "test-db-session-01"
     )
 
+    # Make sure everything reached the database before exiting
+    await session_service.close()
+    await database_service.close()
+    print(f"📊 Session cache metrics: {session_service.metrics()}")
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
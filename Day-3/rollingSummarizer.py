@@ -0,0 +1,250 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from google.adk.apps.base_events_summarizer import BaseEventsSummarizer
+from google.adk.events import Event
+from google.adk.events.event_actions import EventActions, EventCompaction
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+# Rolling (incremental) summaries for events compaction
+
+# Why: LlmEventSummarizer summarizes whatever window it is handed from raw events. With
+# EventsCompactionConfig(overlap_size=1) every compaction re-reads the overlapping invocation,
+# and a history-wide window grows with the session. A retried or replayed turn pays again.
+# What this does:
+    # The summarizer gets the previous summary plus only the events added since. Events that an
+    #   earlier summary already covered (the sliding-window overlap) are dropped from the input
+    # Each summary event covers only its new range. ADK's contents processor puts every compaction
+    #   event into the prompt, so a cumulative summary would repeat earlier ones
+    # Summaries are cached by (first event id, last event id, number of events). Event ids are
+    #   UUIDs, so the key identifies the session and the range; the same range is never summarized twice
+
+_Key = Tuple[str, str, int]
+
+
+class _Summary:
+    __slots__ = ("text", "start_timestamp", "end_timestamp")
+
+    def __init__(self, text: str, start_timestamp: float, end_timestamp: float):
+        self.text = text
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+
+
+def _compaction_text(event: Event) -> str:
+    compaction = event.actions.compaction if event.actions else None
+    if not compaction or not compaction.compacted_content or not compaction.compacted_content.parts:
+        return ""
+    return " ".join(part.text for part in compaction.compacted_content.parts if part.text)
+
+
+class RollingEventsSummarizer(BaseEventsSummarizer):
+    """Summarizes only new events, with the previous summary as context, and caches every range."""
+
+    _PROMPT_TEMPLATE = (
+        "You keep a running summary of a conversation between a user and an AI agent.\n"
+        "Summary so far (context only, do not repeat it):\n{previous_summary}\n\n"
+        "New part of the conversation:\n{new_events}\n\n"
+        "Write a concise summary of the new part only, focusing on key information, decisions "
+        "and unresolved questions or tasks."
+    )
+
+    def __init__(self, llm: BaseLlm, prompt_template: Optional[str] = None, max_cached: int = 10_000):
+        """
+        Args:
+            llm: The LLM used for summarization.
+            prompt_template: Optional template with {previous_summary} and {new_events} placeholders.
+            max_cached: Number of summarized ranges (and covered events) remembered.
+        """
+        self._llm = llm
+        self._prompt_template = prompt_template or self._PROMPT_TEMPLATE
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[_Key, _Summary]" = OrderedDict()
+        self._covered: "OrderedDict[str, _Summary]" = OrderedDict()  # event id -> summary covering it
+        self._locks: Dict[_Key, asyncio.Lock] = {}
+        self.calls = 0
+        self.cache_hits = 0
+        self.input_chars = 0
+
+    @staticmethod
+    def _format(events: List[Event]) -> str:
+        lines = []
+        for event in events:
+            if event.content and event.content.parts:
+                for part in event.content.parts:
+                    if part.text:
+                        lines.append(f"{event.author}: {part.text}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _to_event(summary: _Summary) -> Event:
+        return Event(
+            author="user",
+            invocation_id=Event.new_id(),
+            actions=EventActions(compaction=EventCompaction(
+                start_timestamp=summary.start_timestamp,
+                end_timestamp=summary.end_timestamp,
+                compacted_content=types.Content(role="model", parts=[types.Part(text=summary.text)]),
+            )),
+        )
+
+    def _remember(self, key: _Key, summary: _Summary, events: List[Event]) -> None:
+        self._cache[key] = summary
+        for event in events:
+            self._covered[event.id] = summary
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        while len(self._covered) > self.max_cached * 8:
+            self._covered.popitem(last=False)
+
+    async def maybe_summarize_events(
+        self, *, events: List[Event], previous_summary: Optional[Event] = None
+    ) -> Optional[Event]:
+        """Summarizes the events not covered by an earlier summary.
+
+        Args:
+            events: Events to compact (may start with already summarized ones).
+            previous_summary: Latest compaction event of the session, if the caller knows it.
+                Otherwise the summary that covered the leading overlap is used.
+
+        Returns:
+            A compaction event for the new range (the cached one for a range summarized before),
+            or None if there were no events.
+        """
+        events = [event for event in events if not (event.actions and event.actions.compaction)]
+        previous_text = _compaction_text(previous_summary) if previous_summary else ""
+        start = 0
+        while start < len(events) and events[start].id in self._covered:
+            previous_text = previous_text or self._covered[events[start].id].text
+            start += 1
+        if start and not previous_text:
+            previous_text = self._covered[events[start - 1].id].text
+        delta = events[start:]
+        if not delta:
+            # Everything is summarized already: a replay of a range we have seen.
+            if not events:
+                return None
+            self.cache_hits += 1
+            return self._to_event(self._covered[events[-1].id])
+
+        key = (delta[0].id, delta[-1].id, len(delta))
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:  # a retry racing with the original waits for it instead of calling the LLM
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return self._to_event(cached)
+
+                prompt = self._prompt_template.format(
+                    previous_summary=previous_text or "(none)", new_events=self._format(delta)
+                )
+                request = LlmRequest(
+                    model=self._llm.model, contents=[types.Content(role="user", parts=[types.Part(text=prompt)])]
+                )
+                self.calls += 1
+                self.input_chars += len(prompt)
+                text = None
+                async for response in self._llm.generate_content_async(request, stream=False):
+                    if response.content and response.content.parts:
+                        text = " ".join(part.text for part in response.content.parts if part.text)
+                        break
+                if not text:
+                    return None
+                summary = _Summary(text, delta[0].timestamp, delta[-1].timestamp)
+                self._remember(key, summary, delta)
+        finally:
+            if not lock.locked():
+                self._locks.pop(key, None)
+        return self._to_event(summary)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "input_tokens": self.input_chars // 4,
+            "mean_input_tokens": self.input_chars // 4 / self.calls if self.calls else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(turns: int = 500, interval: int = 3):
+    """Summarizer input tokens over a synthetic session compacted by ADK's sliding window."""
+    from google.adk.agents import LlmAgent
+    from google.adk.apps.app import App, EventsCompactionConfig
+    from google.adk.apps.compaction import _run_compaction_for_sliding_window
+    from google.adk.apps.llm_event_summarizer import LlmEventSummarizer
+    from google.adk.models.llm_response import LlmResponse
+
+    from cowSessionService import CopyOnWriteSessionService
+
+    class CountingLlm(BaseLlm):
+        """Stand-in summarization model: records prompt sizes and returns a fixed-size summary."""
+
+        prompt_chars: List[int] = []
+
+        async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+            self.prompt_chars.append(sum(len(p.text or "") for c in llm_request.contents for p in c.parts or []))
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text="Summary. " * 30)]))
+
+    async def run(summarizer: BaseEventsSummarizer, llm: CountingLlm, overlap: int, replay: bool) -> float:
+        app = App(
+            name="bench",
+            root_agent=LlmAgent(name="bot", model=llm),
+            events_compaction_config=EventsCompactionConfig(
+                compaction_interval=interval, overlap_size=overlap, summarizer=summarizer
+            ),
+        )
+        sessions = CopyOnWriteSessionService()
+        session = await sessions.create_session(app_name="bench", user_id="u1")
+        windows = []
+        summarize = summarizer.maybe_summarize_events
+
+        async def recording(*, events, **kwargs):
+            windows.append(events)
+            return await summarize(events=events, **kwargs)
+
+        summarizer.maybe_summarize_events = recording
+        started = time.perf_counter()
+        for turn in range(turns):
+            invocation = f"inv-{turn}"
+            for author, role, text in (
+                ("user", "user", f"Question {turn}: " + "details " * 40),
+                ("bot", "model", f"Answer {turn}: " + "explanation " * 60),
+            ):
+                await sessions.append_event(session, Event(
+                    invocation_id=invocation, author=author, timestamp=1_700_000_000 + 2 * turn + (role == "model"),
+                    content=types.Content(role=role, parts=[types.Part(text=text)]),
+                ))
+            await _run_compaction_for_sliding_window(app, session, sessions)
+            if replay and windows and turn % 10 == 9:
+                # A replayed turn (e.g. a retry after the compaction event failed to save): same window again.
+                await summarize(events=windows[-1])
+        return time.perf_counter() - started
+
+    print(f"📊 Summarizer input over a {turns}-turn session (compaction every {interval} invocations)")
+    modes = (
+        ("full history (re-summarize all)", lambda llm: LlmEventSummarizer(llm=llm), 10 ** 6, False),
+        ("sliding window, overlap 1", lambda llm: LlmEventSummarizer(llm=llm), 1, False),
+        ("sliding window + replays", lambda llm: LlmEventSummarizer(llm=llm), 1, True),
+        ("rolling, full-history window", lambda llm: RollingEventsSummarizer(llm=llm), 10 ** 6, False),
+        ("rolling, overlap 1", lambda llm: RollingEventsSummarizer(llm=llm), 1, False),
+        ("rolling + replays", lambda llm: RollingEventsSummarizer(llm=llm), 1, True),
+    )
+    for name, factory, overlap, replay in modes:
+        llm = CountingLlm(model="summarizer", prompt_chars=[])
+        summarizer = factory(llm)
+        await run(summarizer, llm, overlap, replay)
+        tokens = [chars // 4 for chars in llm.prompt_chars]
+        print(f"   {name:32} {len(tokens):4} calls  {sum(tokens):>11,} input tokens  "
+              f"mean {sum(tokens) / len(tokens):7,.0f}  last {tokens[-1]:7,}")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
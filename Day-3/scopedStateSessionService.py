@@ -0,0 +1,274 @@
+import os
+import asyncio
+import copy
+import json
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+
+from google.adk.sessions import DatabaseSessionService, Session
+from google.adk.sessions.state import State
+
+from deltaStateSessionService import DeltaStateSessionService
+
+# Scope-partitioned state loading
+
+# Why: get_session merges every app:, user: and session key into session.state, although an agent
+# usually reads two or three of them. A large app: state (a catalog, a config tree) shared by all
+# sessions is re-read and decoded on every turn of every session.
+# What this does:
+    # Builds on DeltaStateSessionService: state_entries is keyed by (app, scope, user, session, key),
+    #   so a scope or a key prefix of a scope is one index range scan
+    # Tools declare what they read with @requires_state("user:name", "app:catalog.*"), agents with
+    #   declare(app_name, ...) or declare_agent(app_name, agent), which collects the tools' declarations
+    # get_session loads the session scope plus the declared app:/user: keys only. session.state is a
+    #   LazyState: any other key is fetched on first access (and remembered, found or not)
+    # temp: keys are never queried - ADK strips them before events or state reach the store
+    # Apps with nothing declared load everything, exactly like DeltaStateSessionService
+
+_MISSING = object()
+_PREFIX_END = "\U0010ffff"  # sorts after any UTF-8 key, so [prefix, prefix + end) is a prefix range
+
+
+def requires_state(*patterns: str) -> Callable:
+    """Declares the state keys a tool function reads.
+
+    Args:
+        patterns: "user:name" (one key), "app:catalog.*" (a key prefix) or "user:" (a whole scope).
+    """
+    def decorate(func: Callable) -> Callable:
+        func.required_state = tuple(patterns)
+        return func
+    return decorate
+
+
+class LazyState(dict):
+    """Session state dict that fetches keys it was not loaded with on first access."""
+
+    def __init__(self, data: Dict[str, Any], loader: Callable[[str], Any]):
+        super().__init__(data)
+        self._loader = loader
+        self._missing: Set[str] = set()
+
+    def _fetch(self, key: str) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        if key in self._missing or not isinstance(key, str):
+            return False
+        value = self._loader(key)
+        if value is _MISSING:
+            self._missing.add(key)
+            return False
+        dict.__setitem__(self, key, value)
+        return True
+
+    def __contains__(self, key: object) -> bool:
+        return self._fetch(key)
+
+    def __getitem__(self, key: str) -> Any:
+        if not self._fetch(key):
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return dict.__getitem__(self, key) if self._fetch(key) else default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._missing.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def update(self, *args, **kwargs) -> None:
+        other = dict(*args, **kwargs)
+        self._missing.difference_update(other)
+        dict.update(self, other)
+
+    def __copy__(self) -> "LazyState":
+        clone = LazyState(self, self._loader)
+        clone._missing = set(self._missing)
+        return clone
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "LazyState":
+        # The loader (a closure over the service) is shared, never copied.
+        clone = LazyState(copy.deepcopy(dict(self), memo), self._loader)
+        clone._missing = set(self._missing)
+        return clone
+
+
+def _parse(pattern: str) -> Optional[Tuple[str, str, bool]]:
+    """'app:catalog.*' -> ('app', 'catalog.', True). Session keys are always loaded, so they give None."""
+    for scope, prefix in (("app", State.APP_PREFIX), ("user", State.USER_PREFIX)):
+        if pattern.startswith(prefix):
+            key = pattern[len(prefix):]
+            if key.endswith("*"):
+                return scope, key[:-1], True
+            return scope, key, key == ""
+    return None
+
+
+class ScopedStateSessionService(DeltaStateSessionService):
+    """DeltaStateSessionService that loads declared app:/user: keys eagerly and the rest on demand."""
+
+    def __init__(self, db_url: str, preload: Optional[Dict[str, Sequence[str]]] = None, **kwargs: Any):
+        """
+        Args:
+            db_url: SQLAlchemy database URL.
+            preload: app_name -> key patterns loaded with every session (see requires_state).
+            **kwargs: Passed to DeltaStateSessionService.
+        """
+        super().__init__(db_url, **kwargs)
+        self._preload: Dict[str, Set[Tuple[str, str, bool]]] = {}
+        for app_name, patterns in (preload or {}).items():
+            self.declare(app_name, *patterns)
+        self.rows_loaded = 0
+        self.lazy_fetches = 0
+
+    def declare(self, app_name: str, *patterns: str) -> None:
+        """Adds key patterns that get_session loads eagerly for an app."""
+        parsed = self._preload.setdefault(app_name, set())
+        parsed.update(spec for spec in map(_parse, patterns) if spec)
+
+    def declare_agent(self, app_name: str, agent) -> None:
+        """Declares the required_state of every tool of an agent and its sub-agents."""
+        for tool in getattr(agent, "tools", None) or ():
+            func = getattr(tool, "func", tool)
+            self.declare(app_name, *getattr(func, "required_state", ()))
+        for sub_agent in getattr(agent, "sub_agents", None) or ():
+            self.declare_agent(app_name, sub_agent)
+
+    # ------------------------------------------------------------------ reads
+
+    def _load_key(self, app_name: str, user_id: str, key: str) -> Any:
+        spec = _parse(key)
+        if spec is None:
+            return _MISSING  # session scope is always fully loaded; temp: never reaches the store
+        self.flush()
+        scope, name, _ = spec
+        with self.db_engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT value FROM state_entries WHERE app_name = :app_name AND scope = :scope"
+                     " AND user_id = :user_id AND session_id = '' AND key = :key"),
+                {"app_name": app_name, "scope": scope, "user_id": user_id if scope == "user" else "", "key": name},
+            ).first()
+        self.lazy_fetches += 1
+        if row is None:
+            return _MISSING
+        return json.loads(row[0]) if row[0] is not None else None
+
+    def _overlay(self, sessions: List[Session]) -> None:
+        if not sessions:
+            return
+        app_name = sessions[0].app_name
+        specs = self._preload.get(app_name)
+        if not specs:
+            super()._overlay(sessions)
+            return
+
+        rows: List[Tuple[str, str, str, str, Any]] = []
+        with self.db_engine.connect() as conn:
+            def scan(scope: str, user_id: str, session_id: str, key: str, is_prefix: bool) -> None:
+                condition = "key >= :key AND key < :end" if is_prefix else "key = :key"
+                result = conn.execute(
+                    text("SELECT scope, user_id, session_id, key, value FROM state_entries"
+                         " WHERE app_name = :app_name AND scope = :scope AND user_id = :user_id"
+                         f" AND session_id = :session_id AND {condition}"),
+                    {"app_name": app_name, "scope": scope, "user_id": user_id, "session_id": session_id,
+                     "key": key, "end": key + _PREFIX_END},
+                ).all()
+                rows.extend(result)
+
+            for scope, key, is_prefix in specs:
+                if scope == "app":
+                    scan("app", "", "", key, is_prefix)
+            for user_id in {session.user_id for session in sessions}:
+                for scope, key, is_prefix in specs:
+                    if scope == "user":
+                        scan("user", user_id, "", key, is_prefix)
+            for session in sessions:
+                scan("session", session.user_id, session.id, "", True)
+        self.rows_loaded += len(rows)
+
+        by_session = {(session.user_id, session.id): session for session in sessions}
+        for session in sessions:
+            loader = (lambda user_id: lambda key: self._load_key(app_name, user_id, key))(session.user_id)
+            session.state = LazyState(session.state, loader)
+        for scope, user_id, session_id, key, value in rows:
+            value = json.loads(value) if value is not None else None
+            if scope == "app":
+                for session in sessions:
+                    dict.__setitem__(session.state, State.APP_PREFIX + key, value)
+            elif scope == "user":
+                for session in sessions:
+                    if session.user_id == user_id:
+                        dict.__setitem__(session.state, State.USER_PREFIX + key, value)
+            else:
+                session = by_session.get((user_id, session_id))
+                if session is not None:
+                    dict.__setitem__(session.state, key, value)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**super().metrics(), "rows_loaded": self.rows_loaded, "lazy_fetches": self.lazy_fetches}
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(catalog_keys: int = 10_000, users: int = 20, sessions_per_user: int = 5, lazy_every: int = 10):
+    """get_session latency with a large shared app: state, for stock, delta and scoped loading."""
+
+    @requires_state("app:currency", "user:name")
+    def quote_price(tool_context, sku: str) -> Dict[str, Any]:
+        """Reads two declared keys on every call; the catalog entry only when asked."""
+        state = tool_context.state
+        return {"currency": state.get("app:currency"), "name": state.get("user:name"),
+                "price": state.get(f"app:catalog.{sku}")}
+
+    app_state = {f"app:catalog.sku{i:05d}": {"title": f"Item {i}", "price": i % 97 + 0.99, "stock": i % 13}
+                 for i in range(catalog_keys)}
+    app_state["app:currency"] = "EUR"
+
+    class _ToolContext:
+        def __init__(self, session: Session):
+            self.state = State(value=session.state, delta={})
+
+    async def run(service: DatabaseSessionService) -> float:
+        sessions = []
+        for u in range(users):
+            for s in range(sessions_per_user):
+                state = {"user:name": f"user {u}", **{f"user:pref_{i}": i for i in range(20)}}
+                if not sessions:
+                    state.update(app_state)
+                sessions.append(await service.create_session(app_name="shop", user_id=f"u{u}", state=state))
+        if isinstance(service, ScopedStateSessionService):
+            service.rows_loaded = service.lazy_fetches = 0
+        started = time.perf_counter()
+        for i, session in enumerate(sessions):
+            loaded = await service.get_session(app_name="shop", user_id=session.user_id, session_id=session.id)
+            result = quote_price(_ToolContext(loaded), f"sku{i:05d}" if i % lazy_every == 0 else "none")
+            assert result["currency"] == "EUR" and result["name"] == f"user {i // sessions_per_user}"
+            assert (result["price"] is not None) == (i % lazy_every == 0)
+        return (time.perf_counter() - started) / len(sessions)
+
+    total = users * sessions_per_user
+    print(f"📊 get_session + tool call over {total} sessions, app: state of {catalog_keys:,} catalog keys "
+          f"(1 in {lazy_every} calls reads one catalog entry)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (
+            ("DatabaseSessionService", DatabaseSessionService),
+            ("DeltaStateSessionService", DeltaStateSessionService),
+            ("ScopedStateSessionService", ScopedStateSessionService),
+        ):
+            service = factory(f"sqlite:///{os.path.join(tmp, name + '.db')}")
+            if isinstance(service, ScopedStateSessionService):
+                service.declare("shop", *quote_price.required_state)
+            per_session = await run(service)
+            extra = ""
+            if isinstance(service, ScopedStateSessionService):
+                metrics = service.metrics()
+                extra = f"  rows loaded/session {metrics['rows_loaded'] / total:.1f}, lazy fetches {metrics['lazy_fetches']}"
+            print(f"   {name:28} {per_session * 1000:8.2f} ms/session{extra}")
+            service.db_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -15,6 +15,9 @@ from google.adk.runners import Runner
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
+from cowSessionService import CopyOnWriteSessionService
+from scopedStateSessionService import requires_state
+
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -105,6 +108,7 @@ def save_info(tool_context: ToolContext, user_name: str, country: str) -> Dict[s
 
     return {"status": "success"}
 
+@requires_state("user: name", "user: country")
 def retrieve_user_info(tool_context: ToolContext) -> Dict[str, Any]:
     """ 
         Tool to retrieve and return username and country from session state
@@ -128,7 +132,11 @@ root_agent = LlmAgent(
     tools = [save_info, retrieve_user_info]
 )
 
-session_service = InMemorySessionService()
+# get_session is called every turn - avoid deep-copying the whole history each time
+session_service = CopyOnWriteSessionService()
+# With a database, load only the state keys the tools declare (the rest on first access):
+# session_service = ScopedStateSessionService(db_url="sqlite:///session_state.db")
+# session_service.declare_agent(APP_NAME, root_agent)
 
 runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
 
@@ -0,0 +1,334 @@
+import os
+import asyncio
+import bisect
+import hashlib
+import json
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, DatabaseSessionService, InMemorySessionService, Session
+from google.adk.sessions import _session_util
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.database_session_service import StorageAppState
+from google.adk.sessions.state import State
+
+# User-sharded session storage
+
+# Why: with one SQLite file every writer waits on the same database lock.
+# What this does:
+    # (app_name, user_id) is routed with a consistent-hash ring to one of N shards
+    #   (each shard is any BaseSessionService, usually a DatabaseSessionService on its own file)
+    # A user's sessions and user: state always live on the same shard
+    # app: state deltas are merged into every shard's app_states row so all shards agree on app state
+    # list_sessions for all users is a scatter-gather over the shards
+    # rebalance_sqlite_shards() moves users offline when the number of shards changes
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes."""
+
+    def __init__(self, shard_names: List[str], vnodes: int = 128):
+        """
+        Args:
+            shard_names: Stable shard names. Changing a name moves its users.
+            vnodes: Virtual nodes per shard (more = more even spread).
+        """
+        if not shard_names:
+            raise ValueError("HashRing needs at least one shard")
+        points = sorted(
+            (self._hash(f"{name}#{i}"), name) for name in shard_names for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def route(self, app_name: str, user_id: str) -> str:
+        """Returns the shard name that owns (app_name, user_id)."""
+        index = bisect.bisect(self._points, self._hash(f"{app_name}/{user_id}"))
+        return self._names[index % len(self._names)]
+
+
+def _shard_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class ShardedSessionService(BaseSessionService):
+    """Routes every call to the shard owning the (app_name, user_id) pair."""
+
+    # Placeholder user used to write app: state on shards whose app state is not reachable directly
+    APP_STATE_USER = "__app_state__"
+
+    def __init__(self, shards: Dict[str, BaseSessionService], vnodes: int = 128):
+        """
+        Args:
+            shards: Shard name -> session service. Names must stay stable across restarts.
+            vnodes: Virtual nodes per shard on the hash ring.
+        """
+        self.shards = shards
+        self.ring = HashRing(list(shards.keys()), vnodes=vnodes)
+
+    @classmethod
+    def from_sqlite_files(cls, paths: List[str], **kwargs: Any) -> "ShardedSessionService":
+        """Creates one DatabaseSessionService per SQLite file, named after the file."""
+        return cls(
+            {_shard_name(path): DatabaseSessionService(db_url=f"sqlite:///{path}") for path in paths},
+            **kwargs,
+        )
+
+    def shard_for(self, app_name: str, user_id: str) -> BaseSessionService:
+        return self.shards[self.ring.route(app_name, user_id)]
+
+    async def _broadcast_app_state(self, app_name: str, owner: str, app_delta: Dict[str, Any]) -> None:
+        """Merges app: state into every shard except the owner."""
+        delta = _session_util.extract_state_delta(app_delta)["app"]
+
+        async def apply(service: BaseSessionService) -> None:
+            if isinstance(service, DatabaseSessionService):
+                # Same update DatabaseSessionService.append_event makes to the app_states row.
+                with service.database_session_factory() as sql_session:
+                    storage_app_state = sql_session.get(StorageAppState, (app_name))
+                    if storage_app_state is None:
+                        sql_session.add(StorageAppState(app_name=app_name, state=delta))
+                    else:
+                        storage_app_state.state = storage_app_state.state | delta
+                    sql_session.commit()
+            elif isinstance(service, InMemorySessionService):
+                service.app_state.setdefault(app_name, {}).update(delta)
+            else:
+                # No direct access to app state: a throwaway session carries the delta.
+                placeholder = await service.create_session(
+                    app_name=app_name, user_id=self.APP_STATE_USER, state=app_delta
+                )
+                await service.delete_session(
+                    app_name=app_name, user_id=self.APP_STATE_USER, session_id=placeholder.id
+                )
+
+        await asyncio.gather(
+            *(apply(service) for name, service in self.shards.items() if name != owner)
+        )
+
+    @staticmethod
+    def _app_delta(state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {key: value for key, value in (state or {}).items() if key.startswith(State.APP_PREFIX)}
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        owner = self.ring.route(app_name, user_id)
+        session = await self.shards[owner].create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        app_delta = self._app_delta(state)
+        if app_delta and len(self.shards) > 1:
+            await self._broadcast_app_state(app_name, owner, app_delta)
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        return await self.shard_for(app_name, user_id).get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        if user_id is not None:
+            return await self.shard_for(app_name, user_id).list_sessions(
+                app_name=app_name, user_id=user_id
+            )
+
+        # Scatter-gather: every shard holds a disjoint set of users.
+        responses = await asyncio.gather(
+            *(service.list_sessions(app_name=app_name) for service in self.shards.values())
+        )
+        sessions = [
+            session
+            for response in responses
+            for session in response.sessions
+            if session.user_id != self.APP_STATE_USER
+        ]
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self.shard_for(app_name, user_id).delete_session(
+            app_name=app_name, user_id=user_id, session_id=session_id
+        )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        owner = self.ring.route(session.app_name, session.user_id)
+        event = await self.shards[owner].append_event(session, event)
+        if not event.partial and event.actions and event.actions.state_delta:
+            app_delta = self._app_delta(event.actions.state_delta)
+            if app_delta and len(self.shards) > 1:
+                await self._broadcast_app_state(session.app_name, owner, app_delta)
+        return event
+
+
+# ---------------------------------------------------------------------- offline rebalance
+
+def rebalance_sqlite_shards(old_paths: List[str], new_paths: List[str], vnodes: int = 128) -> Dict[str, int]:
+    """Moves users between SQLite shard files after the shard count changed.
+
+    Run it while no process is serving traffic. Rows are copied as-is (sessions, events,
+    user state), so event ids, timestamps and pickled actions are preserved. App state is
+    merged key by key across all shards (the most recently updated row wins a key) and written
+    to every new shard. Shard files that are not in `new_paths` are left empty.
+
+    Args:
+        old_paths: Shard files currently in use.
+        new_paths: Shard files to use from now on (may overlap with old_paths).
+        vnodes: Must match the value used by ShardedSessionService.
+
+    Returns:
+        Dict[str, int]: Number of users and sessions moved.
+    """
+    for path in new_paths:
+        DatabaseSessionService(db_url=f"sqlite:///{path}")  # creates the schema if missing
+
+    new_ring = HashRing([_shard_name(path) for path in new_paths], vnodes=vnodes)
+    new_by_name = {_shard_name(path): path for path in new_paths}
+    moved = {"users": 0, "sessions": 0}
+
+    # App state from all shards merged key by key, oldest row first so newer values win
+    rows: List[Tuple[str, str, str]] = []
+    for path in dict.fromkeys(old_paths + new_paths):
+        with sqlite3.connect(path) as conn:
+            rows.extend(conn.execute("SELECT app_name, state, update_time FROM app_states"))
+    app_states: Dict[str, Tuple[Dict[str, Any], str]] = {}
+    for app_name, state, update_time in sorted(rows, key=lambda row: row[2]):
+        merged, _ = app_states.get(app_name, ({}, update_time))
+        app_states[app_name] = ({**merged, **json.loads(state or "{}")}, update_time)
+
+    for path in old_paths:
+        source_name = _shard_name(path)
+        conn = sqlite3.connect(path)
+        try:
+            users = conn.execute(
+                "SELECT DISTINCT app_name, user_id FROM sessions "
+                "UNION SELECT app_name, user_id FROM user_states"
+            ).fetchall()
+            for app_name, user_id in users:
+                if user_id == ShardedSessionService.APP_STATE_USER:
+                    continue
+                target_name = new_ring.route(app_name, user_id)
+                if target_name == source_name:
+                    continue
+                conn.execute("ATTACH DATABASE ? AS target", (new_by_name[target_name],))
+                try:
+                    with conn:
+                        key = (app_name, user_id)
+                        conn.execute(
+                            "INSERT OR REPLACE INTO target.user_states "
+                            "SELECT * FROM main.user_states WHERE app_name = ? AND user_id = ?", key)
+                        moved["sessions"] += conn.execute(
+                            "INSERT OR REPLACE INTO target.sessions "
+                            "SELECT * FROM main.sessions WHERE app_name = ? AND user_id = ?", key).rowcount
+                        conn.execute(
+                            "INSERT OR REPLACE INTO target.events "
+                            "SELECT * FROM main.events WHERE app_name = ? AND user_id = ?", key)
+                        for table in ("events", "sessions", "user_states"):
+                            conn.execute(
+                                f"DELETE FROM main.{table} WHERE app_name = ? AND user_id = ?", key)
+                    moved["users"] += 1
+                finally:
+                    conn.execute("DETACH DATABASE target")
+        finally:
+            conn.close()
+
+    for path in new_paths:
+        with sqlite3.connect(path) as conn:
+            for app_name, (state, update_time) in app_states.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO app_states (app_name, state, update_time) VALUES (?, ?, ?)",
+                    (app_name, json.dumps(state), update_time),
+                )
+    return moved
+
+
+# ---------------------------------------------------------------------- benchmark
+
+def _bench_writer(paths: List[str], user_id: str, session_id: str, events: int, start: Any) -> Tuple[float, float]:
+    """One worker process appending events to its own session.
+
+    Returns:
+        Tuple[float, float]: Wall-clock start and end of the appends (engine setup is not included).
+    """
+    from google.genai import types
+
+    async def write() -> Tuple[float, float]:
+        service = ShardedSessionService.from_sqlite_files(paths)
+        session = await service.get_session(app_name="bench", user_id=user_id, session_id=session_id)
+        start.wait()  # every writer has its engines ready
+        started = time.time()
+        for i in range(events):
+            event = Event(
+                invocation_id=f"inv-{i}",
+                author="user",
+                content=types.Content(role="user", parts=[types.Part(text=f"message {i}")]),
+            )
+            await service.append_event(session, event)
+        return started, time.time()
+
+    return asyncio.run(write())
+
+
+def benchmark(shard_counts: Tuple[int, ...] = (1, 2, 4, 8), writers: int = 8, events_per_writer: int = 100):
+    """Measures append_event throughput with concurrent writer processes for different shard counts.
+
+    Each writer is a separate process with its own ShardedSessionService, like several server
+    workers sharing the same shard files. Scaling is bounded by the number of CPU cores. The
+    writers build their engines first and then start together, so only the appends are timed.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import Manager
+
+    print(f"📊 {writers} writer processes x {events_per_writer} events each ({os.cpu_count()} CPU cores)")
+    baseline = None
+    for shards in shard_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"sessions_{i}.db") for i in range(shards)]
+            service = ShardedSessionService.from_sqlite_files(paths)
+
+            # Sessions are created up front: only the append path is measured.
+            sessions = [
+                asyncio.run(service.create_session(app_name="bench", user_id=f"user-{w}"))
+                for w in range(writers)
+            ]
+
+            with Manager() as manager, ProcessPoolExecutor(max_workers=writers) as pool:
+                start = manager.Barrier(writers, timeout=120)
+                futures = [
+                    pool.submit(_bench_writer, paths, session.user_id, session.id, events_per_writer, start)
+                    for session in sessions
+                ]
+                errors = [future.exception() for future in futures if future.exception()]
+                spans = [future.result() for future in futures if not future.exception()]
+            elapsed = max(end for _, end in spans) - min(begin for begin, _ in spans)
+
+            throughput = len(spans) * events_per_writer / elapsed
+            baseline = baseline or throughput
+            print(
+                f"   {shards} shard(s): {throughput:8.1f} events/s "
+                f"(x{throughput / baseline:.2f}){f', {len(errors)} writer errors' if errors else ''}"
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,349 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.genai import types
+
+from bm25MemoryService import STOP_WORDS
+from incrementalMemory import SessionWatermarks
+
+# Durable memory on SQLite FTS5
+
+# Why: InMemoryMemoryService forgets everything on restart, and rebuilding it means loading every
+# session of persistent_session.db through DatabaseSessionService and re-ingesting it.
+# What this does:
+    # memories: one row per text event, unique per (app_name, user_id, event_id), so ingesting twice
+    #   is a no-op - also across restarts
+    # memories_fts: FTS5 index (porter stemming) kept in sync by triggers. Each row also carries a
+    #   `scope` token for its (app_name, user_id), so a search intersects the user's posting list
+    #   with the query terms instead of filtering every user's matches afterwards
+    # Ranking is FTS5's bm25(); results carry a snippet around the matched terms
+    # Inserts of a session are batched into one transaction (executemany)
+    # build_from_session_db() fills the index straight from a DatabaseSessionService file: the
+    #   source is ATTACHed read-only and copied with INSERT ... SELECT in rowid ranges, so event
+    #   JSON is unpacked inside SQLite and no session is ever loaded into Python
+# Opening is instant: there is nothing to load, the index is on disk.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    session_id TEXT,
+    event_id TEXT NOT NULL,
+    author TEXT,
+    role TEXT,
+    timestamp REAL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS memories_event ON memories (app_name, user_id, event_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    scope, text, content='memories', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+    INSERT INTO memories_fts (rowid, scope, text) VALUES (new.id, new.scope, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+    INSERT INTO memories_fts (memories_fts, rowid, scope, text) VALUES ('delete', old.id, old.scope, old.text);
+END;
+"""
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def scope_token(app_name: str, user_id: str) -> str:
+    """FTS token standing for one (app_name, user_id); hex only, so the tokenizer keeps it whole."""
+    return "s" + hashlib.sha1(f"{app_name}/{user_id}".encode("utf-8")).hexdigest()[:20]
+
+
+def _adk_timestamp(value: Optional[str]) -> Optional[float]:
+    # DatabaseSessionService stores naive local datetimes (datetime.fromtimestamp).
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def _match_expression(query: str) -> Optional[str]:
+    words = [word for word in _WORD_RE.findall(query.lower()) if len(word) > 1 and word not in STOP_WORDS]
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+
+
+class SqliteMemoryService(BaseMemoryService):
+    """Memory service persisted in a SQLite database with an FTS5 full-text index.
+
+    This class is thread-safe (one connection, guarded by a lock).
+    """
+
+    def __init__(self, db_path: str = "memory.db", top_k: int = 10, snippet_tokens: int = 32):
+        """
+        Args:
+            db_path: SQLite file holding the memories and their index.
+            top_k: Maximum number of memories returned per search.
+            snippet_tokens: Longer memories are returned as a snippet of this many tokens
+                around the matched terms.
+        """
+        self.db_path = db_path
+        self.top_k = top_k
+        self.snippet_tokens = snippet_tokens
+        self._lock = threading.Lock()
+        self._watermarks = SessionWatermarks()
+        # uri=True so build_from_session_db can ATTACH the source read-only ("file:...?mode=ro").
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, uri=True)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.create_function("adk_timestamp", 1, _adk_timestamp, deterministic=True)
+        self._db.create_function("scope_token", 2, scope_token, deterministic=True)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    # ------------------------------------------------------------------ ingestion
+
+    async def add_session_to_memory(self, session) -> None:
+        with self._lock:
+            scope = scope_token(session.app_name, session.user_id)
+            rows = []
+            for event in self._watermarks.new_events(session):
+                if not event.content or not event.content.parts:
+                    continue
+                text = " ".join(part.text for part in event.content.parts if part.text)
+                if text:
+                    rows.append((
+                        session.app_name, session.user_id, scope, session.id, event.id,
+                        event.author, event.content.role, event.timestamp, text,
+                    ))
+            if rows:
+                self._db.execute("BEGIN")
+                try:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO memories "
+                        "(app_name, user_id, scope, session_id, event_id, author, role, timestamp, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            self._watermarks.advance(session)
+
+    def build_from_session_db(
+        self,
+        session_db_path: str,
+        batch_size: int = 50_000,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> int:
+        """Indexes every text event of a DatabaseSessionService SQLite file.
+
+        Events are copied in rowid ranges of `batch_size`, one transaction each, so memory use
+        stays flat however large the source is. Already indexed events are skipped, so the build
+        can be re-run (or resumed after an interruption).
+
+        Args:
+            session_db_path: Path of the database written by DatabaseSessionService.
+            batch_size: Source rows per transaction.
+            progress: Optional callback called with (rows scanned, last source rowid).
+
+        Returns:
+            The number of memories added.
+        """
+        source = "file:" + os.path.abspath(session_db_path) + "?mode=ro"
+        with self._lock:
+            before = self._db.execute("SELECT count(*) FROM memories").fetchone()[0]
+            self._db.execute("ATTACH DATABASE ? AS src", (source,))
+            try:
+                last_rowid = self._db.execute("SELECT max(rowid) FROM src.events").fetchone()[0] or 0
+                for start in range(0, last_rowid, batch_size):
+                    self._db.execute("BEGIN")
+                    self._db.execute(
+                        """
+                        INSERT OR IGNORE INTO memories
+                            (app_name, user_id, scope, session_id, event_id, author, role, timestamp, text)
+                        SELECT * FROM (
+                            SELECT e.app_name, e.user_id, scope_token(e.app_name, e.user_id), e.session_id,
+                                   e.id, e.author, json_extract(e.content, '$.role'), adk_timestamp(e.timestamp),
+                                   (SELECT group_concat(json_extract(p.value, '$.text'), ' ')
+                                      FROM json_each(e.content, '$.parts') AS p
+                                     WHERE json_extract(p.value, '$.text') IS NOT NULL) AS text
+                              FROM src.events AS e
+                             WHERE e.rowid > ? AND e.rowid <= ?
+                               AND e.content IS NOT NULL AND NOT coalesce(e.partial, 0)
+                        ) WHERE text IS NOT NULL AND text != ''
+                        """,
+                        (start, start + batch_size),
+                    )
+                    self._db.execute("COMMIT")
+                    if progress is not None:
+                        progress(min(start + batch_size, last_rowid), last_rowid)
+            except BaseException:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                raise
+            finally:
+                self._db.execute("DETACH DATABASE src")
+            return self._db.execute("SELECT count(*) FROM memories").fetchone()[0] - before
+
+    # ------------------------------------------------------------------ search
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        expression = _match_expression(query)
+        if expression is None:
+            return SearchMemoryResponse()
+        match = f'scope:"{scope_token(app_name, user_id)}" AND text:({expression})'
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT snippet(memories_fts, 1, '', '', '…', ?), m.author, m.role, m.timestamp
+                  FROM memories_fts JOIN memories AS m ON m.id = memories_fts.rowid
+                 WHERE memories_fts MATCH ?
+                 ORDER BY bm25(memories_fts, 0.0, 1.0)
+                 LIMIT ?
+                """,
+                (self.snippet_tokens, match, self.top_k),
+            ).fetchall()
+        return SearchMemoryResponse(memories=[
+            MemoryEntry(
+                content=types.Content(role=role, parts=[types.Part(text=text)]),
+                author=author,
+                timestamp=datetime.fromtimestamp(timestamp).isoformat() if timestamp else None,
+            )
+            for text, author, role, timestamp in rows
+        ])
+
+    def count(self, app_name: Optional[str] = None, user_id: Optional[str] = None) -> int:
+        with self._lock:
+            if app_name is None:
+                return self._db.execute("SELECT count(*) FROM memories").fetchone()[0]
+            return self._db.execute(
+                "SELECT count(*) FROM memories WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchone()[0]
+
+
+# ---------------------------------------------------------------------- benchmark
+
+def _write_session_db(path: str, users: int, sessions_per_user: int, events_per_session: int) -> int:
+    """Creates a DatabaseSessionService file and fills its events table in the same row format."""
+    from google.adk.events import Event
+    from google.adk.sessions import DatabaseSessionService
+
+    async def template() -> None:
+        service = DatabaseSessionService(f"sqlite:///{path}")
+        session = await service.create_session(app_name="bench", user_id="template")
+        await service.append_event(session, Event(
+            author="user", invocation_id="i",
+            content=types.Content(role="user", parts=[types.Part(text="template")]),
+        ))
+        service.db_engine.dispose()
+
+    asyncio.run(template())
+    db = sqlite3.connect(path)
+    row = db.execute("SELECT actions FROM events LIMIT 1").fetchone()
+    actions = row[0]
+    rng = random.Random(5)
+    vocabulary = [f"word{i}" for i in range(20_000)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    now = datetime.now()
+    total = 0
+    for u in range(users):
+        session_rows, event_rows = [], []
+        for s in range(sessions_per_user):
+            session_id = f"u{u}-s{s}"
+            session_rows.append(("bench", f"user-{u}", session_id, "{}", now, now))
+            for i in range(events_per_session):
+                role = "user" if i % 2 == 0 else "model"
+                content = json.dumps({"parts": [{"text": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=12))}], "role": role})
+                event_rows.append((f"{session_id}-e{i}", "bench", f"user-{u}", session_id, "i",
+                                   "user" if role == "user" else "bot", actions, now.isoformat(" "), content))
+        db.executemany("INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", session_rows)
+        db.executemany("INSERT INTO events (id, app_name, user_id, session_id, invocation_id, author, actions, "
+                       "timestamp, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", event_rows)
+        total += len(event_rows)
+    db.commit()
+    db.close()
+    return total
+
+
+def benchmark(users: int = 100, sessions_per_user: int = 20, events_per_session: int = 100, queries: int = 200,
+              baseline_users: int = 5):
+    """Bulk-build throughput, reopen time and search latency, against re-ingesting through ADK."""
+    with tempfile.TemporaryDirectory(prefix="fts-memory-") as directory:
+        session_db = os.path.join(directory, "sessions.db")
+        memory_db = os.path.join(directory, "memory.db")
+
+        started = time.perf_counter()
+        events = _write_session_db(session_db, users, sessions_per_user, events_per_session)
+        print(f"📊 Source: {events:,} events in a DatabaseSessionService file "
+              f"({os.path.getsize(session_db) / 2**20:.0f} MiB, written in {time.perf_counter() - started:.1f}s)")
+
+        async def reingest() -> int:
+            from google.adk.memory import InMemoryMemoryService
+            from google.adk.sessions import DatabaseSessionService
+
+            sessions = DatabaseSessionService(f"sqlite:///{session_db}")
+            memory, count = InMemoryMemoryService(), 0
+            for u in range(baseline_users):
+                listed = await sessions.list_sessions(app_name="bench", user_id=f"user-{u}")
+                for item in listed.sessions:
+                    session = await sessions.get_session(app_name="bench", user_id=item.user_id, session_id=item.id)
+                    await memory.add_session_to_memory(session)
+                    count += len(session.events)
+            sessions.db_engine.dispose()
+            return count
+
+        started = time.perf_counter()
+        reingested = asyncio.run(reingest())
+        elapsed = time.perf_counter() - started
+        print(f"   re-ingest via DatabaseSessionService -> InMemoryMemoryService: "
+              f"{reingested / elapsed:,.0f} events/s ({baseline_users} users), "
+              f"~{events / (reingested / elapsed):.0f}s for the whole file at every start")
+
+        service = SqliteMemoryService(memory_db)
+        started = time.perf_counter()
+        added = service.build_from_session_db(session_db)
+        build = time.perf_counter() - started
+        service.close()
+        print(f"   bulk build: {added:,} memories in {build:.1f}s ({added / build:,.0f} events/s), "
+              f"index {os.path.getsize(memory_db) / 2**20:.0f} MiB")
+
+        started = time.perf_counter()
+        service = SqliteMemoryService(memory_db)
+        print(f"   reopen: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        rng = random.Random(9)
+        test_queries = [(f"user-{rng.randrange(users)}", f"word{rng.randrange(50, 5000)} word{rng.randrange(5000)}")
+                        for _ in range(queries)]
+
+        async def search_all() -> float:
+            started = time.perf_counter()
+            for user_id, query in test_queries:
+                await service.search_memory(app_name="bench", user_id=user_id, query=query)
+            return time.perf_counter() - started
+
+        print(f"   search: {asyncio.run(search_all()) / queries * 1000:.2f} ms/query "
+              f"({sessions_per_user * events_per_session:,} memories per user)")
+
+        started = time.perf_counter()
+        service.build_from_session_db(session_db)
+        print(f"   re-running the build (everything already indexed): {time.perf_counter() - started:.1f}s")
+        service.close()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.apps.base_events_summarizer import BaseEventsSummarizer
+from google.adk.events import Event
+from google.adk.plugins.base_plugin import BasePlugin
+from google.genai import types
+
+from tokenEstimator import SessionTokenCounter
+
+# Token-budget-driven, background events compaction
+
+# Why: EventsCompactionConfig(compaction_interval=3, overlap_size=1) compacts every N invocations,
+# whether the prompt is 300 or 30,000 tokens, and the summarization LLM call competes with the
+# next turn instead of being planned around it.
+# What this does (as a Runner plugin, so any App can use it):
+    # After a turn, the prompt the next turn would send is estimated: compaction summaries plus the
+    #   raw events after the last compacted range. Only when that exceeds max_prompt_tokens is a
+    #   compaction scheduled
+    # The oldest raw events are summarized, keeping about keep_recent_tokens of the most recent
+    #   turns raw (split at invocation boundaries, so a turn is never cut in half)
+    # The summary is produced by a background task. The turn has already returned to the user
+    # A finished summary is appended at the end of a turn, before the next user message: ADK's
+    #   contents processor drops every raw event listed before a summary and newer than its start,
+    #   so the kept window is appended again (as copies) after it. Until then turns use the raw window
+    # Token counts are kept per session by a SessionTokenCounter, so a turn only counts the events
+    #   appended since the previous one (the running window resets when a summary is appended)
+    # metrics(): compaction lag, prompt tokens before/after compaction, tokens saved per turn
+
+
+def estimate_event_tokens(event: Event) -> int:
+    """Rough token count of what an event adds to the prompt (~4 characters per token)."""
+    if event.actions and event.actions.compaction and event.actions.compaction.compacted_content:
+        content = event.actions.compaction.compacted_content
+    else:
+        content = event.content
+    if not content or not content.parts:
+        return 0
+    chars = 0
+    for part in content.parts:
+        if part.text:
+            chars += len(part.text)
+        elif part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        elif part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars // 4 + 1
+
+
+class _Job:
+    __slots__ = ("task", "scheduled_at", "compacted_ids", "tokens_before", "event", "ready_at")
+
+    def __init__(self, compacted_ids: set, tokens_before: int):
+        self.task: Optional[asyncio.Task] = None
+        self.scheduled_at = time.perf_counter()
+        self.compacted_ids = compacted_ids
+        self.tokens_before = tokens_before
+        self.event: Optional[Event] = None
+        self.ready_at: Optional[float] = None
+
+
+class TokenBudgetCompactionPlugin(BasePlugin):
+    """Compacts a session's history in the background once its prompt exceeds a token budget."""
+
+    def __init__(
+        self,
+        summarizer: BaseEventsSummarizer,
+        max_prompt_tokens: int = 8_000,
+        keep_recent_tokens: int = 2_000,
+        token_estimator: Callable[[Event], int] = estimate_event_tokens,
+        background: bool = True,
+        name: str = "token_budget_compaction",
+    ):
+        """
+        Args:
+            summarizer: Produces the compaction event (e.g. LlmEventSummarizer).
+            max_prompt_tokens: Estimated history size that triggers a compaction.
+            keep_recent_tokens: Roughly how much of the most recent history stays raw.
+            token_estimator: Token count of one event.
+            background: False summarizes inside the turn (blocking), for comparison.
+            name: Plugin name.
+        """
+        super().__init__(name=name)
+        if keep_recent_tokens >= max_prompt_tokens:
+            raise ValueError("keep_recent_tokens must be smaller than max_prompt_tokens")
+        self.summarizer = summarizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.token_estimator = token_estimator
+        self.counter = SessionTokenCounter(
+            token_estimator, is_copy=lambda event: bool((event.custom_metadata or {}).get(self._CARRIED)))
+        self.background = background
+        self._jobs: Dict[Tuple[str, str, str], _Job] = {}
+        self._lags: List[float] = []  # scheduled -> summary in the session
+        self._summarize_times: List[float] = []
+        self._turns: List[Tuple[int, int]] = []  # (raw history tokens, effective prompt tokens)
+        self.compactions = 0
+        self.failures = 0
+
+    # ------------------------------------------------------------------ window selection
+
+    # custom_metadata flag of kept events appended again after a summary. Every summary starts at
+    # the first raw event after the previous one, so the prompt is the summaries plus the events
+    # after the last one - what the SessionTokenCounter keeps track of.
+    _CARRIED = "compaction_carried"
+
+    def _split(self, window: List[Event]) -> List[Event]:
+        """Oldest part of the raw window to summarize; keeps ~keep_recent_tokens of whole invocations."""
+        kept, split = 0, len(window)
+        while split > 0 and kept < self.keep_recent_tokens:
+            split -= 1
+            kept += self.token_estimator(window[split])
+        # Move the split back to the first event of that invocation.
+        while 0 < split < len(window) and window[split - 1].invocation_id == window[split].invocation_id:
+            split -= 1
+        return window[:split]
+
+    # ------------------------------------------------------------------ plugin callbacks
+
+    @staticmethod
+    def _key(invocation_context: InvocationContext) -> Tuple[str, str, str]:
+        session = invocation_context.session
+        return (session.app_name, session.user_id, session.id)
+
+    async def _publish(self, invocation_context: InvocationContext, job: _Job) -> None:
+        """Appends the summary, then copies of the raw events after its range, so they stay in the prompt."""
+        session = invocation_context.session
+        window = self.counter.window(session)
+        kept = [event for event in window if event.id not in job.compacted_ids]
+        # Timestamps after everything already stored: DatabaseSessionService reloads events in
+        # timestamp order, and that order has to match the append order.
+        now = max(time.time(), session.events[-1].timestamp if session.events else 0.0)
+        job.event.timestamp = now
+        await invocation_context.session_service.append_event(session, job.event)
+        for offset, event in enumerate(kept, start=1):
+            carried = event.model_copy(deep=True, update={
+                "id": Event.new_id(),
+                "timestamp": now + offset * 1e-6,
+                "custom_metadata": {**(event.custom_metadata or {}), self._CARRIED: True},
+            })
+            await invocation_context.session_service.append_event(session, carried)
+        self._lags.append(time.perf_counter() - job.scheduled_at)
+        self.compactions += 1
+        del self._jobs[self._key(invocation_context)]
+
+    async def before_run_callback(self, *, invocation_context: InvocationContext) -> Optional[types.Content]:
+        session = invocation_context.session
+        self._turns.append((self.counter.history_tokens(session), self.counter.count(session)))
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        key = self._key(invocation_context)
+        job = self._jobs.get(key)
+        if job is not None:
+            # Ready: publish it before the next user message. Not ready: the next turn uses the raw window.
+            if job.event is not None:
+                await self._publish(invocation_context, job)
+            return  # one compaction per session at a time
+        effective_tokens = self.counter.count(invocation_context.session)
+        if effective_tokens <= self.max_prompt_tokens:
+            return
+        to_compact = self._split(self.counter.window(invocation_context.session))
+        if not to_compact:
+            return
+
+        job = self._jobs[key] = _Job({event.id for event in to_compact}, effective_tokens)
+        if self.background:
+            job.task = asyncio.get_running_loop().create_task(self._summarize(key, job, to_compact))
+            return
+        await self._summarize(key, job, to_compact)
+        if job.event is not None:
+            await self._publish(invocation_context, job)
+
+    async def _summarize(self, key: Tuple[str, str, str], job: _Job, events: List[Event]) -> None:
+        started = time.perf_counter()
+        try:
+            event = await self.summarizer.maybe_summarize_events(events=events)
+        except Exception as error:
+            logging.warning(f"[Compaction] Summarization failed for session {key[2]}: {error}")
+            event = None
+        self._summarize_times.append(time.perf_counter() - started)
+        if event is None:
+            self.failures += 1
+            self._jobs.pop(key, None)  # the next turn will try again
+            return
+        job.event = event
+        job.ready_at = time.perf_counter()
+
+    async def close(self) -> None:
+        """Waits for summaries still being produced (call before shutting down)."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, float]:
+        saved = [raw - effective for raw, effective in self._turns]
+        return {
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "pending": len(self._jobs),
+            "mean_lag_s": statistics.fmean(self._lags) if self._lags else 0.0,
+            "mean_summarize_s": statistics.fmean(self._summarize_times) if self._summarize_times else 0.0,
+            "mean_raw_tokens": statistics.fmean(raw for raw, _ in self._turns) if self._turns else 0.0,
+            "mean_prompt_tokens": statistics.fmean(e for _, e in self._turns) if self._turns else 0.0,
+            "mean_tokens_saved_per_turn": statistics.fmean(saved) if saved else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------- benchmark
+
+async def benchmark(turns: int = 40, model_latency: float = 0.2, summarize_latency: float = 1.0):
+    """Turn latency and prompt size with no compaction, inline compaction and background compaction.
+
+    The model and the summarizer are simulated with fixed latencies, so the numbers show the
+    scheduling effect only (no API key needed).
+    """
+    from google.adk.agents import LlmAgent
+    from google.adk.apps.app import App
+    from google.adk.apps.llm_event_summarizer import LlmEventSummarizer
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.llm_response import LlmResponse
+    from google.adk.runners import Runner
+
+    from cowSessionService import CopyOnWriteSessionService
+
+    class SimulatedLlm(BaseLlm):
+        latency: float = 0.2
+        reply: str = "Here is a detailed answer. " * 40
+        prompt_tokens: List[int] = []
+
+        async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+        ) -> AsyncGenerator[LlmResponse, None]:
+            chars = sum(len(part.text or "") for content in llm_request.contents for part in content.parts or [])
+            self.prompt_tokens.append(chars // 4)
+            await asyncio.sleep(self.latency)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=self.reply)]))
+
+    async def run(plugin: Optional[TokenBudgetCompactionPlugin]) -> Tuple[List[float], List[int]]:
+        model = SimulatedLlm(model="simulated", latency=model_latency, prompt_tokens=[])
+        agent = LlmAgent(name="text_chat_bot", model=model, instruction="Answer briefly.")
+        app = App(name="bench", root_agent=agent, plugins=[plugin] if plugin else [])
+        sessions = CopyOnWriteSessionService()
+        runner = Runner(app=app, session_service=sessions)
+        session = await sessions.create_session(app_name="bench", user_id="u1")
+        latencies = []
+        for turn in range(turns):
+            message = types.Content(role="user", parts=[types.Part(text=f"Question {turn}: " + "details " * 60)])
+            started = time.perf_counter()
+            async for _ in runner.run_async(user_id="u1", session_id=session.id, new_message=message):
+                pass
+            latencies.append(time.perf_counter() - started)
+        if plugin:
+            await plugin.close()
+        return latencies, model.prompt_tokens
+
+    def summarizer() -> LlmEventSummarizer:
+        llm = SimulatedLlm(model="summarizer", latency=summarize_latency, reply="Summary of earlier turns. " * 20, prompt_tokens=[])
+        return LlmEventSummarizer(llm=llm)
+
+    print(f"📊 {turns} turns, model {model_latency * 1000:.0f} ms, summarizer {summarize_latency * 1000:.0f} ms, "
+          f"budget 4,000 tokens (keep 1,500 raw)")
+    for name, plugin in (
+        ("no compaction", None),
+        ("inline compaction", TokenBudgetCompactionPlugin(summarizer(), 4_000, 1_500, background=False)),
+        ("background compaction", TokenBudgetCompactionPlugin(summarizer(), 4_000, 1_500)),
+    ):
+        latencies, prompt_tokens = await run(plugin)
+        line = (f"   {name:22} turn p50 {statistics.median(latencies) * 1000:6.0f} ms  "
+                f"max {max(latencies) * 1000:6.0f} ms  prompt {statistics.fmean(prompt_tokens):6.0f} tokens/call "
+                f"(last {prompt_tokens[-1]:,})")
+        if plugin:
+            stats = plugin.metrics()
+            line += (f"  compactions {stats['compactions']}, lag {stats['mean_lag_s'] * 1000:.0f} ms, "
+                     f"saved {stats['mean_tokens_saved_per_turn']:.0f} tokens/turn")
+        print(line)
+
+
+
+async def check_prompt_after_compaction(turns: int = 20, max_prompt_tokens: int = 2_000, keep_recent_tokens: int = 800):
+    """Regression check: after a compaction the LLM request still ends with the current question and
+    contains the summary and the kept window, with each kept event once. Raises AssertionError otherwise."""
+    from google.adk.agents import LlmAgent
+    from google.adk.apps.app import App
+    from google.adk.apps.llm_event_summarizer import LlmEventSummarizer
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.llm_response import LlmResponse
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+
+    from rollingSummarizer import RollingEventsSummarizer
+
+    class RecordingLlm(BaseLlm):
+        reply: str = "Answer. " * 60
+        requests: List[List[str]] = []
+
+        async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+        ) -> AsyncGenerator[LlmResponse, None]:
+            self.requests.append([" ".join(part.text or "" for part in content.parts or [])
+                                  for content in llm_request.contents])
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=self.reply)]))
+
+    for summarizer_class in (LlmEventSummarizer, RollingEventsSummarizer):
+        for background in (False, True):
+            summary_llm = RecordingLlm(model="summarizer", reply="SUMMARY", requests=[])
+            plugin = TokenBudgetCompactionPlugin(summarizer_class(llm=summary_llm), max_prompt_tokens,
+                                                 keep_recent_tokens, background=background)
+            model = RecordingLlm(model="recording", requests=[])
+            app = App(name="check", root_agent=LlmAgent(name="bot", model=model), plugins=[plugin])
+            sessions = InMemorySessionService()
+            runner = Runner(app=app, session_service=sessions)
+            session = await sessions.create_session(app_name="check", user_id="u1")
+            for turn in range(turns):
+                question = f"Q{turn}: " + "details " * 80
+                message = types.Content(role="user", parts=[types.Part(text=question)])
+                published = plugin.compactions
+                async for _ in runner.run_async(user_id="u1", session_id=session.id, new_message=message):
+                    pass
+                await asyncio.sleep(0)  # lets a background summary finish between turns
+                await plugin.close()
+                prompt = model.requests[-1]
+                name = f"{summarizer_class.__name__}, background={background}, turn {turn}"
+                assert prompt[-1] == question, f"{name}: current question missing"
+                if published:
+                    assert any("SUMMARY" in text for text in prompt), f"{name}: summary missing"
+                    assert any(text.startswith(f"Q{turn - 1}: ") for text in prompt), f"{name}: kept window missing"
+                    assert sum(text.startswith(f"Q{turn - 1}: ") for text in prompt) == 1, \
+                        f"{name}: kept event repeated"
+            assert plugin.compactions, f"{summarizer_class.__name__}: no compaction happened"
+            print(f"✅ {summarizer_class.__name__}, background={background}: {plugin.compactions} compactions, "
+                  f"last prompt {len(prompt)} contents")
+
+
+if __name__ == "__main__":
+    asyncio.run(check_prompt_after_compaction())
+    asyncio.run(benchmark())
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from google.adk.events import Event
+from google.genai import types
+
+from bm25MemoryService import STOP_WORDS
+
+# Local token estimator for prompt budgeting
+
+# Why: every prompt-size decision (when to compact, whether a google_search payload must be cut,
+# whether preload_memory output still fits) needs either a count_tokens round trip or a guess.
+# What this does:
+    # A text is reduced to a few counts: vocabulary words (one token each), other words and their
+    #   length (split into sub-word pieces), digits, punctuation, newlines, non-ASCII characters
+    # Tokens = features . weights. The weights start from sensible defaults and are calibrated with
+    #   ridge regression (pulled towards the defaults, so a handful of samples cannot wreck them)
+    #   against the Gemini usage_metadata DatabaseSessionService already stores in the events table:
+    #   a model event's text vs its candidates_token_count, and the growth of prompt_token_count
+    #   between two model calls vs the events added in between
+    # Features are cached per content hash (LRU), so re-counting a history costs a dict lookup per event
+    # The weights and learned vocabulary can be saved to / loaded from a JSON file
+    # SessionTokenCounter keeps a running total per session and only counts appended events; a
+    #   compaction event resets it to the summaries plus what follows the last one
+
+_PIECE_RE = re.compile(r"[A-Za-z]+|[0-9]+|\n|[^\sA-Za-z0-9]")
+
+FEATURES = ("vocab_words", "other_words", "other_word_chars", "digits", "symbols", "newlines", "non_ascii", "messages")
+DEFAULT_WEIGHTS = np.array([1.0, 1.0, 0.12, 1.0, 0.8, 0.3, 1.0, 0.0])
+
+
+def _to_tokens(values: np.ndarray) -> np.ndarray:
+    # Rounded first to 6 decimals, so a dot product and a matrix product agree on .5 boundaries.
+    return np.maximum(1, np.rint(np.round(values, 6))).astype(int)
+
+
+def _content_text(content: Optional[types.Content]) -> str:
+    if not content or not content.parts:
+        return ""
+    pieces = []
+    for part in content.parts:
+        if part.text:
+            pieces.append(part.text)
+        elif part.function_call:
+            pieces.append(f"{part.function_call.name}({json.dumps(part.function_call.args or {}, default=str)})")
+        elif part.function_response:
+            pieces.append(json.dumps(part.function_response.response or {}, default=str))
+    return "\n".join(pieces)
+
+
+def event_text(event: Event) -> str:
+    """What an event contributes to the prompt (the summary, for a compaction event)."""
+    if event.actions and event.actions.compaction and event.actions.compaction.compacted_content:
+        return _content_text(event.actions.compaction.compacted_content)
+    return _content_text(event.content)
+
+
+class TokenEstimator:
+    """Vocabulary-based token estimator with calibrated weights and a content-hash LRU cache."""
+
+    def __init__(
+        self,
+        weights: Optional[Sequence[float]] = None,
+        vocabulary: Optional[Iterable[str]] = None,
+        short_word_length: int = 6,
+        cache_size: int = 100_000,
+    ):
+        """
+        Args:
+            weights: One weight per entry of FEATURES (defaults to DEFAULT_WEIGHTS).
+            vocabulary: Lower-case words counted as a single token (on top of short words).
+            short_word_length: Words up to this length count as single tokens.
+            cache_size: Number of cached feature vectors.
+        """
+        self.weights = np.array(weights if weights is not None else DEFAULT_WEIGHTS, dtype=np.float64)
+        self.vocabulary: Set[str] = set(STOP_WORDS) | set(vocabulary or ())
+        self.short_word_length = short_word_length
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------ features
+
+    def _extract(self, text: str) -> np.ndarray:
+        vocab_words = other_words = other_chars = digits = symbols = newlines = non_ascii = 0
+        for piece in _PIECE_RE.findall(text):
+            first = piece[0]
+            if not first.isascii():
+                non_ascii += 1
+            elif first.isalpha():
+                if len(piece) <= self.short_word_length or piece.lower() in self.vocabulary:
+                    vocab_words += 1
+                else:
+                    other_words += 1
+                    other_chars += len(piece)
+            elif first.isdigit():
+                digits += len(piece)
+            elif first == "\n":
+                newlines += 1
+            else:
+                symbols += 1
+        return np.array(
+            [vocab_words, other_words, other_chars, digits, symbols, newlines, non_ascii, 1.0], dtype=np.float64
+        )
+
+    def features(self, text: str) -> np.ndarray:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        vector = self._extract(text)
+        self._cache[key] = vector
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    # ------------------------------------------------------------------ counting
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        return int(_to_tokens(self.features(text) @ self.weights))
+
+    def count_content(self, content: Optional[types.Content]) -> int:
+        return self.count_text(_content_text(content))
+
+    def count_event(self, event: Event) -> int:
+        return self.count_text(event_text(event))
+
+    def count_texts(self, texts: Sequence[str]) -> List[int]:
+        """Batch counting: one matrix product for all texts."""
+        texts = [text for text in texts if text]
+        if not texts:
+            return []
+        matrix = np.stack([self.features(text) for text in texts])
+        return _to_tokens(matrix @ self.weights).tolist()
+
+    def count_events(self, events: Iterable[Event]) -> int:
+        """Total tokens of a list of events (e.g. a whole session history)."""
+        return sum(self.count_texts([event_text(event) for event in events if not event.partial]))
+
+    # ------------------------------------------------------------------ calibration
+
+    def calibrate(
+        self, samples: Sequence[Tuple[Sequence[str], int]], ridge: float = 1.0, vocabulary_min_count: int = 3
+    ) -> Dict[str, float]:
+        """Fits the weights to recorded token counts.
+
+        Args:
+            samples: (texts, recorded tokens) pairs; the texts of a sample are counted together.
+            ridge: Strength of the pull towards the current weights.
+            vocabulary_min_count: Long words seen at least this often in the samples join the vocabulary.
+
+        Returns:
+            Mean absolute percentage error before and after calibration, and the sample count.
+        """
+        if not samples:
+            return {"samples": 0, "mape_before": 0.0, "mape_after": 0.0}
+        targets = np.array([tokens for _, tokens in samples], dtype=np.float64)
+        before = self._mape(samples, targets)
+
+        counts: Dict[str, int] = {}
+        for texts, _ in samples:
+            for text in texts:
+                for word in _PIECE_RE.findall(text):
+                    if word.isalpha() and len(word) > self.short_word_length:
+                        counts[word.lower()] = counts.get(word.lower(), 0) + 1
+        self.vocabulary.update(word for word, count in counts.items() if count >= vocabulary_min_count)
+        self._cache.clear()
+
+        matrix = np.stack([sum((self._extract(text) for text in texts), np.zeros(len(FEATURES))) for texts, _ in samples])
+        # Rows are scaled by 1 / target, so short messages weigh as much as long ones (relative error),
+        # and the fit is pulled towards the current weights: (X'X + rI) w = X'y + r w0
+        matrix, scaled_targets = matrix / targets[:, None], np.ones_like(targets)
+        lhs = matrix.T @ matrix + ridge * np.eye(len(FEATURES))
+        rhs = matrix.T @ scaled_targets + ridge * self.weights
+        self.weights = np.clip(np.linalg.solve(lhs, rhs), 0.0, None)
+        return {"samples": len(samples), "mape_before": before, "mape_after": self._mape(samples, targets)}
+
+    def _mape(self, samples: Sequence[Tuple[Sequence[str], int]], targets: np.ndarray) -> float:
+        predicted = np.array([sum(self.count_text(text) for text in texts) for texts, _ in samples], dtype=np.float64)
+        return float(np.mean(np.abs(predicted - targets) / np.maximum(targets, 1)))
+
+    @staticmethod
+    def samples_from_session_db(db_path: str) -> List[Tuple[List[str], int]]:
+        """Reads calibration samples from a DatabaseSessionService SQLite file (read-only, streamed)."""
+        db = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        samples: List[Tuple[List[str], int]] = []
+        try:
+            rows = db.execute(
+                "SELECT app_name, user_id, session_id, content, usage_metadata FROM events "
+                "WHERE NOT coalesce(partial, 0) ORDER BY app_name, user_id, session_id, timestamp"
+            )
+            current, previous_prompt, between = None, None, []
+            for app_name, user_id, session_id, content, usage in rows:
+                if (app_name, user_id, session_id) != current:
+                    current, previous_prompt, between = (app_name, user_id, session_id), None, []
+                text = _content_text(types.Content.model_validate(json.loads(content))) if content else ""
+                usage = json.loads(usage) if usage else None
+                if usage and usage.get("prompt_token_count") is not None:
+                    if text and usage.get("candidates_token_count"):
+                        samples.append(([text], usage["candidates_token_count"]))
+                    if previous_prompt is not None and between:
+                        # History growth between two model calls = the events added in between.
+                        samples.append((between, usage["prompt_token_count"] - previous_prompt))
+                    previous_prompt, between = usage["prompt_token_count"], []
+                if text:
+                    between.append(text)
+        finally:
+            db.close()
+        return [(texts, tokens) for texts, tokens in samples if tokens > 0]
+
+    def calibrate_from_session_db(self, db_path: str, **kwargs) -> Dict[str, float]:
+        return self.calibrate(self.samples_from_session_db(db_path), **kwargs)
+
+    # ------------------------------------------------------------------ persistence
+
+    def save(self, path: str) -> None:
+        long_words = sorted(word for word in self.vocabulary if word not in STOP_WORDS)
+        with open(path, "w") as f:
+            json.dump({"weights": self.weights.tolist(), "vocabulary": long_words,
+                       "short_word_length": self.short_word_length}, f)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "TokenEstimator":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(weights=data["weights"], vocabulary=data["vocabulary"],
+                   short_word_length=data["short_word_length"], **kwargs)
+
+    def cache_info(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class _Running:
+    __slots__ = ("seen", "last_id", "history", "summaries", "window", "window_start")
+
+    def __init__(self):
+        self.seen = 0  # events already counted
+        self.last_id = ""  # id of the last counted event, to notice a rewritten history
+        self.history = 0  # every raw event (copies excluded)
+        self.summaries = 0  # compaction summaries
+        self.window = 0  # raw events after the last summary
+        self.window_start = 0  # index of the first event after the last summary
+
+
+class SessionTokenCounter:
+    """Running token counts per session; only events appended since the last call are counted.
+
+    A compaction event resets the running window: its summary stands in for the events before it,
+    so the prompt estimate becomes the summaries so far plus the events appended after the last one.
+    """
+
+    def __init__(self, count_event: Callable[[Event], int], is_copy: Optional[Callable[[Event], bool]] = None):
+        """
+        Args:
+            count_event: Token count of one event (e.g. TokenEstimator.count_event).
+            is_copy: Marks events that repeat earlier history; they are left out of history_tokens().
+        """
+        self.count_event = count_event
+        self.is_copy = is_copy
+        self._sessions: Dict[Tuple[str, str, str], _Running] = {}
+
+    def _update(self, session) -> _Running:
+        key = (session.app_name, session.user_id, session.id)
+        events = session.events
+        running = self._sessions.get(key)
+        if running is None or not (0 < running.seen <= len(events) and events[running.seen - 1].id == running.last_id):
+            running = self._sessions[key] = _Running()  # new session, or the history was rewritten
+        for index in range(running.seen, len(events)):
+            event = events[index]
+            if event.partial:
+                continue
+            compaction = event.actions.compaction if event.actions else None
+            if compaction:
+                if compaction.start_timestamp is not None and compaction.end_timestamp is not None:
+                    running.summaries += self.count_event(event)
+                    running.window, running.window_start = 0, index + 1
+                continue
+            tokens = self.count_event(event)
+            running.window += tokens
+            if self.is_copy is None or not self.is_copy(event):
+                running.history += tokens
+        if events:
+            running.seen, running.last_id = len(events), events[-1].id
+        return running
+
+    def count(self, session) -> int:
+        """Estimated prompt tokens: the compaction summaries plus the raw events after the last one."""
+        running = self._update(session)
+        return running.summaries + running.window
+
+    def history_tokens(self, session) -> int:
+        """Tokens of the whole raw history, as if nothing had been compacted."""
+        return self._update(session).history
+
+    def window(self, session) -> List[Event]:
+        """The raw events after the last compaction summary."""
+        start = self._update(session).window_start
+        return [event for event in session.events[start:]
+                if not event.partial and not (event.actions and event.actions.compaction)]
+
+    def forget(self, app_name: str, user_id: str, session_id: str) -> None:
+        self._sessions.pop((app_name, user_id, session_id), None)
+
+
+# ---------------------------------------------------------------------- benchmark
+
+def benchmark(db_path: str = "persistent_session.db", texts: int = 100_000, session_events: int = 500):
+    """Accuracy against recorded usage_metadata, and counting speed (cold, cached, batch, incremental)."""
+    if os.path.exists(db_path):
+        samples = TokenEstimator.samples_from_session_db(db_path)
+        targets = np.array([tokens for _, tokens in samples], dtype=np.float64)
+        naive = np.array([sum(len(t) // 4 + 1 for t in texts_) for texts_, _ in samples], dtype=np.float64)
+        estimator = TokenEstimator()
+        result = estimator.calibrate(samples)
+        print(f"📊 Accuracy on {len(samples)} recorded usage samples from {db_path}")
+        print(f"   chars/4:              MAPE {np.mean(np.abs(naive - targets) / targets):6.1%}")
+        print(f"   estimator (defaults): MAPE {result['mape_before']:6.1%}")
+        print(f"   estimator (calibrated, in-sample): MAPE {result['mape_after']:6.1%}")
+        if len(samples) >= 10:
+            # Held-out check: calibrate on 80%, measure on the rest.
+            rng = random.Random(0)
+            shuffled = samples[:]
+            rng.shuffle(shuffled)
+            cut = int(len(shuffled) * 0.8)
+            held_out = TokenEstimator()
+            held_out.calibrate(shuffled[:cut])
+            test_targets = np.array([tokens for _, tokens in shuffled[cut:]], dtype=np.float64)
+            print(f"   estimator (calibrated, held-out 20%): MAPE {held_out._mape(shuffled[cut:], test_targets):6.1%}")
+    else:
+        print(f"📊 {db_path} not found - skipping the accuracy check")
+
+    rng = random.Random(1)
+    words = ["the", "capital", "of", "Washington", "D.C.", "42", "session", "memory", "compaction", "user",
+             "🙂", "naïve", "internationalization", "\n", "{", "}", ":", "https://example.com/a?b=c", "2025-11-10"]
+    corpus = [" ".join(rng.choices(words, k=rng.randint(5, 200))) for _ in range(texts)]
+    estimator = TokenEstimator()
+
+    started = time.perf_counter()
+    for text in corpus:
+        estimator.count_text(text)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in corpus:
+        estimator.count_text(text)
+    cached = time.perf_counter() - started
+    started = time.perf_counter()
+    estimator.count_texts(corpus)
+    batch = time.perf_counter() - started
+    print(f"📊 Counting speed ({texts:,} texts, avg {sum(map(len, corpus)) / texts:.0f} chars)")
+    print(f"   cold: {cold / texts * 1e6:6.1f} µs/text   cached: {cached / texts * 1e6:5.1f} µs/text   "
+          f"batch (cached): {batch / texts * 1e6:5.1f} µs/text")
+
+    from google.adk.events.event_actions import EventActions, EventCompaction
+    from google.adk.sessions import Session
+
+    session = Session(id="s1", app_name="bench", user_id="u1")
+    full_counter = TokenEstimator(cache_size=0)
+    incremental = SessionTokenCounter(TokenEstimator(cache_size=0).count_event)
+    full_time = incremental_time = 0.0
+    for i in range(session_events):
+        session.events.append(Event(author="user", content=types.Content(
+            role="user", parts=[types.Part(text=corpus[i])])))
+        started = time.perf_counter()
+        full = full_counter.count_events(session.events)
+        full_time += time.perf_counter() - started
+        started = time.perf_counter()
+        running = incremental.count(session)
+        incremental_time += time.perf_counter() - started
+        assert full == running
+    print(f"📊 Recounting a session after every append ({session_events:,} events, no cache)")
+    print(f"   full recount: {full_time:6.2f}s   incremental: {incremental_time:6.3f}s")
+
+    summary = types.Content(role="model", parts=[types.Part(text="Summary of the conversation so far.")])
+    session.events.append(Event(author="user", actions=EventActions(compaction=EventCompaction(
+        start_timestamp=session.events[0].timestamp, end_timestamp=session.events[-1].timestamp,
+        compacted_content=summary))))
+    assert incremental.count(session) == full_counter.count_content(summary)
+    assert incremental.history_tokens(session) == full
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:2])